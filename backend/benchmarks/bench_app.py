@@ -0,0 +1,45 @@
+'''
+The real FastAPI app wired to local stand-ins, for load tests:
+    - S3: moto in-process, unless S3_ENDPOINT_URL points at a MinIO-like server
+    - Claude/Groq: whatever CLAUDE_BASE_URL / GROQ_BASE_URL point at (normally benchmarks/fake_llm_server.py)
+    - Supabase: benchmarks.fake_db.InMemoryDB, seeded with FAKE_DB_SEED_IMAGES images
+
+benchmarks/load_test.py starts this with uvicorn in a subprocess; to run it by hand, from the backend directory:
+    uvicorn benchmarks.bench_app:app --port 8100
+'''
+import os
+
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+os.environ.setdefault('AWS_REGION', 'us-east-1')
+os.environ.setdefault('S3_BUCKET', 'quakesafe-benchmark')
+os.environ.setdefault('SUPABASE_URL', 'http://127.0.0.1:9')
+os.environ.setdefault('SUPABASE_KEY', 'benchmark')
+os.environ.setdefault('CLAUDE_API_KEY', 'benchmark')
+os.environ.setdefault('GROQ_API_KEY', 'benchmark')
+# Every load-test client shares one address, so per-client rate limits would throttle the whole run;
+# concurrency caps and load shedding stay at their defaults
+for traffic_class in ('GUIDANCE', 'READ', 'UPLOAD'):
+    os.environ.setdefault(f'ADMISSION_{traffic_class}_RATE', '1000000')
+    os.environ.setdefault(f'ADMISSION_{traffic_class}_BURST', '1000000')
+
+if not os.getenv('S3_ENDPOINT_URL'):
+    import boto3
+    from moto import mock_aws
+
+    # Started before main creates its S3 client so every call is intercepted
+    _aws = mock_aws()
+    _aws.start()
+    boto3.client('s3', region_name=os.environ['AWS_REGION']).create_bucket(Bucket=os.environ['S3_BUCKET'])
+
+import main
+from benchmarks.fake_db import InMemoryDB
+
+db = InMemoryDB(
+    latency_ms=float(os.getenv('FAKE_DB_LATENCY_MS', '5')),
+    jitter_ms=float(os.getenv('FAKE_DB_JITTER_MS', '2')),
+)
+db.seed(int(os.getenv('FAKE_DB_SEED_IMAGES', '1000')))
+db.install(main)
+
+app = main.app
@@ -0,0 +1,65 @@
+'''
+Compares the per-image cost of the old /analyze re-encode (full-resolution decode, JPEG quality 90)
+with imaging.normalize.normalize_image (draft decode, EXIF transpose, downscale, thumbnails).
+
+Usage, from the backend directory:
+    python -m benchmarks.bench_preprocess                 # synthetic 12MP phone photo
+    python -m benchmarks.bench_preprocess photo1.jpg ...  # your own images
+'''
+import io
+import sys
+import time
+import statistics
+from PIL import Image
+from imaging.normalize import normalize_image
+
+ROUNDS = 10
+
+
+def legacy_reencode(contents: bytes) -> bytes:
+    '''The pipeline /analyze used before preprocessing was added.'''
+    image = Image.open(io.BytesIO(contents))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=90)
+    return output.getvalue()
+
+
+def synthetic_photo(width: int = 4032, height: int = 3024) -> bytes:
+    '''Builds a detailed 12MP JPEG, roughly what a phone camera uploads.'''
+    image = Image.effect_mandelbrot((width, height), (-2.0, -1.2, 1.0, 1.2), 64).convert('RGB')
+    noise = Image.effect_noise((width, height), 40).convert('RGB')
+    image = Image.blend(image, noise, 0.3)
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=92)
+    return output.getvalue()
+
+
+def measure(func, contents: bytes) -> tuple[list[float], int]:
+    timings = []
+    size = 0
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        result = func(contents)
+        timings.append((time.perf_counter() - start) * 1000)
+        size = len(result) if isinstance(result, bytes) else len(result['jpeg']) + sum(len(r) for r in result['renditions'].values())
+    return timings, size
+
+
+def report(label: str, timings: list[float], size: int) -> None:
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{label:<12} median {statistics.median(timings):8.1f} ms   p95 {p95:8.1f} ms   output {size / 1024:8.1f} KiB")
+
+
+def main(paths: list[str]) -> None:
+    inputs = [(path, open(path, 'rb').read()) for path in paths] or [('synthetic 12MP', synthetic_photo())]
+    for name, contents in inputs:
+        print(f"\n{name}: {len(contents) / 1024:.1f} KiB input, {ROUNDS} rounds")
+        report('before', *measure(legacy_reencode, contents))
+        report('after', *measure(normalize_image, contents))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,140 @@
+'''
+Runs rescore.py end to end against the fake model server, moto S3 and the in-memory DB, and reports throughput.
+
+For each concurrency level the whole seeded backlog is re-scored from a fresh checkpoint. The first level is
+stopped halfway and resumed, to check that a resumed run neither skips nor repeats images. After every run each
+image must have exactly one more assessment than before it.
+
+Usage, from the backend directory:
+    python -m benchmarks.bench_rescore                                   # 1000 images at concurrency 1, 8 and 32
+    python -m benchmarks.bench_rescore --images 5000 --concurrency 16 64 --llm-latency-ms 800
+    python -m benchmarks.bench_rescore --json rescore.json
+    python -m benchmarks.bench_rescore --baseline rescore.json           # exit 1 if images/s dropped by >20%
+'''
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from collections import Counter
+import httpx
+from benchmarks.load_test import free_port
+
+
+def assessment_counts(db) -> Counter:
+    return Counter(row['image_id'] for row in db.assessments.values())
+
+
+def check_one_new_version(db, before: Counter) -> None:
+    after = assessment_counts(db)
+    wrong = [image_id for image_id in db.images if after[image_id] != before[image_id] + 1]
+    if wrong:
+        raise RuntimeError(f"{len(wrong)} images did not get exactly one new assessment, e.g. {wrong[0]}")
+
+
+async def main_async(args) -> int:
+    workdir = tempfile.TemporaryDirectory(prefix='quakesafe-rescore-')
+    llm_port = free_port()
+    llm = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'benchmarks.fake_llm_server:app', '--port', str(llm_port), '--log-level', 'warning'],
+        env={**os.environ, 'FAKE_LLM_LATENCY_MS': str(args.llm_latency_ms), 'FAKE_LLM_JITTER_MS': str(args.llm_latency_ms / 4)},
+    )
+    llm_url = f"http://127.0.0.1:{llm_port}"
+    os.environ.update({
+        'CLAUDE_BASE_URL': llm_url,
+        'GROQ_BASE_URL': llm_url,
+        'JOB_DB_PATH': os.path.join(workdir.name, 'jobs.sqlite3'),
+        'FAKE_DB_SEED_IMAGES': str(args.images),
+        'FAKE_DB_LATENCY_MS': str(args.db_latency_ms),
+        'FAKE_DB_JITTER_MS': '0',
+    })
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    try:
+        async with httpx.AsyncClient() as client:
+            for _ in range(300):
+                try:
+                    await client.get(f"{llm_url}/docs")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+
+        # Imported here so rescore picks up the environment above; bench_app sets up moto and the DB first
+        from benchmarks.bench_app import db
+        import rescore
+
+        db.install(rescore)
+        for image in db.images.values():
+            image['image_url'] = rescore.s3_storage.public_url(f"{image['id']}.jpg")
+
+        results = {}
+        for index, concurrency in enumerate(args.concurrency):
+            checkpoint_path = os.path.join(workdir.name, f"checkpoint-{concurrency}.json")
+            before = assessment_counts(db)
+            start = time.perf_counter()
+            if index == 0:
+                half = max(1, args.images // args.chunk_size // 2)
+                partial = await rescore.rescore(None, checkpoint_path, args.chunk_size, concurrency, 0, max_chunks=half)
+                if partial['completed_at']:
+                    raise RuntimeError("The interrupted run should not have completed")
+            checkpoint = await rescore.rescore(None, checkpoint_path, args.chunk_size, concurrency, 0)
+            seconds = time.perf_counter() - start
+            check_one_new_version(db, before)
+            if checkpoint['failed']:
+                raise RuntimeError(f"{checkpoint['failed']} images failed at concurrency {concurrency}")
+            results[f"concurrency_{concurrency}"] = {
+                'images': checkpoint['scored'],
+                'seconds': round(seconds, 2),
+                'images_per_second': round(checkpoint['scored'] / seconds, 1),
+                'resumed': index == 0,
+            }
+        await rescore.claude_provider.close()
+    finally:
+        llm.terminate()
+        llm.wait(timeout=10)
+        workdir.cleanup()
+
+    print(f"{args.images} images, chunks of {args.chunk_size}, model latency {args.llm_latency_ms} ms")
+    print(f"{'':<26} {'seconds':>9} {'images/s':>10}")
+    for name, stats in results.items():
+        label = f"{name} (resumed)" if stats['resumed'] else name
+        print(f"{label:<26} {stats['seconds']:>9} {stats['images_per_second']:>10}")
+
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = [
+            f"{name}: {baseline[name]['images_per_second']} -> {stats['images_per_second']} images/s"
+            for name, stats in results.items()
+            if name in baseline and stats['images_per_second'] < baseline[name]['images_per_second'] * (1 - args.tolerance)
+        ]
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--images', type=int, default=1000)
+    parser.add_argument('--chunk-size', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--llm-latency-ms', type=float, default=50)
+    parser.add_argument('--db-latency-ms', type=float, default=5)
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='results file from an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression (default 0.2 = 20%%)')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main_async(parse_args())))
@@ -0,0 +1,151 @@
+'''
+Measures cold-start cost: how long `import main` takes, how long serve.py needs to answer its first request
+(/healthz), and the latency of the first /chat once it is up (which pays for any client not yet warmed up).
+Each run is a fresh process with no Supabase (connection refused) and the fake model server, so only
+the app's own import and startup work is measured.
+
+Usage, from the backend directory:
+    python -m benchmarks.bench_startup                      # 5 runs of each
+    python -m benchmarks.bench_startup --runs 10 --json startup.json
+    python -m benchmarks.bench_startup --baseline startup.json   # exit 1 if a median regressed by >20%
+    python -X importtime -c "import main" 2> imports.txt    # to see where import time goes
+'''
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+import httpx
+from benchmarks.load_test import free_port
+
+APP_ENV = {
+    'SUPABASE_URL': 'http://127.0.0.1:9',
+    'SUPABASE_KEY': 'benchmark',
+    'AWS_ACCESS_KEY_ID': 'benchmark',
+    'AWS_SECRET_ACCESS_KEY': 'benchmark',
+    'AWS_REGION': 'us-east-1',
+    'S3_BUCKET': 'quakesafe-benchmark',
+    'CLAUDE_API_KEY': 'benchmark',
+    'GROQ_API_KEY': 'benchmark',
+    'LOG_LEVEL': 'ERROR',
+}
+
+
+def measure_import(env: dict) -> float:
+    '''Seconds a fresh interpreter spends in `import main`.'''
+    code = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+async def measure_serve(env: dict, port: int) -> dict:
+    '''Starts serve.py and times the first /healthz answer, then the first /chat after it.'''
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, 'serve.py', '--host', '127.0.0.1', '--port', str(port), '--no-access-log'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=30) as client:
+            while True:
+                try:
+                    if (await client.get('/healthz')).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if process.poll() is not None:
+                    raise RuntimeError(f"serve.py exited with code {process.returncode}")
+                await asyncio.sleep(0.01)
+            ready = time.perf_counter() - start
+
+            chat_start = time.perf_counter()
+            response = await client.post('/chat', json={'user_id': 'startup-benchmark', 'prompt': 'What should I do during an earthquake?'})
+            first_chat = time.perf_counter() - chat_start
+            if response.status_code != 200:
+                raise RuntimeError(f"/chat answered {response.status_code}: {response.text}")
+        return {'time_to_first_request_s': ready, 'first_chat_s': first_chat}
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def summarize(samples: list[float]) -> dict:
+    return {
+        'median_ms': round(statistics.median(samples) * 1000, 1),
+        'min_ms': round(min(samples) * 1000, 1),
+        'max_ms': round(max(samples) * 1000, 1),
+    }
+
+
+async def main_async(args) -> int:
+    workdir = tempfile.TemporaryDirectory(prefix='quakesafe-startup-')
+    llm_port = free_port()
+    llm = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'benchmarks.fake_llm_server:app', '--port', str(llm_port), '--log-level', 'warning'],
+        env={**os.environ, 'FAKE_LLM_LATENCY_MS': '0', 'FAKE_LLM_JITTER_MS': '0'},
+    )
+    llm_url = f"http://127.0.0.1:{llm_port}"
+    env = {**os.environ, **APP_ENV, 'CLAUDE_BASE_URL': llm_url, 'GROQ_BASE_URL': llm_url,
+           'JOB_DB_PATH': os.path.join(workdir.name, 'jobs.sqlite3'),
+           'SEMANTIC_CACHE_PATH': os.path.join(workdir.name, 'chat_cache')}
+
+    try:
+        async with httpx.AsyncClient() as client:
+            for _ in range(300):
+                try:
+                    await client.get(f"{llm_url}/docs")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+
+        imports, ready, first_chat = [], [], []
+        for _ in range(args.runs):
+            imports.append(measure_import(env))
+            serve = await measure_serve(env, free_port())
+            ready.append(serve['time_to_first_request_s'])
+            first_chat.append(serve['first_chat_s'])
+    finally:
+        llm.terminate()
+        llm.wait(timeout=10)
+        workdir.cleanup()
+
+    results = {'import_main': summarize(imports), 'time_to_first_request': summarize(ready), 'first_chat': summarize(first_chat)}
+    print(f"{'':<24} {'median ms':>10} {'min ms':>10} {'max ms':>10}")
+    for name, stats in results.items():
+        print(f"{name:<24} {stats['median_ms']:>10} {stats['min_ms']:>10} {stats['max_ms']:>10}")
+
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = [
+            f"{name}: {baseline[name]['median_ms']} -> {stats['median_ms']} ms"
+            for name, stats in results.items()
+            if name in baseline and stats['median_ms'] > baseline[name]['median_ms'] * (1 + args.tolerance)
+        ]
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='results file from an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression (default 0.2 = 20%%)')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main_async(parse_args())))
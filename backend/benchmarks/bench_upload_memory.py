@@ -0,0 +1,98 @@
+'''
+Measures peak worker RSS while /analyze handles concurrent 12MP uploads.
+S3 and the job queue are replaced with in-process no-ops so only the upload path is measured;
+no AWS, Supabase or model credentials are needed.
+
+Usage, from the backend directory:
+    python -m benchmarks.bench_upload_memory [concurrency ...]    # default: 1 4 8
+'''
+import os
+import sys
+import time
+import asyncio
+import threading
+import httpx
+
+os.environ.setdefault('JOB_DB_PATH', ':memory:')
+
+import main
+from benchmarks.bench_preprocess import synthetic_photo
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+def current_rss() -> int:
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * PAGE_SIZE
+
+
+class RSSSampler:
+    '''Polls the process RSS on a background thread and keeps the maximum seen.'''
+
+    def __init__(self, interval: float = 0.002):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, current_rss())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+async def fake_upload_many(uploads: dict, content_type: str = 'image/jpeg') -> list[str]:
+    for fileobj in uploads.values():
+        while fileobj.read(1024 * 1024):
+            pass
+    return list(uploads)
+
+
+async def fake_submit(kind: str, payload: dict) -> str:
+    return 'benchmark-job'
+
+
+async def run(concurrency: int, photo: bytes) -> None:
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        async def upload():
+            response = await client.post(
+                '/analyze',
+                files={'file': ('photo.jpg', photo, 'image/jpeg')},
+                data={'user_id': 'benchmark', 'latitude': '37.33', 'longitude': '-121.89'},
+            )
+            response.raise_for_status()
+
+        await upload()  # warm up executors and import-time caches
+        baseline = current_rss()
+        start = time.perf_counter()
+        with RSSSampler() as sampler:
+            await asyncio.gather(*(upload() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    growth = max(0, sampler.peak - baseline)
+    print(f"concurrency {concurrency:>3}: peak RSS {sampler.peak / 2**20:7.1f} MiB, "
+          f"+{growth / 2**20:6.1f} MiB over baseline ({growth / concurrency / 2**20:5.1f} MiB/request), "
+          f"{elapsed * 1000 / concurrency:6.1f} ms/request")
+
+
+def main_cli(levels: list[int]) -> None:
+    main.s3_storage.upload_many = fake_upload_many
+    main.job_pool.submit = fake_submit
+    photo = synthetic_photo()
+    print(f"upload size {len(photo) / 2**20:.1f} MiB")
+    for concurrency in levels:
+        asyncio.run(run(concurrency, photo))
+
+
+if __name__ == '__main__':
+    main_cli([int(level) for level in sys.argv[1:]] or [1, 4, 8])
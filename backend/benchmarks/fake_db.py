@@ -0,0 +1,198 @@
+'''
+In-memory stand-in for the helpers in db/async_supabase_client.py, for load tests without Supabase.
+Signatures and return shapes match the real helpers, inserts still call db.invalidation.notify_write,
+and every call can be given a simulated round-trip latency.
+'''
+import uuid
+import random
+import asyncio
+from datetime import datetime, timezone
+from db.invalidation import notify_write
+
+# Names main.py and rescore.py import from db.async_supabase_client, all replaced by install()
+HELPERS = (
+    'insert_image_entry', 'insert_safety_assessment', 'fetch_all_images', 'get_image_by_id',
+    'get_safety_assessment_by_image', 'insert_chat_message', 'insert_emergency_action', 'fetch_images_page',
+    'fetch_assessments_page', 'get_images_with_latest_assessment', 'insert_safety_assessments',
+    'delete_image_entry', 'record_analysis',
+    'get_images_by_user', 'get_safety_assessments_by_user', 'get_chat_messages_by_user', 'get_emergency_actions_by_user',
+)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _project(row: dict, columns: str) -> dict:
+    if columns == '*':
+        return dict(row)
+    return {column: row.get(column) for column in (name.strip() for name in columns.split(','))}
+
+
+class InMemoryDB:
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.images: dict[str, dict] = {}
+        self.assessments: dict[str, dict] = {}
+        self.chat_messages: list[dict] = []
+        self.emergency_actions: list[dict] = []
+
+    async def _round_trip(self) -> None:
+        delay = max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+        await asyncio.sleep(delay)
+
+    def seed(self, count: int, center: tuple = (37.3382, -121.8863), spread: float = 0.2) -> None:
+        '''Adds `count` images with one assessment each, scattered around `center`.'''
+        for index in range(count):
+            image_id = str(uuid.uuid4())
+            self.images[image_id] = {
+                'id': image_id,
+                'user_id': f"seed-user-{index % 50}",
+                'image_url': f"https://example.invalid/{image_id}.jpg",
+                'latitude': center[0] + random.uniform(-spread, spread),
+                'longitude': center[1] + random.uniform(-spread, spread),
+                'location_name': f"Seed location {index}",
+                'created_at': _now(),
+            }
+            self._add_assessment(image_id, random.randint(20, 95), str(round(random.uniform(5.0, 8.0), 1)), 'Seeded assessment')
+
+    def _add_assessment(self, image_id: str, safety_score, magnitude: str, description: str) -> dict:
+        row = {
+            'id': str(uuid.uuid4()),
+            'image_id': image_id,
+            'safety_score': safety_score,
+            'estimated_magnitude_survivability': magnitude,
+            'description': description,
+            'created_at': _now(),
+        }
+        self.assessments[row['id']] = row
+        return row
+
+    def _latest_assessment(self, image_id: str) -> dict | None:
+        rows = [row for row in self.assessments.values() if row['image_id'] == image_id]
+        return max(rows, key=lambda row: row['created_at']) if rows else None
+
+    async def insert_image_entry(self, supabase, user_id: str, image_url: str, longitude: float, latitude: float, location_name: str = None,
+                                 image_id: str = None):
+        await self._round_trip()
+        image_id = image_id or str(uuid.uuid4())
+        if image_id in self.images:
+            return None
+        self.images[image_id] = {'id': image_id, 'user_id': user_id, 'image_url': image_url, 'longitude': longitude,
+                                 'latitude': latitude, 'location_name': location_name, 'created_at': _now()}
+        notify_write('images', [image_id])
+        notify_write('activity', [user_id])
+        return image_id
+
+    async def insert_safety_assessment(self, supabase, image_id: str, safety_score, estimated_magnitude_survivability: str, description: str):
+        await self._round_trip()
+        row = self._add_assessment(image_id, safety_score, estimated_magnitude_survivability, description)
+        notify_write('safety_assessments', [image_id])
+        return [row]
+
+    async def insert_safety_assessments(self, supabase, rows: list[dict]):
+        await self._round_trip()
+        inserted = [self._add_assessment(row['image_id'], row['safety_score'], row['estimated_magnitude_survivability'], row['description'])
+                    for row in rows]
+        notify_write('safety_assessments', [row['image_id'] for row in rows])
+        return inserted
+
+    async def delete_image_entry(self, supabase, image_id: str):
+        await self._round_trip()
+        self.images.pop(image_id, None)
+        notify_write('images', [image_id])
+        return True
+
+    async def record_analysis(self, supabase, image_id: str, user_id: str, image_url: str, longitude: float, latitude: float,
+                              location_name: str, safety_score, estimated_magnitude_survivability: str, description: str,
+                              action_taken: str):
+        '''One round-trip, like the record_analysis RPC, including its replay of an already recorded image id.'''
+        await self._round_trip()
+        if image_id in self.images:
+            return {'image_id': image_id, 'safety_assessment': self._latest_assessment(image_id), 'replayed': True}
+        self.images[image_id] = {'id': image_id, 'user_id': user_id, 'image_url': image_url, 'longitude': longitude,
+                                 'latitude': latitude, 'location_name': location_name, 'created_at': _now()}
+        assessment = self._add_assessment(image_id, safety_score, estimated_magnitude_survivability, description)
+        self.emergency_actions.append({'id': str(uuid.uuid4()), 'user_id': user_id, 'action_taken': action_taken, 'timestamp': _now()})
+        notify_write('images', [image_id])
+        notify_write('safety_assessments', [image_id])
+        notify_write('activity', [user_id])
+        return {'image_id': image_id, 'safety_assessment': assessment, 'replayed': False}
+
+    async def insert_emergency_action(self, supabase, user_id: str, action_taken: str):
+        await self._round_trip()
+        row = {'id': str(uuid.uuid4()), 'user_id': user_id, 'action_taken': action_taken, 'timestamp': _now()}
+        self.emergency_actions.append(row)
+        notify_write('activity', [user_id])
+        return [row]
+
+    async def insert_chat_message(self, supabase, user_id: str, user_message: str, ai_response: str, chat_context: str, timestamp: str = None):
+        await self._round_trip()
+        row = {'id': str(uuid.uuid4()), 'user_id': user_id, 'user_message': user_message, 'ai_response': ai_response,
+               'chat_context': chat_context, 'timestamp': timestamp or _now()}
+        self.chat_messages.append(row)
+        notify_write('activity', [user_id])
+        return [row]
+
+    async def fetch_all_images(self, supabase):
+        await self._round_trip()
+        return [dict(row) for row in self.images.values()]
+
+    async def get_image_by_id(self, supabase, image_id: str):
+        await self._round_trip()
+        row = self.images.get(image_id)
+        return dict(row) if row else None
+
+    async def get_safety_assessment_by_image(self, supabase, image_id: str):
+        await self._round_trip()
+        return [dict(row) for row in self.assessments.values() if row['image_id'] == image_id]
+
+    async def get_images_with_latest_assessment(self, supabase, image_ids: list[str]):
+        await self._round_trip()
+        rows = []
+        for image_id in image_ids:
+            image = self.images.get(image_id)
+            if image is not None:
+                latest = self._latest_assessment(image_id)
+                rows.append({**image, 'safety_assessments': [latest] if latest else []})
+        return rows
+
+    async def fetch_images_page(self, supabase, columns: str = '*', after_id: str = None, limit: int = 1000):
+        await self._round_trip()
+        ids = sorted(image_id for image_id in self.images if after_id is None or image_id > after_id)[:limit]
+        return [_project(self.images[image_id], columns) for image_id in ids]
+
+    async def fetch_assessments_page(self, supabase, columns: str = '*', after_id: str = None, limit: int = 1000):
+        await self._round_trip()
+        ids = sorted(row_id for row_id in self.assessments if after_id is None or row_id > after_id)[:limit]
+        return [_project(self.assessments[row_id], columns) for row_id in ids]
+
+    async def _user_page(self, rows, time_column: str, columns: str, before: tuple, limit: int):
+        await self._round_trip()
+        ordered = sorted(rows, key=lambda row: (row[time_column], str(row['id'])), reverse=True)
+        if before is not None:
+            ordered = [row for row in ordered if (row[time_column], str(row['id'])) < (before[0], str(before[1]))]
+        return [_project(row, columns) for row in ordered[:limit]]
+
+    async def get_images_by_user(self, supabase, user_id: str, columns: str = '*', before: tuple = None, limit: int = None):
+        rows = [row for row in self.images.values() if row['user_id'] == user_id]
+        return await self._user_page(rows, 'created_at', columns, before, limit)
+
+    async def get_safety_assessments_by_user(self, supabase, user_id: str, columns: str = '*', before: tuple = None, limit: int = None):
+        rows = [row for row in self.assessments.values() if self.images.get(row['image_id'], {}).get('user_id') == user_id]
+        return await self._user_page(rows, 'created_at', columns, before, limit)
+
+    async def get_chat_messages_by_user(self, supabase, user_id: str, columns: str = '*', before: tuple = None, limit: int = None):
+        rows = [row for row in self.chat_messages if row['user_id'] == user_id]
+        return await self._user_page(rows, 'timestamp', columns, before, limit)
+
+    async def get_emergency_actions_by_user(self, supabase, user_id: str, columns: str = '*', before: tuple = None, limit: int = None):
+        rows = [row for row in self.emergency_actions if row['user_id'] == user_id]
+        return await self._user_page(rows, 'timestamp', columns, before, limit)
+
+    def install(self, module) -> None:
+        '''Rebinds the DB helper names `module` (normally main) imported to this store's methods.'''
+        for name in HELPERS:
+            if hasattr(module, name):
+                setattr(module, name, getattr(self, name))
@@ -0,0 +1,109 @@
+'''
+Local stand-in for the Claude and Groq HTTP APIs, for exercising the provider layer without real keys.
+
+Run from the backend directory:
+    uvicorn benchmarks.fake_llm_server:app --port 9100
+then start the backend with CLAUDE_BASE_URL=http://127.0.0.1:9100 GROQ_BASE_URL=http://127.0.0.1:9100
+
+Behaviour is tuned with environment variables:
+    FAKE_LLM_LATENCY_MS   mean response latency (default 200)
+    FAKE_LLM_JITTER_MS    uniform +/- jitter around the mean (default 50)
+    FAKE_LLM_ERROR_RATE   fraction of requests answered with a 529/503 overload error (default 0)
+'''
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LATENCY_MS = float(os.getenv('FAKE_LLM_LATENCY_MS', '200'))
+JITTER_MS = float(os.getenv('FAKE_LLM_JITTER_MS', '50'))
+ERROR_RATE = float(os.getenv('FAKE_LLM_ERROR_RATE', '0'))
+
+CLAUDE_TEXT = (
+    "Description: Secure loose facade panels; anchor rooftop equipment; keep exits clear of debris\n"
+    "Score: {score}\n"
+    "Magnitude Survivability: {magnitude}"
+)
+CHAT_TEXT = (
+    "Drop, cover and hold on until the shaking stops. Stay away from windows and heavy furniture. "
+    "Once it is safe, check yourself and others for injuries and be ready for aftershocks."
+    "\n\nTiming: {timing}"
+)
+
+app = FastAPI()
+
+
+async def simulate_latency() -> None:
+    delay = max(0.0, LATENCY_MS + random.uniform(-JITTER_MS, JITTER_MS)) / 1000
+    await asyncio.sleep(delay)
+
+
+def overloaded(status_code: int) -> JSONResponse | None:
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        return JSONResponse(status_code=status_code, content={'type': 'error', 'error': {'type': 'overloaded_error', 'message': 'Overloaded'}})
+    return None
+
+
+@app.post('/v1/messages')
+async def claude_messages(request: Request):
+    body = await request.json()
+    await simulate_latency()
+    if (error := overloaded(529)) is not None:
+        return error
+    text = CLAUDE_TEXT.format(score=random.randint(20, 95), magnitude=round(random.uniform(5.0, 8.0), 1))
+    return {
+        'id': f"msg_{uuid.uuid4().hex}",
+        'type': 'message',
+        'role': 'assistant',
+        'model': body.get('model'),
+        'content': [{'type': 'text', 'text': text}],
+        'stop_reason': 'end_turn',
+        'stop_sequence': None,
+        'usage': {'input_tokens': 1200, 'output_tokens': len(text.split())},
+    }
+
+
+def chat_chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+    chunk = {
+        'id': completion_id,
+        'object': 'chat.completion.chunk',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+@app.post('/openai/v1/chat/completions')
+async def groq_chat_completions(request: Request):
+    body = await request.json()
+    model = body.get('model')
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    text = CHAT_TEXT.format(timing=random.choice(['before', 'during', 'after']))
+
+    if body.get('stream'):
+        async def stream():
+            await simulate_latency()
+            yield chat_chunk(completion_id, model, {'role': 'assistant', 'content': ''})
+            for word in text.split(' '):
+                await asyncio.sleep(0.005)
+                yield chat_chunk(completion_id, model, {'content': word + ' '})
+            yield chat_chunk(completion_id, model, {}, finish_reason='stop')
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(stream(), media_type='text/event-stream')
+
+    await simulate_latency()
+    if (error := overloaded(503)) is not None:
+        return error
+    return {
+        'id': completion_id,
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': model,
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+        'usage': {'prompt_tokens': 80, 'completion_tokens': len(text.split()), 'total_tokens': 80 + len(text.split())},
+    }
@@ -0,0 +1,358 @@
+'''
+End-to-end load test of /analyze, /chat and the read endpoints against local stand-ins.
+Starts benchmarks/fake_llm_server.py and benchmarks/bench_app.py (the real app with moto S3 and an
+in-memory DB) as uvicorn subprocesses, drives closed-loop concurrent workloads over HTTP and reports
+throughput, latency percentiles and the app process's RSS. No AWS, Anthropic, Groq or Supabase access is needed.
+
+Usage, from the backend directory:
+    python -m benchmarks.load_test                                   # all scenarios, defaults below
+    python -m benchmarks.load_test --scenarios chat,images --concurrency 32 --duration 30
+    python -m benchmarks.load_test --json results.json               # save results
+    python -m benchmarks.load_test --baseline results.json           # exit 1 on p99/throughput regressions
+'''
+import io
+import os
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import httpx
+from PIL import Image
+
+SCENARIOS = ('analyze', 'chat', 'images')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+CHAT_PROMPTS = (
+    "What should I do during an earthquake?",
+    "How do I prepare my apartment for an earthquake?",
+    "Is it safe to go back inside after an earthquake?",
+    "What should be in an earthquake emergency kit?",
+    "How do I turn off the gas after a quake?",
+    "Should I stand in a doorway during shaking?",
+    "How can I secure heavy furniture to the wall?",
+    "What do I do if I am driving when an earthquake hits?",
+    "How long do aftershocks usually last?",
+    "Where should we meet as a family after an earthquake?",
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def process_rss(pid: int) -> int:
+    with open(f'/proc/{pid}/statm') as statm:
+        return int(statm.read().split()[1]) * PAGE_SIZE
+
+
+def photo_variant(index: int, size: tuple = (4032, 3024)) -> bytes:
+    '''A phone-sized JPEG whose content differs per index, so uploads are not duplicate-cache hits.'''
+    x = -2.0 + (index % 5) * 0.35
+    y = -1.2 + (index // 5 % 5) * 0.3
+    image = Image.effect_mandelbrot(size, (x, y, x + 1.6, y + 1.2), 48 + index).convert('RGB')
+    image = Image.blend(image, Image.effect_noise(size, 40).convert('RGB'), 0.3)
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=90)
+    return output.getvalue()
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class Recorder:
+    '''Collects per-label latencies and errors for one scenario.'''
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    def record(self, label: str, seconds: float, ok: bool) -> None:
+        self.latencies.setdefault(label, []).append(seconds)
+        if not ok:
+            self.errors[label] = self.errors.get(label, 0) + 1
+
+    def summary(self, elapsed: float) -> dict:
+        results = {}
+        for label, values in self.latencies.items():
+            values = sorted(values)
+            results[label] = {
+                'requests': len(values),
+                'errors': self.errors.get(label, 0),
+                'throughput_rps': round(len(values) / elapsed, 2),
+                'p50_ms': round(percentile(values, 0.50) * 1000, 1),
+                'p90_ms': round(percentile(values, 0.90) * 1000, 1),
+                'p99_ms': round(percentile(values, 0.99) * 1000, 1),
+                'max_ms': round(values[-1] * 1000, 1),
+            }
+        return results
+
+
+class Stack:
+    '''The fake LLM server and the app under test, each in its own uvicorn subprocess.'''
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.TemporaryDirectory(prefix='quakesafe-load-')
+        self.llm_port = free_port()
+        self.app_port = free_port()
+        self.processes = []
+        self.app_process = None
+
+    @property
+    def app_url(self) -> str:
+        return f"http://127.0.0.1:{self.app_port}"
+
+    def _spawn(self, target: str, port: int, env: dict) -> subprocess.Popen:
+        command = [sys.executable, '-m', 'uvicorn', target, '--port', str(port), '--log-level', 'warning', '--no-access-log']
+        process = subprocess.Popen(command, env={**os.environ, **env}, cwd=os.getcwd())
+        self.processes.append(process)
+        return process
+
+    async def _wait_ready(self, url: str, timeout: float = 60.0) -> None:
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as client:
+            while time.monotonic() < deadline:
+                try:
+                    await client.get(url)
+                    return
+                except httpx.TransportError:
+                    await asyncio.sleep(0.2)
+        raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+    async def start(self) -> None:
+        args = self.args
+        self._spawn('benchmarks.fake_llm_server:app', self.llm_port, {
+            'FAKE_LLM_LATENCY_MS': str(args.llm_latency_ms),
+            'FAKE_LLM_JITTER_MS': str(args.llm_jitter_ms),
+            'FAKE_LLM_ERROR_RATE': str(args.llm_error_rate),
+        })
+        llm_url = f"http://127.0.0.1:{self.llm_port}"
+        self.app_process = self._spawn('benchmarks.bench_app:app', self.app_port, {
+            'CLAUDE_BASE_URL': llm_url,
+            'GROQ_BASE_URL': llm_url,
+            'FAKE_DB_LATENCY_MS': str(args.db_latency_ms),
+            'FAKE_DB_SEED_IMAGES': str(args.seed_images),
+            'JOB_DB_PATH': os.path.join(self.workdir.name, 'jobs.sqlite3'),
+            'SEMANTIC_CACHE_PATH': os.path.join(self.workdir.name, 'chat_cache'),
+            'LOG_LEVEL': 'WARNING',
+        })
+        await self._wait_ready(f"{llm_url}/docs")
+        await self._wait_ready(f"{self.app_url}/providers/stats")
+
+    def stop(self) -> None:
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.workdir.cleanup()
+
+
+async def sample_rss(pid: int, peak: dict, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        peak['rss'] = max(peak['rss'], process_rss(pid))
+        try:
+            await asyncio.wait_for(stop.wait(), 0.05)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def analyze_request(client: httpx.AsyncClient, recorder: Recorder, photos: list[bytes]) -> None:
+    '''One upload, then waits on the job's event stream so the end-to-end time includes the model call and DB writes.'''
+    start = time.perf_counter()
+    response = await client.post(
+        '/analyze',
+        files={'file': ('photo.jpg', random.choice(photos), 'image/jpeg')},
+        data={'user_id': 'load-test', 'latitude': str(37.33 + random.uniform(-0.1, 0.1)),
+              'longitude': str(-121.89 + random.uniform(-0.1, 0.1))},
+    )
+    recorder.record('POST /analyze (accepted)', time.perf_counter() - start, response.status_code == 202)
+    if response.status_code != 202:
+        return
+    events = await client.get(f"/jobs/{response.json()['job_id']}/events")
+    recorder.record('POST /analyze (job done)', time.perf_counter() - start, 'event: done' in events.text)
+
+
+async def chat_request(client: httpx.AsyncClient, recorder: Recorder) -> None:
+    start = time.perf_counter()
+    response = await client.post('/chat', json={'user_id': 'load-test', 'prompt': random.choice(CHAT_PROMPTS)})
+    recorder.record('POST /chat', time.perf_counter() - start, response.status_code == 200)
+
+
+async def images_request(client: httpx.AsyncClient, recorder: Recorder, image_ids: list[str], etags: dict) -> None:
+    '''A map client's read mix: viewport pages, marker details, and conditional polls of the full list.'''
+    choice = random.random()
+    headers = {'Accept-Encoding': 'gzip'}
+    if choice < 0.4:
+        label = 'GET /images/viewport'
+        lat, lng = 37.33 + random.uniform(-0.15, 0.15), -121.89 + random.uniform(-0.15, 0.15)
+        path = f"/images/viewport?min_lat={lat - 0.05}&min_lng={lng - 0.05}&max_lat={lat + 0.05}&max_lng={lng + 0.05}"
+    elif choice < 0.65:
+        label = 'GET /image/{id}'
+        path = f"/image/{random.choice(image_ids)}"
+    elif choice < 0.9:
+        label = 'GET /safety_assessments/{id}'
+        path = f"/safety_assessments/{random.choice(image_ids)}"
+    else:
+        label = 'GET /images'
+        path = '/images'
+        if path in etags:
+            headers['If-None-Match'] = etags[path]
+
+    start = time.perf_counter()
+    response = await client.get(path, headers=headers)
+    recorder.record(label, time.perf_counter() - start, response.status_code in (200, 304))
+    if response.status_code == 200 and 'etag' in response.headers:
+        etags[path] = response.headers['etag']
+
+
+async def run_scenario(name: str, stack: Stack, args, photos: list[bytes]) -> dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=stack.app_url, timeout=120, limits=limits) as client:
+        image_ids, etags = [], {}
+        if name == 'images':
+            image_ids = [image['id'] for image in (await client.get('/images')).json()['images']]
+
+        async def one_request(target: Recorder):
+            if name == 'analyze':
+                await analyze_request(client, target, photos)
+            elif name == 'chat':
+                await chat_request(client, target)
+            else:
+                await images_request(client, target, image_ids, etags)
+
+        # Warm connection pools, executors and caches outside the measured window
+        warmup = Recorder()
+        await asyncio.gather(*(one_request(warmup) for _ in range(min(args.concurrency, 4))))
+
+        issued = 0
+        deadline = time.monotonic() + args.duration if args.duration else None
+
+        async def worker():
+            nonlocal issued
+            while (deadline is None and issued < args.requests) or (deadline is not None and time.monotonic() < deadline):
+                issued += 1
+                try:
+                    await one_request(recorder)
+                except httpx.HTTPError:
+                    recorder.record(f"{name} (transport error)", 0.0, False)
+
+        peak = {'rss': process_rss(stack.app_process.pid)}
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_rss(stack.app_process.pid, peak, stop))
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await sampler
+
+        results = {'elapsed_s': round(elapsed, 2), 'peak_rss_mib': round(peak['rss'] / 2**20, 1),
+                   'end_rss_mib': round(process_rss(stack.app_process.pid) / 2**20, 1), 'endpoints': recorder.summary(elapsed)}
+        if name == 'chat':
+            results['chat_cache'] = (await client.get('/chat_cache/stats')).json()
+        if name == 'images':
+            results['response_cache'] = (await client.get('/response_cache/stats')).json()
+        return results
+
+
+def print_report(results: dict) -> None:
+    header = f"{'endpoint':<32} {'reqs':>6} {'errs':>5} {'rps':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+    for scenario, result in results.items():
+        print(f"\n[{scenario}] {result['elapsed_s']}s, app RSS peak {result['peak_rss_mib']} MiB (end {result['end_rss_mib']} MiB)")
+        print(header)
+        for label, stats in result['endpoints'].items():
+            print(f"{label:<32} {stats['requests']:>6} {stats['errors']:>5} {stats['throughput_rps']:>8} "
+                  f"{stats['p50_ms']:>8} {stats['p90_ms']:>8} {stats['p99_ms']:>8} {stats['max_ms']:>8}")
+        for cache in ('chat_cache', 'response_cache'):
+            if cache in result:
+                print(f"{cache}: hit rate {result[cache]['hit_rate']}")
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    '''Lists endpoints whose p99 grew, or whose throughput fell, by more than `tolerance` against the baseline.'''
+    regressions = []
+    for scenario, result in results.items():
+        for label, stats in result['endpoints'].items():
+            base = baseline.get(scenario, {}).get('endpoints', {}).get(label)
+            if not base:
+                continue
+            if stats['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+                regressions.append(f"{label}: p99 {base['p99_ms']} -> {stats['p99_ms']} ms")
+            if stats['throughput_rps'] < base['throughput_rps'] * (1 - tolerance):
+                regressions.append(f"{label}: throughput {base['throughput_rps']} -> {stats['throughput_rps']} rps")
+        base_rss = baseline.get(scenario, {}).get('peak_rss_mib')
+        if base_rss and result['peak_rss_mib'] > base_rss * (1 + tolerance):
+            regressions.append(f"[{scenario}] peak RSS {base_rss} -> {result['peak_rss_mib']} MiB")
+    return regressions
+
+
+async def main_async(args) -> int:
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    photos = []
+    if 'analyze' in scenarios:
+        width, height = (int(value) for value in args.photo_size.split('x'))
+        photos = [photo_variant(index, (width, height)) for index in range(args.photo_variants)]
+
+    stack = Stack(args)
+    try:
+        await stack.start()
+        results = {}
+        for name in scenarios:
+            results[name] = await run_scenario(name, stack, args, photos)
+    finally:
+        stack.stop()
+
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\nNo regressions against baseline")
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated subset of: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent closed-loop clients per scenario')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario (ignored with --duration)')
+    parser.add_argument('--duration', type=float, default=0, help='seconds per scenario instead of a request count')
+    parser.add_argument('--llm-latency-ms', type=float, default=200)
+    parser.add_argument('--llm-jitter-ms', type=float, default=50)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--db-latency-ms', type=float, default=5)
+    parser.add_argument('--seed-images', type=int, default=1000)
+    parser.add_argument('--photo-size', default='4032x3024', help='upload dimensions, WIDTHxHEIGHT')
+    parser.add_argument('--photo-variants', type=int, default=8, help='distinct photos to rotate through')
+    parser.add_argument('--json', help='write results to this file')
+    parser.add_argument('--baseline', help='results file from an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression (default 0.2 = 20%%)')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main_async(parse_args())))
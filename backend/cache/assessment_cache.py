@@ -0,0 +1,118 @@
+import os
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+ASSESSMENT_CACHE_SIZE = int(os.getenv('ASSESSMENT_CACHE_SIZE', '10000'))
+# Two photos whose 64-bit dHashes differ in at most this many bits are treated as the same scene
+ASSESSMENT_CACHE_MAX_DISTANCE = int(os.getenv('ASSESSMENT_CACHE_MAX_DISTANCE', '4'))
+
+# The hash is split into 8 bands of 8 bits. If two hashes differ in at most 7 bits,
+# at least one band must match exactly, so near-duplicates are found with dict lookups.
+HASH_BANDS = 8
+BAND_BITS = 64 // HASH_BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+
+def dhash(image: Image.Image, hash_size: int = 8) -> int:
+    '''Computes a 64-bit difference hash: each bit says whether a pixel is brighter than its right neighbour.'''
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR, reducing_gap=2.0)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class AssessmentCache:
+    '''
+    Size-bounded LRU cache of Claude assessments keyed by perceptual hash.
+    A lookup returns the stored assessment for an exact hash match or for the closest
+    hash within `max_distance` bits, and records hit/miss counts for the stats endpoint.
+    '''
+
+    def __init__(self, max_size: int = ASSESSMENT_CACHE_SIZE, max_distance: int = ASSESSMENT_CACHE_MAX_DISTANCE):
+        self.max_size = max_size
+        self.max_distance = max_distance
+        self._entries: OrderedDict[int, dict] = OrderedDict()
+        self._bands: dict[tuple[int, int], set[int]] = {}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _band_keys(image_hash: int):
+        for band in range(HASH_BANDS):
+            yield band, (image_hash >> (band * BAND_BITS)) & BAND_MASK
+
+    def _candidates(self, image_hash: int):
+        if self.max_distance >= HASH_BANDS:
+            return self._entries.keys()
+        candidates = set()
+        for key in self._band_keys(image_hash):
+            candidates |= self._bands.get(key, set())
+        return candidates
+
+    def get(self, image_hash: int) -> dict | None:
+        '''Returns the cached assessment for this hash or its nearest neighbour within range, or None.'''
+        with self._lock:
+            if image_hash in self._entries:
+                self._entries.move_to_end(image_hash)
+                self.exact_hits += 1
+                return self._entries[image_hash]
+
+            best_hash, best_distance = None, self.max_distance + 1
+            for candidate in self._candidates(image_hash):
+                distance = hamming_distance(image_hash, candidate)
+                if distance < best_distance:
+                    best_hash, best_distance = candidate, distance
+
+            if best_hash is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_hash)
+            self.near_hits += 1
+            return self._entries[best_hash]
+
+    def put(self, image_hash: int, assessment: dict) -> None:
+        '''Stores an assessment, evicting the least recently used entries beyond `max_size`.'''
+        with self._lock:
+            if image_hash not in self._entries:
+                for key in self._band_keys(image_hash):
+                    self._bands.setdefault(key, set()).add(image_hash)
+            self._entries[image_hash] = assessment
+            self._entries.move_to_end(image_hash)
+
+            while len(self._entries) > self.max_size:
+                evicted, _ = self._entries.popitem(last=False)
+                for key in self._band_keys(evicted):
+                    band = self._bands.get(key)
+                    if band is not None:
+                        band.discard(evicted)
+                        if not band:
+                            del self._bands[key]
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.near_hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'max_distance': self.max_distance,
+            'exact_hits': self.exact_hits,
+            'near_hits': self.near_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round((self.exact_hits + self.near_hits) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,285 @@
+import os
+import gzip
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:
+    redis_asyncio = None
+
+from telemetry.logger import get_logger
+
+logger = get_logger('cache')
+
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '2048'))
+# Optional shared tier (any Redis-compatible server); without it each worker keeps its own cache
+RESPONSE_CACHE_REDIS_URL = os.getenv('RESPONSE_CACHE_REDIS_URL')
+RESPONSE_CACHE_REDIS_TTL_SECONDS = int(os.getenv('RESPONSE_CACHE_REDIS_TTL_SECONDS', '3600'))
+# Oldest in-process entry that is served. Invalidation without Redis only reaches the process that wrote, so this
+# bounds how long another worker, or a batch script such as rescore.py, can leave a stale response cached here
+RESPONSE_CACHE_MEMORY_TTL_SECONDS = float(os.getenv('RESPONSE_CACHE_MEMORY_TTL_SECONDS', '30'))
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 512
+
+REDIS_PREFIX = 'quakesafe:response:'
+
+
+class CachedResponse:
+    '''A serialised JSON body with its ETag, pre-compressed variants and the tag versions it was built from.'''
+
+    __slots__ = ('body', 'etag', 'gzip', 'br', 'versions', 'created_at')
+
+    def __init__(self, body: bytes, versions: dict, etag: str = None, gzip_body: bytes = None, br_body: bytes = None):
+        self.body = body
+        self.versions = versions
+        self.created_at = time.monotonic()
+        self.etag = etag or f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        if gzip_body is None and len(body) >= MIN_COMPRESS_BYTES:
+            gzip_body = gzip.compress(body, compresslevel=6)
+        if br_body is None and brotli is not None and len(body) >= MIN_COMPRESS_BYTES:
+            br_body = brotli.compress(body, quality=5)
+        self.gzip = gzip_body
+        self.br = br_body
+
+    def to_response(self, if_none_match: str = None, accept_encoding: str = '') -> Response:
+        '''Builds a 304 when the client already has this ETag, otherwise the best pre-compressed body it accepts.'''
+        headers = {'ETag': self.etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+        if if_none_match and etag_matches(if_none_match, self.etag):
+            return Response(status_code=304, headers=headers)
+
+        encodings = {token.split(';')[0].strip().lower() for token in (accept_encoding or '').split(',')}
+        if self.br is not None and 'br' in encodings:
+            headers['Content-Encoding'] = 'br'
+            return Response(content=self.br, media_type='application/json', headers=headers)
+        if self.gzip is not None and 'gzip' in encodings:
+            headers['Content-Encoding'] = 'gzip'
+            return Response(content=self.gzip, media_type='application/json', headers=headers)
+        return Response(content=self.body, media_type='application/json', headers=headers)
+
+
+def build_cached_response(payload, versions: dict) -> CachedResponse:
+    '''Serialises and compresses a payload. CPU-bound, so ResponseCache runs it on a worker thread.'''
+    body = json.dumps(payload, default=str, separators=(',', ':')).encode()
+    return CachedResponse(body, versions)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    '''Weak comparison of an If-None-Match header against an ETag, as RFC 9110 requires for GET.'''
+    if if_none_match.strip() == '*':
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(','))
+    return any((tag[2:] if tag.startswith('W/') else tag) == etag for tag in candidates)
+
+
+class ResponseCache:
+    '''
+    Read-through cache of JSON responses keyed by request and labelled with invalidation tags.
+    Each tag carries a version number; `invalidate` bumps it, and an entry is only served while every tag it
+    was built from still has the same version. With a Redis URL the versions and bodies are shared by all workers
+    (one MGET per lookup); the in-process LRU then acts as the first tier in front of it.
+    Without Redis the versions are per process, so entries also expire after `memory_ttl` seconds: a write made by
+    another process is then visible here within that time rather than never.
+    Bodies are serialised and compressed on a worker thread, and `fetch` lets concurrent misses for one key share a
+    single load and build instead of each repeating it.
+    '''
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE, redis_url: str = RESPONSE_CACHE_REDIS_URL,
+                 redis_ttl: int = RESPONSE_CACHE_REDIS_TTL_SECONDS, memory_ttl: float = RESPONSE_CACHE_MEMORY_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.redis_ttl = redis_ttl
+        self.memory_ttl = memory_ttl
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._versions: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._building: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.shared_builds = 0
+        self.misses = 0
+        self.redis = None
+        if redis_url:
+            if redis_asyncio is None:
+                logger.error("RESPONSE_CACHE_REDIS_URL is set but the redis package is not installed; using the in-process cache only")
+            else:
+                self.redis = redis_asyncio.from_url(redis_url)
+
+    async def _current_versions(self, tags) -> dict:
+        tags = list(tags)
+        if self.redis is None:
+            with self._lock:
+                return {tag: self._versions.get(tag, 0) for tag in tags}
+        values = await self.redis.mget([f"{REDIS_PREFIX}tag:{tag}" for tag in tags])
+        return {tag: int(value or 0) for tag, value in zip(tags, values)}
+
+    async def _load_shared(self, key: str) -> CachedResponse | None:
+        fields = await self.redis.hgetall(f"{REDIS_PREFIX}entry:{key}")
+        if not fields:
+            return None
+        return CachedResponse(
+            fields[b'body'],
+            json.loads(fields[b'versions']),
+            etag=fields[b'etag'].decode(),
+            gzip_body=fields.get(b'gzip') or None,
+            br_body=fields.get(b'br') or None,
+        )
+
+    async def get(self, key: str) -> CachedResponse | None:
+        '''Returns the cached response for `key` if none of its tags were invalidated since it was stored.'''
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and self.memory_ttl > 0 and time.monotonic() - entry.created_at > self.memory_ttl:
+            entry = None
+        try:
+            if entry is None and self.redis is not None:
+                entry = await self._load_shared(key)
+            if entry is not None and await self._current_versions(entry.versions) != entry.versions:
+                entry = None
+        except Exception as e:
+            logger.error("Response cache lookup failed: %s", e)
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.hits += 1
+        return entry
+
+    async def put(self, key: str, payload, versions: dict) -> CachedResponse:
+        '''
+        Stores a JSON-serialisable payload under `key`. `versions` must be read with `snapshot` before the
+        payload was loaded, so a write that lands while it is being loaded leaves the entry already stale.
+        '''
+        entry = await asyncio.to_thread(build_cached_response, payload, versions)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if self.redis is not None:
+            try:
+                mapping = {'body': entry.body, 'etag': entry.etag, 'versions': json.dumps(versions),
+                           'gzip': entry.gzip or b'', 'br': entry.br or b''}
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.hset(f"{REDIS_PREFIX}entry:{key}", mapping=mapping)
+                    pipe.expire(f"{REDIS_PREFIX}entry:{key}", self.redis_ttl)
+                    await pipe.execute()
+            except Exception as e:
+                logger.error("Response cache store failed: %s", e)
+        return entry
+
+    async def _build(self, key: str, tags, load, cache_if):
+        versions = await self.snapshot(tags)
+        payload = await load()
+        if cache_if is not None and not cache_if(payload):
+            return payload
+        return await self.put(key, payload, versions)
+
+    def _finish_build(self, key: str, task: asyncio.Task) -> None:
+        if self._building.get(key) is task:
+            del self._building[key]
+        # Retrieve the exception even when every caller has gone, so it is not reported as never retrieved
+        if not task.cancelled():
+            task.exception()
+
+    async def fetch(self, key: str, tags, load, cache_if=None):
+        '''
+        Returns the cached response for `key`, or on a miss loads the payload with `await load()` and stores it
+        unless `cache_if(payload)` is false, in which case the payload itself is returned. While one build of a key
+        is running, other misses for it wait for that build rather than starting their own. The build runs as its
+        own task, so a caller that disconnects does not cancel it for the rest.
+        '''
+        entry = await self.get(key)
+        if entry is not None:
+            return entry
+        task = self._building.get(key)
+        if task is None:
+            task = asyncio.create_task(self._build(key, tags, load, cache_if))
+            self._building[key] = task
+            task.add_done_callback(lambda done: self._finish_build(key, done))
+        else:
+            self.shared_builds += 1
+        return await asyncio.shield(task)
+
+    async def snapshot(self, tags) -> dict:
+        '''Reads the current versions of `tags`, to pass to `put` once the payload has been loaded.'''
+        try:
+            return await self._current_versions(tags)
+        except Exception as e:
+            logger.error("Response cache version read failed: %s", e)
+            # An impossible version makes the entry a permanent miss instead of risking a stale hit
+            return {tag: -1 for tag in tags}
+
+    def invalidate(self, tags) -> None:
+        '''Bumps the version of every tag so entries built from them are no longer served.'''
+        tags = list(tags)
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+        if self.redis is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            logger.error("Shared response cache invalidation needs a running event loop")
+            return
+        task = loop.create_task(self._invalidate_shared(tags))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    def invalidate_write(self, table: str, keys) -> None:
+        '''
+        db.invalidation listener: drops the reads that a new image or safety assessment (keyed by image id) or user
+        activity (keyed by user id) makes stale.
+        '''
+        if table == 'images':
+            self.invalidate(['images'] + [f"image:{image_id}" for image_id in keys])
+        elif table == 'safety_assessments':
+            self.invalidate([f"assessments:{image_id}" for image_id in keys])
+        elif table == 'activity':
+            self.invalidate([f"activity:{user_id}" for user_id in keys])
+
+    async def _invalidate_shared(self, tags) -> None:
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for tag in tags:
+                    pipe.incr(f"{REDIS_PREFIX}tag:{tag}")
+                await pipe.execute()
+        except Exception as e:
+            logger.error("Response cache invalidation failed: %s", e)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_entries': self.max_entries,
+            'memory_ttl_seconds': self.memory_ttl,
+            'backend': 'redis' if self.redis is not None else 'memory',
+            'brotli': brotli is not None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'shared_builds': self.shared_builds,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    async def close(self) -> None:
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        if self.redis is not None:
+            await self.redis.aclose()
@@ -0,0 +1,190 @@
+import os
+import re
+import json
+import time
+import zlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+SEMANTIC_CACHE_PATH = os.getenv('SEMANTIC_CACHE_PATH', 'chat_cache')
+SEMANTIC_CACHE_SIZE = int(os.getenv('SEMANTIC_CACHE_SIZE', '5000'))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv('SEMANTIC_CACHE_TTL_SECONDS', str(24 * 3600)))
+# Minimum cosine similarity between prompts for a cached answer to be reused; they must also share every content word
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.85'))
+EMBEDDING_DIM = 512
+
+_WORD_PATTERN = re.compile(r"[a-z0-9']+")
+# Words that carry no meaning for matching safety questions. Timing words (before/during/after), particles such as
+# on/off/in/out and negations are deliberately absent: they are what separates opposite questions
+_STOP_WORDS = frozenset({
+    'a', 'an', 'the', 'i', 'me', 'my', 'we', 'our', 'you', 'your', 'to', 'of', 'for', 'is', 'are', 'am', 'be', 'it',
+    'do', 'does', 'should', 'can', 'could', 'would', 'please', 'what', 'how', 'there', 'this', 'that', 'and',
+})
+
+
+def content_tokens(text: str) -> list[str]:
+    '''The words of a prompt that decide what it asks, in order: stop words removed, plural "s" dropped.'''
+    tokens = []
+    for word in _WORD_PATTERN.findall(text.lower()):
+        if word in _STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+
+def content_words(text: str) -> frozenset:
+    '''Two prompts can share an answer only when these sets are equal, so "earthquake" and "earthquakes" agree but "on" and "off" never do.'''
+    return frozenset(content_tokens(text))
+
+
+def embed_text(text: str, dim: int = EMBEDDING_DIM) -> np.ndarray:
+    '''
+    Embeds a prompt as an L2-normalised float32 vector using signed feature hashing of words, word bigrams
+    and character trigrams. Needs no model download, and rewordings land close together.
+    Being lexical, it also scores "turn off the gas" and "turn on the gas" as near neighbours, so lookups only
+    reuse an answer when content_words agree as well.
+    '''
+    vector = np.zeros(dim, dtype=np.float32)
+    words = content_tokens(text)
+    features = [(f"w:{word}", 2.0) for word in words]
+    features += [(f"b:{first} {second}", 1.5) for first, second in zip(words, words[1:])]
+    for word in words:
+        padded = f" {word} "
+        features += [(f"c:{padded[i:i + 3]}", 0.5) for i in range(len(padded) - 2)]
+
+    for feature, weight in features:
+        digest = zlib.crc32(feature.encode())
+        vector[digest % dim] += weight if digest & 0x80000000 else -weight
+
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticAnswerCache:
+    '''
+    Cosine-similarity cache of chat answers over a fixed-size float32 matrix.
+    Entries expire after `ttl_seconds`; when full, the least recently used entry is overwritten.
+    A similar prompt is only a match when it has the same content words: one changed word ("on" for "off", "after"
+    for "during", "stairs" for "elevator") can ask the opposite question, which a lexical similarity cannot see.
+    The matrix and entry metadata are persisted to `<path>.npy` / `<path>.json` so the cache survives restarts.
+    '''
+
+    def __init__(self, path: str = SEMANTIC_CACHE_PATH, max_entries: int = SEMANTIC_CACHE_SIZE,
+                 ttl_seconds: float = SEMANTIC_CACHE_TTL_SECONDS, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 dim: int = EMBEDDING_DIM):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.dim = dim
+        self._vectors = np.zeros((max_entries, dim), dtype=np.float32)
+        self._entries: list[dict | None] = [None] * max_entries
+        self._lru: OrderedDict[int, None] = OrderedDict()
+        self._free = list(range(max_entries - 1, -1, -1))
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def _release(self, slot: int) -> None:
+        self._vectors[slot] = 0
+        self._entries[slot] = None
+        self._lru.pop(slot, None)
+        self._free.append(slot)
+
+    def lookup(self, prompt: str) -> dict | None:
+        '''Returns {'response', 'context', 'similarity'} for the most similar live prompt above the threshold, or None.'''
+        query = embed_text(prompt, self.dim)
+        words = content_words(prompt)
+        now = time.time()
+        with self._lock:
+            if not self._lru:
+                self.misses += 1
+                return None
+            scores = self._vectors @ query
+            for slot in np.argsort(scores)[::-1]:
+                slot = int(slot)
+                if scores[slot] < self.threshold:
+                    break
+                entry = self._entries[slot]
+                if entry is None:
+                    continue
+                if now - entry['created_at'] > self.ttl_seconds:
+                    self._release(slot)
+                    self._dirty = True
+                    continue
+                if content_words(entry['prompt']) != words:
+                    continue
+                self._lru.move_to_end(slot)
+                self.hits += 1
+                return {'response': entry['response'], 'context': entry['context'], 'similarity': float(scores[slot])}
+            self.misses += 1
+            return None
+
+    def put(self, prompt: str, response: str, context: str) -> None:
+        '''Stores an answer, overwriting the least recently used entry when the cache is full.'''
+        vector = embed_text(prompt, self.dim)
+        with self._lock:
+            if not self._free:
+                evicted, _ = self._lru.popitem(last=False)
+                self._release(evicted)
+            slot = self._free.pop()
+            self._vectors[slot] = vector
+            self._entries[slot] = {'prompt': prompt, 'response': response, 'context': context, 'created_at': time.time()}
+            self._lru[slot] = None
+            self._dirty = True
+
+    def save(self) -> None:
+        '''Writes live entries to disk (in LRU order) if anything changed since the last save.'''
+        with self._lock:
+            if not self._dirty:
+                return
+            slots = list(self._lru)
+            vectors = self._vectors[slots].astype(np.float16)
+            entries = [self._entries[slot] for slot in slots]
+            self._dirty = False
+        np.save(f"{self.path}.tmp.npy", vectors)
+        with open(f"{self.path}.tmp.json", 'w') as metadata:
+            json.dump(entries, metadata)
+        os.replace(f"{self.path}.tmp.npy", f"{self.path}.npy")
+        os.replace(f"{self.path}.tmp.json", f"{self.path}.json")
+
+    def load(self) -> int:
+        '''Restores entries saved by a previous process, dropping expired ones. Returns how many were loaded.'''
+        try:
+            vectors = np.load(f"{self.path}.npy")
+            with open(f"{self.path}.json") as metadata:
+                entries = json.load(metadata)
+        except (OSError, ValueError):
+            return 0
+        if vectors.shape[1:] != (self.dim,) or len(vectors) != len(entries):
+            return 0
+
+        now = time.time()
+        with self._lock:
+            for vector, entry in list(zip(vectors, entries))[-self.max_entries:]:
+                if now - entry['created_at'] > self.ttl_seconds:
+                    continue
+                slot = self._free.pop()
+                self._vectors[slot] = vector.astype(np.float32)
+                entry.pop('negations', None)
+                self._entries[slot] = entry
+                self._lru[slot] = None
+        return len(self._lru)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._lru),
+            'max_entries': self.max_entries,
+            'threshold': self.threshold,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,338 @@
+from supabase import AsyncClient
+from db.invalidation import notify_write
+from datetime import datetime, timezone
+from telemetry.logger import get_logger
+from telemetry.metrics import timed
+
+logger = get_logger('db')
+
+# Data-access helpers for every table. They take the shared AsyncClient
+# so queries are awaited on the event loop instead of blocking the worker.
+# Each helper's latency is recorded in the db.<helper name> stage histogram.
+
+# Error codes for a database function that does not exist: PostgREST's schema-cache miss and Postgres' undefined_function
+MISSING_FUNCTION_CODES = ('PGRST202', '42883')
+
+
+class FunctionNotFound(Exception):
+    '''Raised by an RPC helper when its database function has not been created, i.e. the migration was not applied.'''
+
+def _newest_first(query, time_column: str, before: tuple = None, limit: int = None):
+    '''Orders by (time_column, id) descending and resumes strictly after a (timestamp, id) keyset cursor.'''
+    if before is not None:
+        timestamp, row_id = before
+        query = query.or_(f'{time_column}.lt."{timestamp}",and({time_column}.eq."{timestamp}",id.lt."{row_id}")')
+    query = query.order(time_column, desc=True).order('id', desc=True)
+    return query.limit(limit) if limit is not None else query
+
+@timed('db.check_if_user_exists')
+async def check_if_user_exists(supabase: AsyncClient, user_id: str) -> bool | None:
+    try:
+        response = await supabase.from_('user_profiles').select('id').eq('id', user_id).limit(1).execute()
+        if hasattr(response, 'error') and response.error:
+            logger.error('Error checking DB: %s', response.error)
+            return None
+        return True if response.data else False
+    except Exception as e:
+        logger.error('Error accessing DB: %s', e)
+        return None
+
+@timed('db.insert_image_entry')
+async def insert_image_entry(supabase: AsyncClient, user_id: str, image_url: str, longitude: float, latitude: float, location_name: str = None,
+                             image_id: str = None) -> str | None:
+    """Create a new image in the database, with a caller-chosen id when one is given."""
+    data = {
+        'user_id': user_id,
+        'image_url': image_url,
+        'longitude': longitude,
+        'latitude': latitude,
+        'location_name': location_name,
+    }
+    if image_id is not None:
+        data['id'] = image_id
+    try:
+        response = await supabase.from_('images').insert(data).execute()
+        if hasattr(response, 'error') and response.error:
+            logger.error('Error inserting into DB: %s', response.error)
+            return None
+        notify_write('images', [response.data[0]['id']])
+        notify_write('activity', [user_id])
+        return response.data[0]['id']
+    except Exception as e:
+        logger.error('Error accessing DB: %s', e)
+        return None
+
+@timed('db.get_images_by_user')
+async def get_images_by_user(supabase: AsyncClient, user_id: str, columns: str = '*', before: tuple = None, limit: int = None):
+    """Retrieve a user's images, newest first. `before` is a (created_at, id) keyset cursor for the next page."""
+    try:
+        query = supabase.from_('images').select(columns).eq('user_id', user_id)
+        response = await _newest_first(query, 'created_at', before, limit).execute()
+        if hasattr(response, 'error') and response.error:
+            logger.error('Error retrieving from DB: %s', response.error)
+            return None
+        return response.data
+    except Exception as e:
+        logger.error('Error accessing DB: %s', e)
+        return None
+
+@timed('db.get_safety_assessments_by_user')
+async def get_safety_assessments_by_user(supabase: AsyncClient, user_id: str, columns: str = '*', before: tuple = None,
+                                         limit: int = None) -> list:
+    """Retrieve the safety assessments of a user's images, newest first, through an inner join on images."""
+    try:
+        query = supabase.from_('safety_assessments').select(f"{columns}, images!inner(user_id)").eq('images.user_id', user_id)
+        response = await _newest_first(query, 'created_at', before, limit).execute()
+        if hasattr(response, 'error') and response.error:
+            logger.error('Error retrieving from DB: %s', response.error)
+            return None
+        for row in response.data:
+            row.pop('images', None)
+        return response.data
+    except Exception as e:
+        logger.error('Error accessing DB: %s', e)
+        return None
+
+@timed('db.get_image_by_id')
+async def get_image_by_id(supabase: AsyncClient, image_id: str):
+    """Retrieve a specific image by its ID."""
+    try:
+        response = await supabase.from_('images').select('*').eq('id', image_id).single().execute()
+        if hasattr(response, 'error') and response.error:
+            logger.error('Error retrieving from DB: %s', response.error)
+            return None
+        return response.data
+    except Exception as e:
+        logger.error('Error accessing DB: %s', e)
+        return None
+
+@timed('db.fetch_all_images')
+async def fetch_all_images(supabase: AsyncClient):
+    """Retrieve all images with location data."""
+    try:
+        response = await supabase.from_('images').select('*').execute()
+        if hasattr(response, 'error') and response.error:
+            logger.error("Error fetching images: %s", response.error)
+            return []
+        return response.data
+    except Exception as e:
+        logger.error("Exception in fetch_all_images: %s", e)
+        return []
+
+@timed('db.fetch_images_page')
+async def fetch_images_page(supabase: AsyncClient, columns: str = '*', after_id: str = None, limit: int = 1000) -> list | None:
+    """Retrieve one page of images ordered by id, starting after the given id (keyset pagination).
+    Returns None on error, so a failed read is never mistaken for the end of the table."""
+    try:
+        query = supabase.from_('images').select(columns).order('id')
+        if after_id is not None:
+            query = query.gt('id', after_id)
+        response = await query.limit(limit).execute()
+        if hasattr(response, 'error') and response.error:
+            logger.error('Error retrieving from DB: %s', response.error)
+            return None
+        return response.data
+    except Exception as e:
+        logger.error('Error accessing DB: %s', e)
+        return None
+
+@timed('db.insert_safety_assessment')
+async def insert_safety_assessment(supabase: AsyncClient, image_id: str, safety_score: float,
+                                   estimated_magnitude_survivability: str, description: str):
+    """Create a new safety assessment record."""
+    data = {
+        "image_id": image_id,
+        "safety_score": safety_score,
+        "estimated_magnitude_survivability": estimated_magnitude_survivability,
+        "description": description
+    }
+    try:
+        response = await supabase.from_('safety_assessments').insert(data).execute()
+        if hasattr(response, 'error') and response.error:
+            logger.error('Error inserting into DB: %s', response.error)
+            return None
+        notify_write('safety_assessments', [image_id])
+        return response.data
+    except Exception as e:
+        logger.error('Error accessing DB: %s', e)
+        return None
+
+@timed('db.fetch_assessments_page')
+async def fetch_assessments_page(supabase: AsyncClient, columns: str = '*', after_id: str = None, limit: int = 1000) -> list | None:
+    """Retrieve one page of safety assessments ordered by id, starting after the given id (keyset pagination).
+    Returns None on error, so a failed read is never mistaken for the end of the table."""
+    try:
+        query = supabase.from_('safety_assessments').select(columns).order('id')
+        if after_id is not None:
+            query = query.gt('id', after_id)
+        response = await query.limit(limit).execute()
+        if hasattr(response, 'error') and response.error:
+            logger.error('Error retrieving from DB: %s', response.error)
+            return None
+        return response.data
+    except Exception as e:
+        logger.error('Error accessing DB: %s', e)
+        return None
+
+@timed('db.get_images_with_latest_assessment')
+async def get_images_with_latest_assessment(supabase: AsyncClient, image_ids: list[str]) -> list | None:
+    """Retrieve many images by id in one query, each embedding only its most recent safety assessment."""
+    if not image_ids:
+        return []
+    try:
+        response = await (
+            supabase.from_('images')
+            .select('*, safety_assessments(*)')
+            .in_('id', list(image_ids))
+            .order('created_at', desc=True, foreign_table='safety_assessments')
+            .limit(1, foreign_table='safety_assessments')
+            .execute()
+        )
+        if hasattr(response, 'error') and response.error:
+            logger.error('Error retrieving from DB: %s', response.error)
+            return None
+        return response.data
+    except Exception as e:
+        logger.error('Error accessing DB: %s', e)
+        return None
+
+@timed('db.get_safety_assessment_by_image')
+async def get_safety_assessment_by_image(supabase: AsyncClient, image_id: str) -> list:
+    """Retrieve all safety assessments for a specific image."""
+    response = await supabase.from_('safety_assessments').select('*').eq('image_id', image_id).execute()
+    return response.data
+
+@timed('db.insert_chat_message')
+async def insert_chat_message(supabase: AsyncClient, user_id: str, user_message: str, ai_response: str, chat_context: str,
+                              timestamp: str = None) -> dict:
+    """Create a new chat message."""
+    data = {
+        "user_id": user_id,
+        "user_message": user_message,
+        "ai_response": ai_response,
+        "chat_context": chat_context,
+        "timestamp": timestamp or datetime.now(timezone.utc).isoformat()
+    }
+    try:
+        response = await supabase.from_('chat_messages').insert(data).execute()
+        if hasattr(response, 'error') and response.error:
+            logger.error('Error inserting into DB: %s', response.error)
+            return None
+        notify_write('activity', [user_id])
+        return response.data
+    except Exception as e:
+        logger.error('Error accessing DB: %s', e)
+        return None
+
+@timed('db.get_chat_messages_by_user')
+async def get_chat_messages_by_user(supabase: AsyncClient, user_id: str, columns: str = '*', before: tuple = None, limit: int = None) -> list:
+    """Retrieve a user's chat messages, newest first. `before` is a (timestamp, id) keyset cursor for the next page."""
+    try:
+        query = supabase.from_('chat_messages').select(columns).eq('user_id', user_id)
+        response = await _newest_first(query, 'timestamp', before, limit).execute()
+        if hasattr(response, 'error') and response.error:
+            logger.error('Error retrieving from DB: %s', response.error)
+            return None
+        return response.data
+    except Exception as e:
+        logger.error('Error accessing DB: %s', e)
+        return None
+
+@timed('db.insert_emergency_action')
+async def insert_emergency_action(supabase: AsyncClient, user_id: str, action_taken: str) -> dict:
+    """Create a new emergency action record."""
+    data = {
+        "user_id": user_id,
+        "action_taken": action_taken
+    }
+    try:
+        response = await supabase.from_('emergency_actions').insert(data).execute()
+        if hasattr(response, 'error') and response.error:
+            logger.error('Error inserting into DB: %s', response.error)
+            return None
+        notify_write('activity', [user_id])
+        return response.data
+    except Exception as e:
+        logger.error('Error accessing DB: %s', e)
+        return None
+
+@timed('db.get_emergency_actions_by_user')
+async def get_emergency_actions_by_user(supabase: AsyncClient, user_id: str, columns: str = '*', before: tuple = None, limit: int = None) -> list:
+    """Retrieve a user's emergency actions, newest first. `before` is a (timestamp, id) keyset cursor for the next page."""
+    try:
+        query = supabase.from_('emergency_actions').select(columns).eq('user_id', user_id)
+        response = await _newest_first(query, 'timestamp', before, limit).execute()
+        if hasattr(response, 'error') and response.error:
+            logger.error('Error retrieving from DB: %s', response.error)
+            return None
+        return response.data
+    except Exception as e:
+        logger.error('Error accessing DB: %s', e)
+        return None
+
+@timed('db.insert_safety_assessments')
+async def insert_safety_assessments(supabase: AsyncClient, rows: list[dict]) -> list | None:
+    """Create many safety assessment records in one request."""
+    if not rows:
+        return []
+    try:
+        response = await supabase.from_('safety_assessments').insert(rows).execute()
+        if hasattr(response, 'error') and response.error:
+            logger.error('Error inserting into DB: %s', response.error)
+            return None
+        notify_write('safety_assessments', [row['image_id'] for row in rows])
+        return response.data
+    except Exception as e:
+        logger.error('Error accessing DB: %s', e)
+        return None
+
+@timed('db.delete_image_entry')
+async def delete_image_entry(supabase: AsyncClient, image_id: str) -> bool:
+    """Delete an image row, e.g. to undo an insert whose dependent writes failed."""
+    try:
+        response = await supabase.from_('images').delete().eq('id', image_id).execute()
+        if hasattr(response, 'error') and response.error:
+            logger.error('Error deleting from DB: %s', response.error)
+            return False
+        notify_write('images', [image_id])
+        return True
+    except Exception as e:
+        logger.error('Error accessing DB: %s', e)
+        return False
+
+@timed('db.record_analysis')
+async def record_analysis(supabase: AsyncClient, image_id: str, user_id: str, image_url: str, longitude: float, latitude: float,
+                          location_name: str, safety_score: float, estimated_magnitude_survivability: str, description: str,
+                          action_taken: str) -> dict | None:
+    """
+    Create an image, its safety assessment and the user's emergency action in one transaction through the
+    record_analysis function (db/migrations/record_analysis.sql). Either all three rows are written or none are.
+    Calling it again with an image_id that was already recorded writes nothing and returns the stored assessment.
+    Raises FunctionNotFound when the migration has not been applied; any other failure returns None.
+    """
+    params = {
+        'p_image_id': image_id,
+        'p_user_id': user_id,
+        'p_image_url': image_url,
+        'p_longitude': longitude,
+        'p_latitude': latitude,
+        'p_location_name': location_name,
+        'p_safety_score': safety_score,
+        'p_estimated_magnitude_survivability': estimated_magnitude_survivability,
+        'p_description': description,
+        'p_action_taken': action_taken,
+    }
+    try:
+        response = await supabase.rpc('record_analysis', params).execute()
+        if hasattr(response, 'error') and response.error:
+            logger.error('Error calling record_analysis: %s', response.error)
+            return None
+        notify_write('images', [image_id])
+        notify_write('safety_assessments', [image_id])
+        notify_write('activity', [user_id])
+        return response.data
+    except Exception as e:
+        if getattr(e, 'code', None) in MISSING_FUNCTION_CODES:
+            raise FunctionNotFound("record_analysis is not defined in the database; apply db/migrations/record_analysis.sql") from e
+        logger.error('Error accessing DB: %s', e)
+        return None
@@ -0,0 +1,37 @@
+import os
+import httpx
+from supabase import acreate_client, AsyncClient, AsyncClientOptions
+
+# One Supabase client per process, backed by a single keep-alive httpx pool,
+# so every request reuses open connections instead of building a new client.
+_client: AsyncClient | None = None
+_http_client: httpx.AsyncClient | None = None
+
+DB_TIMEOUT_SECONDS = float(os.getenv('SUPABASE_TIMEOUT_SECONDS', '10'))
+DB_MAX_CONNECTIONS = int(os.getenv('SUPABASE_MAX_CONNECTIONS', '50'))
+
+async def init_supabase(url: str, key: str) -> AsyncClient:
+    '''Creates the shared async Supabase client. Called once from the app startup hook.'''
+    global _client, _http_client
+    if _client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=DB_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=DB_MAX_CONNECTIONS, max_keepalive_connections=DB_MAX_CONNECTIONS),
+        )
+        options = AsyncClientOptions(postgrest_client_timeout=DB_TIMEOUT_SECONDS, httpx_client=_http_client)
+        _client = await acreate_client(url, key, options=options)
+    return _client
+
+def get_supabase() -> AsyncClient:
+    '''Returns the shared async Supabase client, failing loudly if startup has not created it.'''
+    if _client is None:
+        raise RuntimeError('Supabase client has not been initialized')
+    return _client
+
+async def close_supabase() -> None:
+    '''Closes the pooled connections held by the shared client.'''
+    global _client, _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+    _client = None
+    _http_client = None
@@ -0,0 +1,24 @@
+'''
+Write notifications for caches that sit in front of Supabase reads.
+The insert helpers call notify_write after a successful insert, passing the table and the keys that changed
+(image ids for both `images` and `safety_assessments`), so caches can drop exactly the entries that went stale.
+'''
+from telemetry.logger import get_logger
+
+logger = get_logger('db')
+
+_listeners = []
+
+
+def on_write(listener) -> None:
+    '''Registers `listener(table, keys)` to be called after every successful insert.'''
+    _listeners.append(listener)
+
+
+def notify_write(table: str, keys) -> None:
+    keys = [str(key) for key in keys if key is not None]
+    for listener in _listeners:
+        try:
+            listener(table, keys)
+        except Exception as e:
+            logger.error("Write listener failed for %s: %s", table, e)
@@ -0,0 +1,48 @@
+-- Writes everything one /analyze upload produces in a single transaction, so a failure leaves no orphaned
+-- images row and the three inserts cost one round-trip instead of three.
+-- Called by record_analysis() in db/async_supabase_client.py through PostgREST RPC.
+-- Apply with the Supabase SQL editor or: psql "$DATABASE_URL" -f db/migrations/record_analysis.sql
+--
+-- The image id is chosen by the caller (the analysis job keeps it in its payload), which makes the call
+-- idempotent: a retried job whose first attempt committed gets the stored assessment back instead of a duplicate.
+
+create or replace function record_analysis(
+    p_image_id images.id%type,
+    p_user_id images.user_id%type,
+    p_image_url images.image_url%type,
+    p_longitude images.longitude%type,
+    p_latitude images.latitude%type,
+    p_location_name images.location_name%type,
+    p_safety_score safety_assessments.safety_score%type,
+    p_estimated_magnitude_survivability safety_assessments.estimated_magnitude_survivability%type,
+    p_description safety_assessments.description%type,
+    p_action_taken emergency_actions.action_taken%type
+) returns json
+language plpgsql
+as $$
+declare
+    v_assessment safety_assessments;
+begin
+    insert into images (id, user_id, image_url, longitude, latitude, location_name)
+    values (p_image_id, p_user_id, p_image_url, p_longitude, p_latitude, p_location_name)
+    on conflict (id) do nothing;
+
+    if not found then
+        select * into v_assessment
+        from safety_assessments
+        where image_id = p_image_id
+        order by created_at desc
+        limit 1;
+        return json_build_object('image_id', p_image_id, 'safety_assessment', row_to_json(v_assessment), 'replayed', true);
+    end if;
+
+    insert into safety_assessments (image_id, safety_score, estimated_magnitude_survivability, description)
+    values (p_image_id, p_safety_score, p_estimated_magnitude_survivability, p_description)
+    returning * into v_assessment;
+
+    insert into emergency_actions (user_id, action_taken)
+    values (p_user_id, p_action_taken);
+
+    return json_build_object('image_id', p_image_id, 'safety_assessment', row_to_json(v_assessment), 'replayed', false);
+end;
+$$;
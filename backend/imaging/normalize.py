@@ -0,0 +1,109 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from cache.assessment_cache import dhash
+from telemetry.metrics import stage_timer
+
+JPEG_QUALITY = int(os.getenv('JPEG_QUALITY', '85'))
+# Long edge of the stored image the model fetches; Claude downsizes anything larger anyway
+MAX_LONG_EDGE = int(os.getenv('IMAGE_MAX_LONG_EDGE', '1568'))
+# Extra renditions stored next to the main image, as name -> long edge in pixels
+THUMBNAIL_SIZES = {
+    name: int(edge)
+    for name, edge in (pair.split(':') for pair in os.getenv('IMAGE_THUMBNAIL_SIZES', 'thumb:256').split(',') if pair)
+}
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', str(os.cpu_count() or 2)))
+
+_executor: ThreadPoolExecutor | None = None
+
+
+def _encode_jpeg(image: Image.Image, quality: int) -> bytes:
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=quality)
+    return output.getvalue()
+
+
+def downscale(image: Image.Image, max_long_edge: int) -> Image.Image:
+    '''Shrinks an image so its long edge is at most `max_long_edge`, using a cheap integer reduce() before the final resample.'''
+    long_edge = max(image.size)
+    if long_edge <= max_long_edge:
+        return image
+    factor = long_edge // max_long_edge
+    if factor >= 2:
+        image = image.reduce(factor)
+    if max(image.size) > max_long_edge:
+        scale = max_long_edge / max(image.size)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(size, Image.Resampling.BILINEAR)
+    return image
+
+
+def normalize_image(source, max_long_edge: int = MAX_LONG_EDGE, quality: int = JPEG_QUALITY,
+                    thumbnail_sizes: dict = THUMBNAIL_SIZES) -> dict:
+    '''
+    Decodes an uploaded photo, computes its perceptual hash and re-encodes it as an upright RGB JPEG
+    no larger than `max_long_edge`, plus one smaller JPEG per entry in `thumbnail_sizes`.
+    `source` is either bytes or a binary file object; a file (such as an upload's spooled temp file)
+    is decoded straight from its current position without first being read into memory.
+    '''
+    # Pillow decodes lazily, so this stage covers decoding, orientation, downscaling and hashing
+    with stage_timer('image.decode'):
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+        image = Image.open(source)
+        original_width, original_height = image.size
+
+        # Let the JPEG decoder scale by 1/2, 1/4 or 1/8 while decoding instead of materialising every pixel
+        if image.format == 'JPEG' and max(image.size) > max_long_edge:
+            scale = max_long_edge / max(image.size)
+            image.draft('RGB', (int(image.width * scale) + 1, int(image.height * scale) + 1))
+
+        # Phone cameras store rotation in EXIF; bake it in since the EXIF block is dropped on re-encode
+        image = ImageOps.exif_transpose(image)
+
+        # If image is not RGB (like PNG with transparency), convert it
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        image = downscale(image, max_long_edge)
+        image_hash = dhash(image)
+
+    with stage_timer('image.encode'):
+        renditions = {name: _encode_jpeg(downscale(image, edge), quality) for name, edge in thumbnail_sizes.items()}
+        jpeg = _encode_jpeg(image, quality)
+
+    return {
+        'jpeg': jpeg,
+        'renditions': renditions,
+        'image_hash': f"{image_hash:016x}",
+        'width': image.width,
+        'height': image.height,
+        'original_width': original_width,
+        'original_height': original_height,
+    }
+
+
+def rendition_key(filename: str, name: str) -> str:
+    '''Returns the S3 key of a named rendition stored next to `filename`, e.g. abc.jpg -> abc_thumb.jpg.'''
+    stem, _, extension = filename.rpartition('.')
+    return f"{stem}_{name}.{extension}"
+
+
+def get_image_executor() -> ThreadPoolExecutor:
+    '''
+    Returns the shared pool used for CPU-bound Pillow work, creating it on first use.
+    Pillow releases the GIL while decoding, resampling and encoding, so threads run those steps in parallel
+    and, unlike worker processes, can read an upload's temp file in place instead of receiving a pickled copy.
+    '''
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix='image')
+    return _executor
+
+
+def shutdown_image_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,300 @@
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import sqlite3
+import threading
+from telemetry.logger import get_logger
+from telemetry.metrics import stage_timer
+
+logger = get_logger('jobs')
+
+JOB_DB_PATH = os.getenv('JOB_DB_PATH', 'jobs.sqlite3')
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '3'))
+JOB_RETRY_BASE_SECONDS = float(os.getenv('JOB_RETRY_BASE_SECONDS', '2'))
+JOB_RETRY_MAX_SECONDS = float(os.getenv('JOB_RETRY_MAX_SECONDS', '60'))
+# With several server processes sharing one queue file, only the supervisor may requeue `running` jobs at boot
+# (serve.py sets this to 0 for its workers); otherwise a starting worker would steal jobs its siblings are running
+JOB_REQUEUE_ON_START = os.getenv('JOB_REQUEUE_ON_START', '1') == '1'
+# How long stop() lets running jobs finish before cancelling them
+JOB_DRAIN_SECONDS = float(os.getenv('JOB_DRAIN_SECONDS', '20'))
+# How long after submission a job may keep being deferred by RetryLaterError before deferrals count as attempts
+JOB_MAX_DEFER_SECONDS = float(os.getenv('JOB_MAX_DEFER_SECONDS', '3600'))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+TERMINAL_STATUSES = (DONE, FAILED)
+
+
+class PermanentJobError(Exception):
+    '''Raised by a job handler when retrying cannot help; the job is failed without further attempts.'''
+
+
+class RetryLaterError(Exception):
+    '''
+    Raised by a job handler when a shared dependency is down (e.g. a model provider behind an open circuit breaker).
+    The job is put back for `delay` seconds without using up an attempt, until JOB_MAX_DEFER_SECONDS after submission.
+    '''
+
+    def __init__(self, message: str, delay: float):
+        super().__init__(message)
+        self.delay = delay
+
+
+class SQLiteJobStore:
+    '''
+    Durable job queue backed by a local SQLite file.
+    Jobs survive a restart: anything left `running` by a crashed worker is put back on the queue at startup.
+    '''
+
+    def __init__(self, path: str = JOB_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connect()
+        with self._lock:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                '''CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    available_at REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )'''
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at, created_at)')
+
+    def _connect(self) -> None:
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+
+    def reopen(self) -> None:
+        '''Replaces the connection inherited from a parent process; SQLite connections must not be used across fork.'''
+        self._lock = threading.Lock()
+        self._connect()
+
+    @staticmethod
+    def _to_dict(row) -> dict | None:
+        if row is None:
+            return None
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def enqueue(self, kind: str, payload: dict) -> str:
+        '''Adds a job to the queue and returns its id.'''
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO jobs (id, kind, payload, status, available_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, kind, json.dumps(payload), QUEUED, now, now, now),
+            )
+        return job_id
+
+    def claim(self) -> dict | None:
+        '''Marks the oldest ready job as running and returns it, or None if nothing is ready.'''
+        now = time.time()
+        # One statement, so two processes sharing the file can never claim the same job
+        with self._lock:
+            row = self._conn.execute(
+                '''UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ?
+                   WHERE id = (SELECT id FROM jobs WHERE status = ? AND available_at <= ? ORDER BY created_at LIMIT 1)
+                   RETURNING *''',
+                (RUNNING, now, QUEUED, now),
+            ).fetchone()
+        return self._to_dict(row)
+
+    def complete(self, job_id: str, result: dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                'UPDATE jobs SET status = ?, result = ?, error = NULL, updated_at = ? WHERE id = ?',
+                (DONE, json.dumps(result), time.time(), job_id),
+            )
+
+    def retry(self, job_id: str, error: str, delay: float, refund_attempt: bool = False) -> None:
+        '''Puts a failed job back on the queue, not to be picked up for `delay` seconds, optionally not counting this attempt.'''
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'UPDATE jobs SET status = ?, error = ?, available_at = ?, updated_at = ?, attempts = attempts - ? WHERE id = ?',
+                (QUEUED, error, now + delay, now, 1 if refund_attempt else 0, job_id),
+            )
+
+    def fail(self, job_id: str, error: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                'UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?',
+                (FAILED, error, time.time(), job_id),
+            )
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return self._to_dict(row)
+
+    def next_available_at(self) -> float | None:
+        '''Returns when the next queued job becomes ready, so idle workers know how long to sleep.'''
+        with self._lock:
+            row = self._conn.execute('SELECT MIN(available_at) FROM jobs WHERE status = ?', (QUEUED,)).fetchone()
+        return row[0]
+
+    def requeue_running(self) -> int:
+        '''Returns jobs orphaned by a previous process to the queue.'''
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE jobs SET status = ?, available_at = ?, updated_at = ? WHERE status = ?',
+                (QUEUED, time.time(), time.time(), RUNNING),
+            )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JobWorkerPool:
+    '''
+    Runs queued jobs on a fixed number of asyncio workers, which caps how many run at once.
+    Failed jobs are retried with exponential backoff plus jitter until `max_attempts` is reached; jobs that raise
+    RetryLaterError wait the delay it asks for instead, without using up an attempt. When a job fails for good its
+    kind's `on_failure` callback gets the payload, so it can clean up what the job would have recorded.
+    '''
+
+    def __init__(self, store: SQLiteJobStore, workers: int = JOB_WORKERS, max_attempts: int = JOB_MAX_ATTEMPTS,
+                 retry_base: float = JOB_RETRY_BASE_SECONDS, retry_max: float = JOB_RETRY_MAX_SECONDS):
+        self.store = store
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self._handlers = {}
+        self._failure_handlers = {}
+        self._tasks: list[asyncio.Task] = []
+        self._wakeup: asyncio.Event | None = None
+        self._updates: dict[str, asyncio.Event] = {}
+        self._stopping = False
+
+    def register(self, kind: str, handler, on_failure=None) -> None:
+        '''
+        Registers the coroutine function that runs jobs of this kind. It receives the payload and returns a JSON-able result.
+        `on_failure`, if given, is awaited with the payload once a job of this kind has failed permanently.
+        '''
+        self._handlers[kind] = handler
+        if on_failure is not None:
+            self._failure_handlers[kind] = on_failure
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        if JOB_REQUEUE_ON_START:
+            requeued = await asyncio.to_thread(self.store.requeue_running)
+            if requeued:
+                logger.info("Requeued %s interrupted jobs", requeued)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, drain_seconds: float = JOB_DRAIN_SECONDS) -> None:
+        '''Stops claiming new jobs, gives running ones up to `drain_seconds` to finish, then cancels the rest.'''
+        self._stopping = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+        if self._tasks and drain_seconds > 0:
+            _, pending = await asyncio.wait(self._tasks, timeout=drain_seconds)
+            if pending:
+                logger.warning("Cancelling %s jobs still running after %.0fs drain", len(pending), drain_seconds)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, kind: str, payload: dict) -> str:
+        job_id = await asyncio.to_thread(self.store.enqueue, kind, payload)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    async def get(self, job_id: str) -> dict | None:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def wait_for_update(self, job_id: str, timeout: float) -> None:
+        '''Sleeps until the job changes state or the timeout passes.'''
+        event = self._updates.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _notify(self, job_id: str) -> None:
+        event = self._updates.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.retry_max, self.retry_base * (2 ** (attempts - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def _idle(self) -> None:
+        next_at = await asyncio.to_thread(self.store.next_available_at)
+        timeout = 5.0 if next_at is None else max(0.05, min(5.0, next_at - time.time()))
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _worker(self) -> None:
+        while not self._stopping:
+            # Clear before claiming so a submit that lands while we look is not missed
+            self._wakeup.clear()
+            job = await asyncio.to_thread(self.store.claim)
+            if job is None:
+                await self._idle()
+                continue
+
+            self._notify(job['id'])
+            handler = self._handlers.get(job['kind'])
+            try:
+                if handler is None:
+                    raise RuntimeError(f"No handler registered for job kind '{job['kind']}'")
+                with stage_timer(f"job.{job['kind']}"):
+                    result = await handler(job['payload'])
+                await asyncio.to_thread(self.store.complete, job['id'], result)
+            except asyncio.CancelledError:
+                raise
+            except RetryLaterError as e:
+                if time.time() - job['created_at'] < JOB_MAX_DEFER_SECONDS:
+                    logger.warning("Job %s deferred for %.0fs: %s", job['id'], e.delay, e)
+                    await asyncio.to_thread(self.store.retry, job['id'], str(e), e.delay, True)
+                else:
+                    await self._failed(job, e)
+            except Exception as e:
+                await self._failed(job, e)
+            self._notify(job['id'])
+
+    async def _failed(self, job: dict, e: Exception) -> None:
+        '''Retries a job that raised `e` with backoff, or fails it for good and runs its kind's on_failure callback.'''
+        handler = self._handlers.get(job['kind'])
+        if job['attempts'] < self.max_attempts and handler is not None and not isinstance(e, PermanentJobError):
+            delay = self._backoff(job['attempts'])
+            logger.warning("Job %s attempt %s failed: %s; retrying in %.1fs", job['id'], job['attempts'], e, delay)
+            await asyncio.to_thread(self.store.retry, job['id'], str(e), delay)
+            return
+
+        logger.error("Job %s failed permanently: %s", job['id'], e)
+        await asyncio.to_thread(self.store.fail, job['id'], str(e))
+        on_failure = self._failure_handlers.get(job['kind'])
+        if on_failure is not None:
+            try:
+                await on_failure(job['payload'])
+            except Exception as cleanup_error:
+                logger.error("Cleanup after job %s failed: %s", job['id'], cleanup_error)
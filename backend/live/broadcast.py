@@ -0,0 +1,292 @@
+import os
+import json
+import math
+import asyncio
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:
+    redis_asyncio = None
+
+from telemetry.logger import get_logger
+
+logger = get_logger('broadcast')
+
+# Messages buffered per subscriber; when a slow client's buffer is full the oldest message is dropped
+BROADCAST_QUEUE_SIZE = int(os.getenv('BROADCAST_QUEUE_SIZE', '64'))
+# A subscriber that has missed this many messages since it last read is disconnected
+BROADCAST_MAX_LAG = int(os.getenv('BROADCAST_MAX_LAG', '1000'))
+BROADCAST_MAX_SUBSCRIBERS = int(os.getenv('BROADCAST_MAX_SUBSCRIBERS', '10000'))
+# Set to share broadcasts between worker processes and servers; otherwise each process only reaches its own clients
+BROADCAST_REDIS_URL = os.getenv('BROADCAST_REDIS_URL')
+BROADCAST_CHANNEL = 'quakesafe:assessments'
+# Size of a fan-out grid cell in degrees; regions spanning more than MAX_REGION_CELLS cells are checked on every message
+DEFAULT_CELL_DEGREES = 0.5
+MAX_REGION_CELLS = 64
+
+
+class Subscription:
+    '''
+    One connected client: the region it is viewing and a bounded buffer of messages waiting to be sent.
+    get() returns ('assessment', message) pairs in order, preceded by a ('lagged', {"dropped": n}) notice when
+    older ones had to be dropped, so the client knows to catch up through /images/changes.
+    '''
+
+    def __init__(self, region: tuple | None, queue_size: int):
+        self.region = region
+        self.cells = ()
+        self.queue = asyncio.Queue(queue_size)
+        self.dropped = 0
+        self.closed = asyncio.Event()
+
+    def matches(self, latitude: float, longitude: float) -> bool:
+        if self.region is None:
+            return False
+        min_lat, min_lng, max_lat, max_lng = self.region
+        return min_lat <= latitude <= max_lat and min_lng <= longitude <= max_lng
+
+    def offer(self, message: str) -> None:
+        '''Queues a message without waiting, dropping the oldest queued message when the buffer is full.'''
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout: float) -> tuple[str, str] | None:
+        '''Returns the next (event, JSON message), or None if none arrived within `timeout` seconds or the subscription was closed.'''
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            return 'lagged', json.dumps({'dropped': dropped})
+        if not self.queue.empty():
+            return 'assessment', self.queue.get_nowait()
+        get = asyncio.ensure_future(self.queue.get())
+        closed = asyncio.ensure_future(self.closed.wait())
+        try:
+            await asyncio.wait((get, closed), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            closed.cancel()
+            if not get.done():
+                get.cancel()
+        return ('assessment', get.result()) if get.done() and not get.cancelled() else None
+
+
+class InMemoryPubSub:
+    '''Delivers published messages straight back to this process's subscribers.'''
+
+    name = 'memory'
+
+    def __init__(self):
+        self._deliver = None
+
+    async def start(self, deliver) -> None:
+        self._deliver = deliver
+
+    async def publish(self, message: str) -> None:
+        if self._deliver is not None:
+            self._deliver(message)
+
+    async def close(self) -> None:
+        self._deliver = None
+
+
+class RedisPubSub:
+    '''Publishes to a Redis channel that every worker subscribes to, so each one delivers to its own clients.'''
+
+    name = 'redis'
+
+    def __init__(self, url: str, channel: str = BROADCAST_CHANNEL):
+        self.channel = channel
+        self.redis = redis_asyncio.from_url(url)
+        self._listener = None
+
+    async def _listen(self, deliver) -> None:
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for item in pubsub.listen():
+                        if item['type'] == 'message':
+                            deliver(item['data'].decode())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Broadcast subscription to Redis failed, retrying: %s", e)
+                await asyncio.sleep(1)
+
+    async def start(self, deliver) -> None:
+        self._listener = asyncio.create_task(self._listen(deliver))
+
+    async def publish(self, message: str) -> None:
+        await self.redis.publish(self.channel, message)
+
+    async def close(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+        await self.redis.aclose()
+
+
+def build_pubsub(redis_url: str = BROADCAST_REDIS_URL):
+    '''Returns the Redis backend when BROADCAST_REDIS_URL is set and redis is installed, else the in-memory one.'''
+    if redis_url:
+        if redis_asyncio is not None:
+            return RedisPubSub(redis_url)
+        logger.error("BROADCAST_REDIS_URL is set but the redis package is not installed; broadcasting within this process only")
+    return InMemoryPubSub()
+
+
+class RegionBroadcaster:
+    '''
+    Fans each published message out to the subscribers whose region contains its coordinates.
+    Subscriptions are indexed by the grid cells their region covers, so a message only visits the subscribers
+    registered in its own cell, plus the few viewing very large regions. The message is serialised once and the
+    same string is queued for every match. Queues are bounded and never block the publisher. A slow client loses
+    its oldest messages and is told so, and one that falls more than `max_lag` behind is disconnected.
+    Listeners added with `add_listener` are called with every decoded event this process receives, its own
+    included, which lets each worker keep per-process state in step with writes made anywhere.
+    '''
+
+    def __init__(self, pubsub=None, cell_degrees: float = DEFAULT_CELL_DEGREES, queue_size: int = BROADCAST_QUEUE_SIZE,
+                 max_lag: int = BROADCAST_MAX_LAG, max_subscribers: int = BROADCAST_MAX_SUBSCRIBERS, dropped_counter=None):
+        self.pubsub = pubsub if pubsub is not None else build_pubsub()
+        self.cell_degrees = cell_degrees
+        self.queue_size = queue_size
+        self.max_lag = max_lag
+        self.max_subscribers = max_subscribers
+        self.dropped_counter = dropped_counter
+        self._cells: dict[tuple[int, int], set[Subscription]] = {}
+        self._wide: set[Subscription] = set()
+        self._subscriptions: set[Subscription] = set()
+        self._listeners = []
+        self.published = 0
+        self.delivered = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def _cell(self, latitude: float, longitude: float) -> tuple[int, int]:
+        return math.floor(latitude / self.cell_degrees), math.floor(longitude / self.cell_degrees)
+
+    def _region_cells(self, region: tuple) -> list[tuple[int, int]] | None:
+        '''The grid cells a region overlaps, or None when there are too many to index individually.'''
+        min_lat, min_lng, max_lat, max_lng = region
+        low_row, low_col = self._cell(min_lat, min_lng)
+        high_row, high_col = self._cell(max_lat, max_lng)
+        if (high_row - low_row + 1) * (high_col - low_col + 1) > MAX_REGION_CELLS:
+            return None
+        return [(row, col) for row in range(low_row, high_row + 1) for col in range(low_col, high_col + 1)]
+
+    def _unindex(self, subscription: Subscription) -> None:
+        self._wide.discard(subscription)
+        for cell in subscription.cells:
+            members = self._cells.get(cell)
+            if members is not None:
+                members.discard(subscription)
+                if not members:
+                    del self._cells[cell]
+        subscription.cells = ()
+
+    def subscribe(self, region: tuple | None = None) -> Subscription:
+        '''Registers a subscriber for `region` (min_lat, min_lng, max_lat, max_lng), or for nothing until set_region.'''
+        if len(self._subscriptions) >= self.max_subscribers:
+            raise OverflowError("Too many live subscribers")
+        subscription = Subscription(None, self.queue_size)
+        self._subscriptions.add(subscription)
+        self.set_region(subscription, region)
+        return subscription
+
+    def set_region(self, subscription: Subscription, region: tuple | None) -> None:
+        '''Moves a subscriber to a new region, e.g. when the map it is showing is panned or zoomed.'''
+        self._unindex(subscription)
+        subscription.region = region
+        if region is None or subscription not in self._subscriptions:
+            return
+        cells = self._region_cells(region)
+        if cells is None:
+            self._wide.add(subscription)
+            return
+        subscription.cells = tuple(cells)
+        for cell in cells:
+            self._cells.setdefault(cell, set()).add(subscription)
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._unindex(subscription)
+        self._subscriptions.discard(subscription)
+        subscription.closed.set()
+
+    def add_listener(self, listener) -> None:
+        '''Calls `listener(event)` for every event received from the backend, before it is fanned out to subscribers.'''
+        self._listeners.append(listener)
+
+    def _notify(self, event: dict) -> None:
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error("Broadcast listener failed: %s", e)
+
+    def _deliver(self, message: str) -> None:
+        '''Backend callback: hands a published message to the listeners and queues it for every subscriber whose region contains it.'''
+        try:
+            event = json.loads(message)
+            latitude, longitude = float(event['latitude']), float(event['longitude'])
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning("Ignoring malformed broadcast message: %s", e)
+            return
+
+        self._notify(event)
+
+        candidates = self._cells.get(self._cell(latitude, longitude), set()) | self._wide
+        for subscription in candidates:
+            if not subscription.matches(latitude, longitude):
+                continue
+            dropped = subscription.dropped
+            subscription.offer(message)
+            self.delivered += 1
+            if subscription.dropped > dropped and self.dropped_counter is not None:
+                self.dropped_counter.inc('lagged')
+            if subscription.dropped > self.max_lag:
+                logger.warning("Disconnecting a live subscriber that fell %s messages behind", subscription.dropped)
+                self.evicted += 1
+                if self.dropped_counter is not None:
+                    self.dropped_counter.inc('evicted')
+                self.unsubscribe(subscription)
+
+    async def start(self) -> None:
+        await self.pubsub.start(self._deliver)
+
+    async def publish(self, event: dict) -> bool:
+        '''
+        Publishes an event with `latitude` and `longitude` to every worker. Failures are logged, not raised, and
+        return False; the listeners of this process are then called directly so at least its own state is updated.
+        '''
+        if event.get('latitude') is None or event.get('longitude') is None:
+            return False
+        try:
+            await self.pubsub.publish(json.dumps(event))
+            self.published += 1
+            return True
+        except Exception as e:
+            logger.error("Failed to publish live assessment: %s", e)
+            self._notify(event)
+            return False
+
+    async def close(self) -> None:
+        for subscription in list(self._subscriptions):
+            self.unsubscribe(subscription)
+        await self.pubsub.close()
+
+    def stats(self) -> dict:
+        return {
+            'backend': self.pubsub.name,
+            'subscribers': len(self._subscriptions),
+            'indexed_cells': len(self._cells),
+            'wide_subscribers': len(self._wide),
+            'published': self.published,
+            'delivered': self.delivered,
+            'evicted': self.evicted,
+        }
@@ -0,0 +1,137 @@
+'''
+Earthquake-safety assessment of one stored photo by Claude: the prompt, the request, parsing the answer and the
+emergency action it implies. Shared by the /analyze jobs in main.py and the offline re-scoring in rescore.py.
+'''
+from telemetry.logger import get_logger
+
+logger = get_logger('llm')
+
+ASSESSMENT_MODEL = 'claude-3-5-haiku-20241022'
+ASSESSMENT_MAX_TOKENS = 200
+ASSESSMENT_PROMPT = (
+    "You are an earthquake safety specialist. "
+    "Assess uploaded city images for earthquake risks: falling debris, unstable structures, blocked exits. "
+    "For each image, list up to 3 short bullet points with specific safety improvements. "
+    "Then give:\n\n"
+    "- Description: (your 3 bullets in one line)\n"
+    "- Score: (0–100 overall safety score)\n"
+    "- Magnitude Survivability: (highest earthquake magnitude survivable, e.g., 7.5)\n\n"
+    "Format your response exactly as shown, with no extra commentary."
+)
+
+
+class AssessmentError(Exception):
+    '''Raised when Claude answered but the answer holds no usable assessment.'''
+
+
+async def request_assessment(provider, image_url: str) -> dict:
+    '''
+    Asks Claude, through `provider` (a ResilientProvider), to assess the image at `image_url` and returns the parsed
+    analysis. Provider errors, including ProviderUnavailable while its breaker is open, are raised unchanged.
+    '''
+    logger.debug("Creating Claude API request...")
+    response = await provider.call(
+        provider.client.messages.create,
+        model=ASSESSMENT_MODEL,
+        max_tokens=ASSESSMENT_MAX_TOKENS,
+        system=ASSESSMENT_PROMPT,
+        messages=[
+            {
+                'role': 'user',
+                'content': [
+                    {
+                        'type': 'image',
+                        'source': {
+                            'type': 'url',
+                            'url': image_url,
+                        },
+                    },
+                    {
+                        'type': 'text',
+                        'text': "Analyze this image for earthquake safety risks."
+                    }
+                ]
+            }
+        ]
+    )
+    logger.info("Claude API request completed")
+    logger.debug("Claude response: %s", response)
+
+    # Check if response has content
+    if not hasattr(response, 'content') or not response.content:
+        raise AssessmentError("No content returned from the Claude API.")
+
+    response_text = response.content[0].text
+    logger.debug("Claude response text: %s", response_text)
+
+    parsed_data = parse_claude_response(response_text)
+    if not parsed_data:
+        raise AssessmentError("Failed to parse the Claude API response.")
+    return parsed_data
+
+
+def parse_claude_response(response_text: str) -> dict:
+    '''Parses the response from Claude and returns it in a structured dictionary'''
+
+    # Handling unexpected or malformed response
+    data = {}
+    try:
+        logger.debug("Processing text: %s", response_text)
+        lines = response_text.strip().splitlines()
+
+        for line in lines:
+            line = line.strip()
+            # Use string.startswith() or string.find() instead of "contains"
+            if line.startswith('Description:'):
+                data['Description'] = line[len('Description:'):].strip()
+                logger.debug("Found Description: %s", data['Description'])
+            elif line.startswith('Score:'):
+                score_text = line[len('Score:'):].strip()
+                # Handle different possible formats (e.g., "Score: 45/100")
+                if '/' in score_text:
+                    score_text = score_text.split('/')[0].strip()
+                try:
+                    data['Score'] = int(score_text)
+                    logger.debug("Found Score: %s", data['Score'])
+                except ValueError:
+                    # If we can't parse as int, store as string
+                    data['Score'] = score_text
+                    logger.debug("Found Score (not int): %s", data['Score'])
+            elif line.startswith('Magnitude Survivability:'):
+                data['Magnitude Survivability'] = line[len('Magnitude Survivability:'):].strip()
+                logger.debug("Found Magnitude: %s", data['Magnitude Survivability'])
+
+        # If the response is just a single line containing all information
+        # (like in your example "Description: Aging historic building...")
+        if not data and len(lines) == 1:
+            data['Description'] = lines[0]
+            # Default values when we only have description
+            data['Score'] = 0
+            data['Magnitude Survivability'] = 'Unknown'
+            logger.debug("Using single line as Description with default values")
+
+        # If we fail to parse the expected keys, we return an empty dict
+        if not data:
+            logger.debug("No data found in response")
+            raise ValueError("Parsed data is empty or incomplete.")
+
+    except Exception as e:
+        logger.error("Error parsing Claude response: %s", e)
+        return None
+
+    logger.debug("Final parsed data: %s", data)
+    return data
+
+
+def determine_action(magnitude_survivability) -> str:
+    '''Maps the estimated survivable magnitude onto the emergency action recorded for the user.'''
+    try:
+        magnitude_value = float(magnitude_survivability)
+        if magnitude_value < 6.0:  # Example threshold for emergency action
+            return "Leave Immediately"
+        elif magnitude_value < 7.0:
+            return "Caution: Building Needs Strengthening"
+        else:
+            return "Safe"
+    except ValueError:
+        return "Unable to determine action due to invalid magnitude value"
@@ -0,0 +1,55 @@
+TIMING_MARKER = '\nTiming:'
+
+
+class TimingStreamParser:
+    '''
+    Splits a streamed chat completion into the answer text and the trailing "Timing: <before/during/after>" label.
+    Text is released as soon as it can no longer be the start of the marker, so callers can forward it immediately.
+    '''
+
+    def __init__(self, marker: str = TIMING_MARKER):
+        self.marker = marker
+        self._pending = ''
+        self._answer = []
+        self._timing = []
+        self._in_timing = False
+
+    def _held_back(self, text: str) -> int:
+        '''Length of the longest suffix of `text` that is a prefix of the marker.'''
+        for length in range(min(len(text), len(self.marker) - 1), 0, -1):
+            if self.marker.startswith(text[-length:]):
+                return length
+        return 0
+
+    def feed(self, delta: str) -> str:
+        '''Consumes the next chunk of model output and returns the answer text that is safe to forward.'''
+        if self._in_timing:
+            self._timing.append(delta)
+            return ''
+
+        text = self._pending + delta
+        index = text.find(self.marker)
+        if index != -1:
+            self._in_timing = True
+            self._pending = ''
+            self._timing.append(text[index + len(self.marker):])
+            released = text[:index]
+        else:
+            held = self._held_back(text)
+            self._pending = text[len(text) - held:] if held else ''
+            released = text[:len(text) - held]
+        self._answer.append(released)
+        return released
+
+    def flush(self) -> str:
+        '''Releases any held-back answer text once the stream has ended.'''
+        if self._in_timing or not self._pending:
+            return ''
+        pending = self._pending
+        self._answer.append(pending)
+        self._pending = ''
+        return pending
+
+    def result(self) -> tuple[str, str]:
+        '''Returns the full (answer, timing) pair; call after flush().'''
+        return ''.join(self._answer).strip(), ''.join(self._timing).strip()
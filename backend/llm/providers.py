@@ -0,0 +1,201 @@
+import os
+import time
+import random
+import asyncio
+from telemetry.logger import get_logger
+from telemetry.metrics import stage_timer
+
+logger = get_logger('llm')
+
+LLM_TIMEOUT_SECONDS = float(os.getenv('LLM_TIMEOUT_SECONDS', '30'))
+LLM_MAX_ATTEMPTS = int(os.getenv('LLM_MAX_ATTEMPTS', '3'))
+LLM_RETRY_BASE_SECONDS = float(os.getenv('LLM_RETRY_BASE_SECONDS', '0.5'))
+LLM_RETRY_MAX_SECONDS = float(os.getenv('LLM_RETRY_MAX_SECONDS', '8'))
+# Start a second, duplicate request when the first has not answered after this many seconds (unset = no hedging)
+LLM_HEDGE_AFTER_SECONDS = float(os.getenv('LLM_HEDGE_AFTER_SECONDS', '0')) or None
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('LLM_BREAKER_FAILURES', '5'))
+BREAKER_RESET_SECONDS = float(os.getenv('LLM_BREAKER_RESET_SECONDS', '30'))
+
+# Point the SDKs at a local fake provider server, e.g. benchmarks/fake_llm_server.py
+CLAUDE_BASE_URL = os.getenv('CLAUDE_BASE_URL') or None
+GROQ_BASE_URL = os.getenv('GROQ_BASE_URL') or None
+
+RETRYABLE_STATUS_CODES = (408, 409, 429)
+RETRYABLE_ERROR_NAMES = ('APITimeoutError', 'APIConnectionError')
+
+
+class ProviderUnavailable(Exception):
+    '''Raised without calling the provider while its circuit breaker is open.'''
+
+
+def is_retryable(error: Exception) -> bool:
+    '''Timeouts, connection failures, rate limits and 5xx responses are worth another attempt; 4xx request errors are not.'''
+    if isinstance(error, asyncio.TimeoutError) or type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    status_code = getattr(error, 'status_code', None)
+    return status_code is not None and (status_code in RETRYABLE_STATUS_CODES or status_code >= 500)
+
+
+class CircuitBreaker:
+    '''
+    Opens after `failure_threshold` consecutive provider failures and rejects calls for `reset_seconds`.
+    After that a single trial call is let through; its outcome closes or re-opens the circuit.
+    '''
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return 'half_open'
+        return 'open'
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half_open' and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def record_abandoned(self) -> None:
+        '''A call ended with no verdict on the provider (e.g. it was cancelled); let the next caller run the trial.'''
+        self._trial_in_flight = False
+
+
+class ResilientProvider:
+    '''
+    Wraps one long-lived async SDK client (and therefore one pooled HTTP connection set) with
+    per-call timeouts, retries with full jitter, a circuit breaker and optional request hedging.
+    The client is built by `client_factory` on first use, so a missing API key only fails the calls that need it.
+    '''
+
+    def __init__(self, name: str, client_factory, timeout: float = LLM_TIMEOUT_SECONDS, max_attempts: int = LLM_MAX_ATTEMPTS,
+                 retry_base: float = LLM_RETRY_BASE_SECONDS, retry_max: float = LLM_RETRY_MAX_SECONDS,
+                 hedge_after: float | None = LLM_HEDGE_AFTER_SECONDS, breaker: CircuitBreaker = None):
+        self.name = name
+        self._client_factory = client_factory
+        self._client = None
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self._client_factory()
+        return self._client
+
+    def warm_up(self) -> None:
+        '''Imports the SDK and builds the client ahead of the first call. Blocking; run it off the event loop.'''
+        self.client
+
+    async def _attempt(self, func, kwargs):
+        with stage_timer(f"llm.{self.name}"):
+            return await asyncio.wait_for(func(**kwargs), self.timeout)
+
+    async def _hedged_attempt(self, func, kwargs):
+        '''Runs one attempt; if it is still pending after `hedge_after`, races a duplicate and keeps the first success.'''
+        primary = asyncio.create_task(self._attempt(func, kwargs))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        if done:
+            return primary.result()
+
+        pending = {primary, asyncio.create_task(self._attempt(func, kwargs))}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, func, **kwargs):
+        '''Calls an async SDK method (e.g. client.messages.create) with the provider's resilience policy.'''
+        for attempt in range(1, self.max_attempts + 1):
+            if not self.breaker.allow():
+                raise ProviderUnavailable(f"{self.name} is temporarily unavailable")
+            try:
+                if self.hedge_after:
+                    result = await self._hedged_attempt(func, kwargs)
+                else:
+                    result = await self._attempt(func, kwargs)
+            except Exception as e:
+                if not is_retryable(e):
+                    # The provider answered; the request itself was bad
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.max_attempts:
+                    raise
+                delay = random.uniform(0, min(self.retry_max, self.retry_base * (2 ** (attempt - 1))))
+                logger.warning("%s attempt %s failed (%s); retrying in %.2fs", self.name, attempt, type(e).__name__, delay)
+                await asyncio.sleep(delay)
+            except BaseException:
+                # Cancelled by a client disconnect or an outer timeout; without this a half-open trial never ends
+                self.breaker.record_abandoned()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+
+    def stats(self) -> dict:
+        return {'breaker_state': self.breaker.state, 'consecutive_failures': self.breaker.failures}
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+# The SDKs are imported inside the factories: anthropic alone takes over a second to import, which would
+# otherwise be paid by every cold start before the first request is served
+
+def _claude_client(api_key: str):
+    import anthropic
+    # Retries are handled by ResilientProvider, so the SDK's own retry loop is disabled
+    return anthropic.AsyncAnthropic(api_key=api_key, base_url=CLAUDE_BASE_URL, timeout=LLM_TIMEOUT_SECONDS, max_retries=0)
+
+
+def _groq_client(api_key: str):
+    from groq import AsyncGroq
+    return AsyncGroq(api_key=api_key, base_url=GROQ_BASE_URL, timeout=LLM_TIMEOUT_SECONDS, max_retries=0)
+
+
+def build_claude_provider(api_key: str) -> ResilientProvider:
+    return ResilientProvider('claude', lambda: _claude_client(api_key))
+
+
+def build_groq_provider(api_key: str) -> ResilientProvider:
+    return ResilientProvider('groq', lambda: _groq_client(api_key))
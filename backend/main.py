@@ -1,33 +1,51 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
-import uvicorn
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, WebSocket, WebSocketDisconnect
 from uuid import uuid4
-import boto3
-import anthropic
 import uuid
 from dotenv import load_dotenv
 import os
 from pydantic import BaseModel
-from db.supabase_client import insert_image_entry, insert_safety_assessment, fetch_all_images, get_image_by_id, get_safety_assessment_by_image, insert_chat_message, insert_emergency_action
-from supabase import create_client
-from typing import Optional
+from db.async_supabase_client import insert_image_entry, insert_safety_assessment, fetch_all_images, get_image_by_id, get_safety_assessment_by_image, insert_chat_message, insert_emergency_action, fetch_images_page, fetch_assessments_page, get_images_with_latest_assessment, delete_image_entry, record_analysis, FunctionNotFound, get_images_by_user, get_safety_assessments_by_user, get_chat_messages_by_user, get_emergency_actions_by_user
+from spatial.grid_index import SpatialIndex, MAP_COLUMNS, tile_to_bbox
+from spatial.clustering import ClusterIndex, MAX_CLUSTER_ZOOM
+from spatial.heatmap import HeatmapIndex, HEATMAP_RECORD, SURVIVABILITY_LABELS, precision_for_zoom, MIN_GEOHASH_PRECISION, MAX_GEOHASH_PRECISION
+from spatial.changes import ChangeLog, CHANGE_RECORD
+from live.broadcast import RegionBroadcaster
+from storage.s3 import AsyncS3Storage
+from cache.assessment_cache import AssessmentCache
+from cache.semantic_cache import SemanticAnswerCache
+from cache.response_cache import ResponseCache, CachedResponse
+from db.invalidation import on_write
+from imaging.normalize import normalize_image, rendition_key, get_image_executor, shutdown_image_executor, THUMBNAIL_SIZES
+from middleware.upload_limit import UploadSizeLimitMiddleware
+from jobs.queue import SQLiteJobStore, JobWorkerPool, PermanentJobError, RetryLaterError, QUEUED, FAILED, TERMINAL_STATUSES
+from db.connection import init_supabase, get_supabase, close_supabase
+from typing import Optional, List
 from fastapi.middleware.cors import CORSMiddleware
-from PIL import Image
+from fastapi.responses import StreamingResponse, Response
 import io
-from groq import Groq
+import json
+import time
+import base64
+import asyncio
+from datetime import datetime, timezone
+from llm.providers import build_claude_provider, build_groq_provider, ProviderUnavailable
+from llm.chat_stream import TimingStreamParser
+from llm.assessment import request_assessment, determine_action
+from starlette.background import BackgroundTask
+from telemetry.logger import get_logger
+from telemetry.metrics import registry as metrics_registry, HTTP_REQUEST_SECONDS, ADMISSION_QUEUE_SECONDS, ADMISSION_REJECTED, BROADCAST_DROPPED
+from middleware.request_metrics import RequestMetricsMiddleware
+from middleware.admission import AdmissionController, AdmissionControlMiddleware, TrafficClass
+from fastapi.responses import PlainTextResponse
+
+logger = get_logger('api')
 
 app = FastAPI()
 load_dotenv()
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
 S3_BUCKET = os.getenv('S3_BUCKET')
 AWS_REGION = os.getenv('AWS_REGION')
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')  # e.g. a local moto server or MinIO
 CLAUDE_API_KEY = os.getenv('CLAUDE_API_KEY')
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
@@ -36,157 +54,459 @@ GROQ_API_KEY = os.getenv('GROQ_API_KEY')
 SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 
-s3_client = boto3.client('s3', region_name=AWS_REGION)
-claude_client = anthropic.Anthropic(api_key=CLAUDE_API_KEY)
+s3_storage = AsyncS3Storage(S3_BUCKET, region=AWS_REGION, endpoint_url=S3_ENDPOINT_URL)
+# Long-lived async model clients with timeouts, retries, circuit breaking and optional hedging
+claude_provider = build_claude_provider(CLAUDE_API_KEY)
+groq_provider = build_groq_provider(GROQ_API_KEY)
+
+# Perceptual-hash cache of Claude assessments so re-uploads of the same scene skip the model call
+assessment_cache = AssessmentCache()
+# Embedding-similarity cache of chat answers so rephrasings of common safety questions skip Groq
+chat_cache = SemanticAnswerCache()
+# Read-through cache for the image and assessment read endpoints, invalidated by the DB insert helpers
+response_cache = ResponseCache()
+
+on_write(response_cache.invalidate_write)
+
+async def cached_json(request: Request, key: str, tags: list, load, cache_if=None):
+    '''
+    Serves `key` from the response cache (as a 304 when the client's ETag is current), otherwise awaits `load()`
+    for the payload and caches it unless `cache_if(payload)` is false. Concurrent misses for a key share one load.
+    '''
+    result = await response_cache.fetch(key, tags, load, cache_if)
+    if not isinstance(result, CachedResponse):
+        return result
+    return result.to_response(request.headers.get('if-none-match'), request.headers.get('accept-encoding', ''))
+
+# Durable queue that runs the Claude assessment for /analyze off the request path
+job_pool = JobWorkerPool(SQLiteJobStore())
+ANALYZE_JOB = 'analyze_image'
+ANALYZE_BATCH_JOB = 'analyze_batch'
+MAX_BATCH_FILES = int(os.getenv('MAX_BATCH_FILES', '50'))
+MAX_UPLOAD_BYTES = int(os.getenv('MAX_UPLOAD_MB', '20')) * 1024 * 1024
+MAX_BATCH_UPLOAD_BYTES = int(os.getenv('MAX_BATCH_UPLOAD_MB', '200')) * 1024 * 1024
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# Refuse oversized bodies while they stream in, before multipart parsing spools them to disk
+app.add_middleware(UploadSizeLimitMiddleware, limits={
+    '/analyze/batch': MAX_BATCH_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+    '/analyze': MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+})
+# Surge protection: per-client rate limits and concurrency caps per class, with freed slots going to emergency
+# guidance first, then reads, then uploads. Requests that would queue past their class target get a 429 + Retry-After.
+admission = AdmissionController([
+    TrafficClass('guidance', priority=0, max_concurrency=64, rate=0.5, burst=10, max_queue_seconds=10),
+    TrafficClass('read', priority=1, max_concurrency=96, rate=20, burst=60, max_queue_seconds=2),
+    TrafficClass('upload', priority=2, max_concurrency=8, rate=0.1, burst=5, max_queue_seconds=1),
+])
+app.add_middleware(AdmissionControlMiddleware, controller=admission, default='read', routes={
+    '/chat': 'guidance',
+    '/analyze': 'upload',
+    # Job polling, stats and metrics are cheap and must keep answering during a surge
+    '/jobs': None,
+    '/healthz': None,
+    '/metrics': None,
+    '/admission': None,
+    '/chat_cache': None,
+    '/assessment_cache': None,
+    '/response_cache': None,
+    '/providers': None,
+    # Live streams stay open for the whole session, so they would pin a read slot each
+    '/live': None,
+}, queue_histogram=ADMISSION_QUEUE_SECONDS, rejected_counter=ADMISSION_REJECTED)
+# Wraps the upload limit and admission control, so requests they reject are timed too
+app.add_middleware(RequestMetricsMiddleware, histogram=HTTP_REQUEST_SECONDS)
+# Added last so it is the outermost layer: 429s and 413s from the middleware above also carry CORS headers
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+BATCH_LLM_CONCURRENCY = int(os.getenv('BATCH_LLM_CONCURRENCY', '4'))
+# 'rpc' writes an analysis in one transaction via db/migrations/record_analysis.sql; 'pipelined' uses plain inserts
+# for databases without that function, undoing the image row if its assessment cannot be written.
+# 'rpc' switches itself to 'pipelined' the first time the database reports the function missing
+ANALYSIS_WRITE_MODE = os.getenv('ANALYSIS_WRITE_MODE', 'rpc')
+analysis_write_mode = ANALYSIS_WRITE_MODE
+JOB_EVENTS_KEEPALIVE_SECONDS = 15
+# A job may run in a sibling worker process, whose updates cannot wake this one, so event streams also re-poll
+JOB_EVENTS_POLL_SECONDS = float(os.getenv('JOB_EVENTS_POLL_SECONDS', '1'))
+# Import the model SDKs and build the S3/model clients in the background after startup instead of on the first request
+WARM_UP_ON_START = os.getenv('WARM_UP_ON_START', '1') == '1'
+
+# In-memory index of image locations and per-zoom cluster aggregates, loaded at startup and kept in sync by /analyze
+spatial_index = SpatialIndex()
+cluster_index = ClusterIndex()
+# Per-geohash rollups of safety score and survivable magnitude, rebuilt at startup and updated by the analysis jobs
+heatmap_index = HeatmapIndex()
+# Sequence of added or re-assessed map points behind /images/changes, seeded with every image at startup
+change_log = ChangeLog()
+INDEX_LOAD_PAGE_SIZE = 1000
+MAX_VIEWPORT_LIMIT = 2000
+# Viewports covering more grid cells than this (about 0.5 x 0.5 degrees) get use_clusters instead of markers
+MAX_VIEWPORT_CELLS = int(os.getenv('MAX_VIEWPORT_CELLS', '2500'))
+MAX_CHANGES_LIMIT = int(os.getenv('MAX_CHANGES_LIMIT', '5000'))
+# Pushes each completed assessment to the clients viewing its region; shared across workers when BROADCAST_REDIS_URL is set
+broadcaster = RegionBroadcaster(dropped_counter=BROADCAST_DROPPED)
+LIVE_KEEPALIVE_SECONDS = 15
+
+async def load_latest_assessments(supabase_client) -> dict:
+    '''Pages through the safety assessments once, returning the most recent assessment row per image id.'''
+    latest = {}
+    after_id = None
+    while True:
+        rows = await fetch_assessments_page(supabase_client, 'id,image_id,safety_score,estimated_magnitude_survivability,created_at', after_id, INDEX_LOAD_PAGE_SIZE)
+        if rows is None:
+            raise RuntimeError(f"Reading safety assessments after {after_id} failed")
+        for row in rows:
+            current = latest.get(row['image_id'])
+            if current is None or (row.get('created_at') or '') >= (current.get('created_at') or ''):
+                latest[row['image_id']] = row
+        if len(rows) < INDEX_LOAD_PAGE_SIZE:
+            break
+        after_id = rows[-1]['id']
+    return latest
+
+@app.on_event('startup')
+async def connect_supabase():
+    '''Creates the process-wide Supabase client that every request shares.'''
+    await init_supabase(SUPABASE_URL, SUPABASE_KEY)
+    loaded = await asyncio.to_thread(chat_cache.load)
+    logger.info("Chat cache loaded with %s answers", loaded)
+
+def warm_up_clients() -> None:
+    '''Builds the lazily created model and S3 clients so the first upload or chat does not pay for the SDK imports.'''
+    for name, warm_up in (('claude', claude_provider.warm_up), ('groq', groq_provider.warm_up), ('s3', s3_storage.warm_up)):
+        start = time.perf_counter()
+        try:
+            warm_up()
+            logger.info("Warmed up %s client in %.0f ms", name, (time.perf_counter() - start) * 1000)
+        except Exception as e:
+            logger.warning("Warm-up of %s client failed: %s", name, e)
+
+_background_tasks = set()
+
+@app.on_event('startup')
+async def start_warm_up():
+    '''Runs warm_up_clients on a thread once startup completes, so it does not delay the first request being accepted.'''
+    if WARM_UP_ON_START:
+        task = asyncio.create_task(asyncio.to_thread(warm_up_clients))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+@app.on_event('startup')
+async def start_broadcaster():
+    await broadcaster.start()
+
+@app.on_event('shutdown')
+async def disconnect_supabase():
+    await broadcaster.close()
+    await job_pool.stop()
+    await close_supabase()
+    await claude_provider.close()
+    await groq_provider.close()
+    shutdown_image_executor()
+    s3_storage.close()
+    await response_cache.close()
+    try:
+        await asyncio.to_thread(chat_cache.save)
+    except OSError as e:
+        logger.error("Failed to save chat cache: %s", e)
+
+@app.on_event('startup')
+async def load_map_indexes():
+    '''
+    Pages through the images table once (map columns only) to build the spatial index, cluster levels and heatmap.
+    A failed read stops startup: serving a map that silently lacks part of the table is worse than restarting.
+    Assessments published on the broadcaster feed meanwhile are held back and applied once the load is complete.
+    '''
+    global _pending_map_events
+    try:
+        supabase_client = get_supabase()
+        assessments = await load_latest_assessments(supabase_client)
+        latitudes, longitudes, scores, magnitudes = [], [], [], []
+        after_id = None
+        while True:
+            rows = await fetch_images_page(supabase_client, ','.join(MAP_COLUMNS), after_id, INDEX_LOAD_PAGE_SIZE)
+            if rows is None:
+                raise RuntimeError(f"Reading images after {after_id} failed")
+            for row in rows:
+                if spatial_index.insert(row):
+                    assessment = assessments.get(row['id'], {})
+                    cluster_index.add(row['latitude'], row['longitude'], assessment.get('safety_score'))
+                    change_log.record({
+                        **row,
+                        'safety_score': assessment.get('safety_score'),
+                        'estimated_magnitude_survivability': assessment.get('estimated_magnitude_survivability'),
+                    })
+                    if not assessment:
+                        _unscored_image_ids.add(str(row['id']))
+                    else:
+                        latitudes.append(float(row['latitude']))
+                        longitudes.append(float(row['longitude']))
+                        scores.append(assessment.get('safety_score'))
+                        magnitudes.append(assessment.get('estimated_magnitude_survivability'))
+            if len(rows) < INDEX_LOAD_PAGE_SIZE:
+                break
+            after_id = rows[-1]['id']
+        await asyncio.to_thread(heatmap_index.rebuild, latitudes, longitudes, scores, magnitudes)
+        pending, _pending_map_events = _pending_map_events, None
+        for event in pending:
+            apply_map_event(event)
+        logger.info("Map indexes loaded with %s images, heatmap with %s assessments, %s feed events applied, change log at %s",
+                    len(spatial_index), len(latitudes), len(pending), change_log.cursor)
+    except Exception as e:
+        logger.error("Failed to load map indexes: %s", e)
+        raise
+
+@app.on_event('startup')
+async def start_job_workers():
+    '''
+    Starts the analysis job workers. Registered after load_map_indexes so no job writes an image while the table
+    is still being read into the map indexes.
+    '''
+    await job_pool.start()
 
 async def upload_to_s3(file: UploadFile):
     '''Inserts a newly uploaded user image to the AWS S3 Bucket, returning its unique filename.'''
 
     # Generate a unique filename
     filename = f'{uuid.uuid4()}.jpg'
-    s3_client.upload_fileobj(
-        file.file,
-        S3_BUCKET,
-        filename,
-        ExtraArgs={'ContentType': file.content_type, 'ACL': 'private'}  # ensure object is private
-    )
-    return filename
+    return await s3_storage.upload(file.file, filename, content_type=file.content_type, acl='private')
 
 async def generate_unique_url(filename: str, expiration=3600) -> str:
     '''Generates a presigned URL for the specified file, allowing the Claude client to access the image.'''
-    return s3_client.generate_presigned_url(
-        'get_object',
-        Params={'Bucket': S3_BUCKET, 'Key': filename},
-        ExpiresIn=expiration
-    )
+    return await s3_storage.presign(filename, expiration)
 
 async def generate_public_url(filename: str) -> str:
-    return f"https://{S3_BUCKET}.s3.amazonaws.com/{filename}"
-
-async def analyze_image_with_claude(image_url: str):
-    '''Passes in the user image to the Claude AI agent for analysis, returning the analysis as a dict'''
-
-    prompt = (
-        "You are an earthquake safety specialist. "
-        "Assess uploaded city images for earthquake risks: falling debris, unstable structures, blocked exits. "
-        "For each image, list up to 3 short bullet points with specific safety improvements. "
-        "Then give:\n\n"
-        "- Description: (your 3 bullets in one line)\n"
-        "- Score: (0–100 overall safety score)\n"
-        "- Magnitude Survivability: (highest earthquake magnitude survivable, e.g., 7.5)\n\n"
-        "Format your response exactly as shown, with no extra commentary."
-    )
+    return s3_storage.public_url(filename)
+
+def live_assessment_event(image: dict, assessment: dict, action_taken: str) -> dict:
+    '''The message pushed to live map clients for one newly assessed image.'''
+    return {
+        'image_id': image['id'],
+        'latitude': image['latitude'],
+        'longitude': image['longitude'],
+        'location_name': image['location_name'],
+        'image_url': image['image_url'],
+        'safety_score': assessment['safety_score'],
+        'estimated_magnitude_survivability': assessment['estimated_magnitude_survivability'],
+        'action_taken': action_taken,
+    }
+
+async def assess_image(filename: str, image_hash: int) -> dict:
+    '''
+    Returns the Claude assessment of a stored image, reusing the cached one for duplicates. Raises if the model call
+    fails; while Claude's circuit breaker is open that is RetryLaterError, so the job waits out the outage.
+    '''
+    # Reuse the assessment of an identical or near-identical photo when we have one
+    image_analysis = assessment_cache.get(image_hash)
+    if image_analysis is not None:
+        logger.info("Reusing cached assessment for a duplicate image")
+        return dict(image_analysis)
+
+    logger.debug("Generating presigned URL...")
+    image_url = await generate_unique_url(filename)
 
+    # Analyze the image with Claude
+    logger.debug("Sending image to Claude for analysis...")
     try:
-        print("[LOG] Creating Claude API request...")
-        
-        response = claude_client.messages.create(
-            model='claude-3-5-haiku-20241022',
-            max_tokens=200,
-            system=prompt,  
-            messages=[
-                {
-                    'role': 'user',
-                    'content': [
-                        {
-                            'type': 'image',
-                            'source': {
-                                'type': 'url',
-                                'url': image_url,
-                            },
-                        },
-                        {
-                            'type': 'text',
-                            'text': "Analyze this image for earthquake safety risks."
-                        }
-                    ]
-                }
-            ]
-        )
-        print("[LOG] Claude API request completed")
+        image_analysis = await request_assessment(claude_provider, image_url)
+    except ProviderUnavailable as e:
+        raise RetryLaterError(str(e), delay=claude_provider.breaker.reset_seconds) from e
+    logger.debug("Claude analysis complete: %s", image_analysis)
+    assessment_cache.put(image_hash, dict(image_analysis))
+    return image_analysis
 
-        # Debug response
-        print(f"[LOG] Claude response: {response}")
-        
-        # Check if response has content
-        if not hasattr(response, 'content') or not response.content:
-            print("[ERROR] No content in response from Claude API")
-            return {"error": "No content returned from the Claude API."}
+async def write_analysis(supabase_client, image: dict, assessment: dict, action_taken: str) -> bool:
+    '''
+    Writes the image row, its safety assessment and the emergency action for one analysis.
+    Returns True when an earlier attempt had already recorded this image id and nothing new was written.
+    In 'rpc' mode this is one round-trip and one transaction, and replaying an image id that was already recorded
+    is a no-op, so the job can always be retried. In 'pipelined' mode the image, the assessment and the action are
+    inserted in turn; if the assessment fails the image row is deleted before the job is retried, and no action
+    has been written yet.
+    The emergency action is an audit record, so its failure is logged rather than failing the upload.
+    '''
+    global analysis_write_mode
+    if analysis_write_mode == 'rpc':
+        try:
+            result = await record_analysis(
+                supabase_client,
+                image['id'],
+                image['user_id'],
+                image['image_url'],
+                image['longitude'],
+                image['latitude'],
+                image['location_name'],
+                assessment['safety_score'],
+                assessment['estimated_magnitude_survivability'],
+                assessment['description'],
+                action_taken
+            )
+        except FunctionNotFound as e:
+            logger.error("%s; falling back to ANALYSIS_WRITE_MODE=pipelined", e)
+            analysis_write_mode = 'pipelined'
+        else:
+            if not result:
+                raise RuntimeError("Recording the analysis failed")
+            if result.get('replayed'):
+                logger.info("Analysis for image %s was already recorded by an earlier attempt", image['id'])
+                return True
+            return False
 
-        # Get text from content
-        response_text = response.content[0].text
-        print(f"[LOG] Claude response text: {response_text}")
+    image_id = await insert_image_entry(
+        supabase_client,
+        image['user_id'],
+        image['image_url'],
+        image['longitude'],
+        image['latitude'],
+        image['location_name'],
+        image_id=image['id']
+    )
+    if not image_id:
+        raise RuntimeError("Insertion into DB failed")
 
-        # Parsing the response
-        parsed_data = parse_claude_response(response_text)
+    response = await insert_safety_assessment(
+        supabase_client,
+        image_id,
+        assessment['safety_score'],
+        assessment['estimated_magnitude_survivability'],
+        assessment['description']
+    )
+    if not response:
+        # Undo the image insert so the retry starts clean instead of leaving an image without an assessment
+        if not await delete_image_entry(supabase_client, image_id):
+            raise PermanentJobError(f"Safety assessment insertion failed and image {image_id} could not be removed")
+        raise RuntimeError("Safety assessment insertion failed")
 
-        if not parsed_data:
-            print("[ERROR] Failed to parse the response correctly")
-            return {"error": "Failed to parse the Claude API response."}
+    # Only once the assessment is stored, so a retried job never leaves a second action behind
+    if not await insert_emergency_action(supabase_client, user_id=image['user_id'], action_taken=action_taken):
+        logger.warning("Emergency action insertion failed for user %s", image['user_id'])
+    return False
 
-        return parsed_data
+async def apply_analysis(image: dict, assessment: dict, action_taken: str) -> None:
+    '''
+    Publishes a written analysis on the broadcaster feed. Every worker, this one included, applies it to its map
+    indexes and change log in apply_map_event and pushes it to its live clients.
+    '''
+    await broadcaster.publish(live_assessment_event(image, assessment, action_taken))
 
-    except Exception as e:
-        print(f"[ERROR] Error occurred while analyzing image: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return {"error": f"An error occurred: {str(e)}"}
+# Feed events received while load_map_indexes is still reading the table; None once they have been applied
+_pending_map_events = []
+# Images loaded at startup before any assessment of theirs was readable, so not yet in the heatmap
+_unscored_image_ids = set()
 
+def apply_map_event(event: dict) -> None:
+    '''
+    Broadcaster listener: brings this worker's viewport index, cluster levels, heatmap and change log up to date with
+    an assessment published by any worker. An image that is already indexed is not counted again, so a message
+    delivered twice, or one for an image the startup load already read, leaves the aggregates unchanged.
+    '''
+    if _pending_map_events is not None:
+        _pending_map_events.append(event)
+        return
+    image_id = str(event['image_id'])
+    indexed = image_id in spatial_index
+    row = {'id': image_id, **{column: event.get(column) for column in MAP_COLUMNS if column != 'id'}}
+    spatial_index.insert(row)
+    if not indexed:
+        cluster_index.add(event['latitude'], event['longitude'], event.get('safety_score'))
+    if not indexed or image_id in _unscored_image_ids:
+        _unscored_image_ids.discard(image_id)
+        heatmap_index.add(event['latitude'], event['longitude'], event.get('safety_score'), event.get('estimated_magnitude_survivability'))
+    change_log.record({
+        **row,
+        'safety_score': event.get('safety_score'),
+        'estimated_magnitude_survivability': event.get('estimated_magnitude_survivability'),
+    })
+    if response_cache.redis is None:
+        # The writer already invalidated its own cache and any shared one; other workers' in-process copies go here
+        response_cache.invalidate_write('images', [image_id])
+        response_cache.invalidate_write('safety_assessments', [image_id])
 
-def parse_claude_response(response_text: str) -> dict:
-    '''Parses the response from Claude and returns it in a structured dictionary'''
+broadcaster.add_listener(apply_map_event)
 
-    
-    # Handling unexpected or malformed response
-    data = {}
-    try:
-        print(f"[PARSE_LOG] Processing text: {response_text}")
-        lines = response_text.strip().splitlines()
-        
-        for line in lines:
-            line = line.strip()
-            # Use string.startswith() or string.find() instead of "contains"
-            if line.startswith('Description:'):
-                data['Description'] = line[len('Description:'):].strip()
-                print(f"[PARSE_LOG] Found Description: {data['Description']}")
-            elif line.startswith('Score:'):
-                score_text = line[len('Score:'):].strip()
-                # Handle different possible formats (e.g., "Score: 45/100")
-                if '/' in score_text:
-                    score_text = score_text.split('/')[0].strip()
-                try:
-                    data['Score'] = int(score_text)
-                    print(f"[PARSE_LOG] Found Score: {data['Score']}")
-                except ValueError:
-                    # If we can't parse as int, store as string
-                    data['Score'] = score_text
-                    print(f"[PARSE_LOG] Found Score (not int): {data['Score']}")
-            elif line.startswith('Magnitude Survivability:'):
-                data['Magnitude Survivability'] = line[len('Magnitude Survivability:'):].strip()
-                print(f"[PARSE_LOG] Found Magnitude: {data['Magnitude Survivability']}")
-        
-        # If the response is just a single line containing all information 
-        # (like in your example "Description: Aging historic building...")
-        if not data and len(lines) == 1:
-            data['Description'] = lines[0]
-            # Default values when we only have description
-            data['Score'] = 0
-            data['Magnitude Survivability'] = 'Unknown'
-            print("[PARSE_LOG] Using single line as Description with default values")
-        
-        # If we fail to parse the expected keys, we return an empty dict
-        if not data:
-            print("[PARSE_LOG] No data found in response")
-            raise ValueError("Parsed data is empty or incomplete.")
-            
-    except Exception as e:
-        print(f"[ERROR] Error parsing Claude response: {str(e)}")
-        return None
+async def run_analysis_job(payload: dict) -> dict:
+    '''
+    Worker side of /analyze: assesses the stored image with Claude (or the duplicate cache) and writes the results.
+    Raising lets the worker pool retry with backoff; PermanentJobError marks the job failed straight away.
+    '''
+    filename = payload['filename']
+    image_hash = int(payload['image_hash'], 16)
+    user_id = payload['user_id']
+    lat = payload['latitude']
+    lng = payload['longitude']
+    location_name = payload['location_name']
+    save_image_url = payload['image_url']
+
+    image_analysis = await assess_image(filename, image_hash)
+
+    # Extract analysis data
+    description = image_analysis.get('Description', '')
+    safety_score = image_analysis.get('Score', 0)
+    magnitude_survivability = image_analysis.get('Magnitude Survivability', '')
+    logger.info("Extracted data - score: %s, survivability: %s", safety_score, magnitude_survivability)
+
+    # Nothing is written until the assessment is in hand, so a failed model call leaves no rows behind
+    image_id = payload.get('image_id') or str(uuid.uuid4())
+    image_row = {
+        'id': image_id,
+        'user_id': user_id,
+        'image_url': save_image_url,
+        'longitude': lng,
+        'latitude': lat,
+        'location_name': location_name,
+    }
+    assessment_row = {
+        'image_id': image_id,
+        'safety_score': safety_score,
+        'estimated_magnitude_survivability': magnitude_survivability,
+        'description': description,
+    }
+    action_taken = determine_action(magnitude_survivability)
+    replayed = await write_analysis(get_supabase(), image_row, assessment_row, action_taken)
+    logger.info("Analysis recorded for image ID: %s", image_id)
+
+    # A replay means the attempt that wrote the rows already updated the indexes and told live clients
+    if not replayed:
+        await apply_analysis(image_row, assessment_row, action_taken)
+
+    return {'analysis': image_analysis, 'image_id': image_id}
+
+async def delete_uploads(filenames: list[str]) -> None:
+    '''Removes the S3 objects (image and renditions) of uploads that never made it into the database.'''
+    keys = [key for filename in filenames for key in (filename, *(rendition_key(filename, name) for name in THUMBNAIL_SIZES))]
+    if keys:
+        await s3_storage.delete_many(keys)
+        logger.info("Deleted %s unrecorded uploads", len(filenames))
+
+async def discard_analysis_upload(payload: dict) -> None:
+    # The pipelined write can fail after an image row it could not remove; that row still points at the upload
+    if payload.get('image_id') and await get_image_by_id(get_supabase(), payload['image_id']):
+        return
+    await delete_uploads([payload['filename']])
+
+job_pool.register(ANALYZE_JOB, run_analysis_job, on_failure=discard_analysis_upload)
+
+def check_upload_size(file: UploadFile) -> None:
+    '''Rejects a single file over the per-image limit before any decoding work is done.'''
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"{file.filename} exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit")
 
-    print(f"[PARSE_LOG] Final parsed data: {data}")
-    return data
+def rendition_uploads(filename: str, normalized: dict) -> dict:
+    '''Maps S3 keys to the main JPEG and every thumbnail rendition produced by normalize_image.'''
+    uploads = {filename: io.BytesIO(normalized['jpeg'])}
+    for name, data in normalized['renditions'].items():
+        uploads[rendition_key(filename, name)] = io.BytesIO(data)
+    return uploads
 
-@app.post('/analyze')
+def rendition_urls(filename: str, normalized: dict) -> dict:
+    return {name: s3_storage.public_url(rendition_key(filename, name)) for name in normalized['renditions']}
+
+@app.post('/analyze', status_code=202)
 async def analyze(
     file: UploadFile = File(...),
     user_id: str = Form(...),
@@ -194,268 +514,860 @@ async def analyze(
     latitude: Optional[float] = Form(None),
     location_name: Optional[str] = Form(None)
 ):
-    '''Endpoint to receive a file upload from the user, add to AWS S3 Bucket, and evaluate using Claude'''
+    '''
+    Endpoint to receive a file upload from the user and add it to the AWS S3 Bucket.
+    The Claude evaluation runs on the job queue; poll /jobs/{job_id} or stream /jobs/{job_id}/events for the result.
+    '''
     try:
-        print(f"[LOG] Request received - user_id: {user_id}, file: {file.filename}, content_type: {file.content_type}")
-        print(f"[LOG] Location data - longitude: {longitude}, latitude: {latitude}, location_name: {location_name}")
-        
-        # Convert image to JPG format
-        print("[LOG] Reading file contents...")
-        contents = await file.read()
-        print(f"[LOG] File read complete. Size: {len(contents)} bytes")
+        logger.info("Request received - user_id: %s, file: %s, content_type: %s", user_id, file.filename, file.content_type)
+        logger.info("Location data - longitude: %s, latitude: %s, location_name: %s", longitude, latitude, location_name)
         
-        # Convert to JPG using Pillow
-        print("[LOG] Opening image with Pillow...")
-        image = Image.open(io.BytesIO(contents))
-        print(f"[LOG] Image opened. Mode: {image.mode}, Size: {image.size}")
+        check_upload_size(file)
+        logger.info("Upload size: %s bytes", file.size)
         
-        jpg_image = io.BytesIO()
+        # Orient, downscale, hash and convert to JPG on the image pool, decoding straight from the spooled upload
+        logger.debug("Normalizing image...")
+        await file.seek(0)
+        normalized = await asyncio.get_running_loop().run_in_executor(get_image_executor(), normalize_image, file.file)
+        image_hash = normalized['image_hash']
+        logger.info("JPEG conversion complete. %sx%s -> %sx%s, size: %s bytes, hash: %s",
+                    normalized['original_width'], normalized['original_height'], normalized['width'], normalized['height'],
+                    len(normalized['jpeg']), image_hash)
         
-        # If image is not RGB (like PNG with transparency), convert it
-        if image.mode != 'RGB':
-            print(f"[LOG] Converting image from {image.mode} to RGB mode")
-            image = image.convert('RGB')
-            
-        # Save as JPEG format with 90% quality
-        print("[LOG] Saving image as JPEG...")
-        image.save(jpg_image, format='JPEG', quality=90)
-        jpg_image.seek(0)
-        print(f"[LOG] JPEG conversion complete. Size: {jpg_image.getbuffer().nbytes} bytes")
-        
-        # Skip converting to UploadFile, upload directly to S3
-        print("[LOG] Preparing for S3 upload...")
         filename = f"{uuid.uuid4()}.jpg"
-        print(f"[LOG] Generated filename: {filename}")
+        logger.info("Generated filename: %s", filename)
         
-        # Upload directly to S3 instead of using UploadFile
-        print("[LOG] Uploading file to S3...")
-        s3_client.upload_fileobj(
-            jpg_image,
-            S3_BUCKET,
-            filename,
-            ExtraArgs={'ContentType': 'image/jpeg'}
-        )
-        print(f"[LOG] S3 upload complete. Filename: {filename}")
-        
-        # Generate URL for the uploaded image
-        print("[LOG] Generating presigned URL...")
-        image_url = await generate_unique_url(filename)
-        print(f"[LOG] URL generated. Length: {len(image_url)}")
+        # Upload the model-sized image and its map renditions concurrently
+        logger.debug("Uploading file to S3...")
+        await s3_storage.upload_many(rendition_uploads(filename, normalized), content_type='image/jpeg')
+        logger.info("S3 upload complete. Filename: %s", filename)
         save_image_url = await generate_public_url(filename)
-        print(f"[LOG] Public URL generated. Length: {len(save_image_url)}")
-        
-        # Analyze the image with Claude
-        print("[LOG] Sending image to Claude for analysis...")
-        image_analysis = await analyze_image_with_claude(image_url)
-        print(f"[LOG] Claude analysis complete: {image_analysis}")
         
         # Parse coordinates if provided
-        print("[LOG] Processing location data...")
         lat = float(latitude) if latitude is not None else None
         lng = float(longitude) if longitude is not None else None
-        print(f"[LOG] Processed location - lat: {lat}, lng: {lng}")
-        
-        # Insert the data into Supabase
-        print("[LOG] Creating Supabase client...")
-        supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        print("[LOG] Inserting image entry into database...")
-        image_id = insert_image_entry(supabase_client, user_id, save_image_url, lng, lat, location_name)
-        print(f"[LOG] Image entry inserted with ID: {image_id}")
         
-        if not image_id:
-            print("[ERROR] Failed to insert image into database")
-            raise HTTPException(status_code=500, detail="Insertion into DB failed")
+        # The upload is persisted; hand the slow model call and DB writes to the worker pool
+        # The image id is fixed here so a retried job writes the same rows instead of duplicating them
+        job_id = await job_pool.submit(ANALYZE_JOB, {
+            'image_id': str(uuid.uuid4()),
+            'filename': filename,
+            'image_hash': image_hash,
+            'user_id': user_id,
+            'latitude': lat,
+            'longitude': lng,
+            'location_name': location_name,
+            'image_url': save_image_url,
+        })
+        logger.info("Analysis job queued: %s", job_id)
+        return {'job_id': job_id, 'status': QUEUED, 'image_url': save_image_url, 'renditions': rendition_urls(filename, normalized)}
         
-        if "error" in image_analysis:
-            print(f"[ERROR] Analysis error: {image_analysis['error']}")
-            return {"error": image_analysis["error"]}
-        
-        # Extract analysis data
-        print("[LOG] Extracting analysis data...")
-        description = image_analysis.get('Description', '')
-        safety_score = image_analysis.get('Score', 0)
-        magnitude_survivability = image_analysis.get('Magnitude Survivability', '')
-        print(f"[LOG] Extracted data - score: {safety_score}, survivability: {magnitude_survivability}")
-        
-        # Insert safety assessment
-        print("[LOG] Inserting safety assessment into database...")
-        response = insert_safety_assessment(
-            supabase_client, 
-            image_id, 
-            safety_score, 
-            magnitude_survivability, 
-            description
-        )
-        print(f"[LOG] Safety assessment insertion response: {response}")
-        
-        action_taken = 'Nothing to worry about'
+    except Exception as e:
+        logger.exception("Error processing upload: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error processing upload: {str(e)}")
+
+async def run_batch_analysis_job(payload: dict) -> dict:
+    '''
+    Worker side of /analyze/batch: assesses every stored image with at most BATCH_LLM_CONCURRENCY model calls
+    in flight, then records each successful one through write_analysis, so every image is written together with
+    its assessment or not at all. The indexes and live clients only see images whose write succeeded.
+    '''
+    user_id = payload['user_id']
+    items = payload['items']
+    semaphore = asyncio.Semaphore(BATCH_LLM_CONCURRENCY)
+
+    async def assess(item):
+        async with semaphore:
+            try:
+                return await assess_image(item['filename'], int(item['image_hash'], 16))
+            except RetryLaterError:
+                raise
+            except Exception as e:
+                logger.error("Batch assessment failed for %s: %s", item['filename'], e)
+                return {'error': str(e)}
+
+    # An outage defers the whole batch before anything is written; assessments already made stay in assessment_cache
+    analyses = await asyncio.gather(*(assess(item) for item in items))
+    assessed = [(item, analysis) for item, analysis in zip(items, analyses) if 'error' not in analysis]
+    if not assessed:
+        raise RuntimeError("Every image in the batch failed analysis")
+
+    supabase_client = get_supabase()
+
+    async def write(item, analysis):
+        # Items queued before image ids were fixed at upload get one here
+        image_row = {
+            'id': item.get('image_id') or str(uuid.uuid4()),
+            'user_id': user_id,
+            'image_url': item['image_url'],
+            'longitude': item['longitude'],
+            'latitude': item['latitude'],
+            'location_name': item['location_name'],
+        }
+        assessment_row = {
+            'image_id': image_row['id'],
+            'safety_score': analysis.get('Score', 0),
+            'estimated_magnitude_survivability': analysis.get('Magnitude Survivability', ''),
+            'description': analysis.get('Description', ''),
+        }
+        action_taken = determine_action(assessment_row['estimated_magnitude_survivability'])
         try:
-            magnitude_value = float(magnitude_survivability)
-            if magnitude_value < 6.0:  # Example threshold for emergency action
-                action_taken = "Leave Immediately"
-            elif magnitude_value < 7.0:
-                action_taken = "Caution: Building Needs Strengthening"
-            else:
-                action_taken = "Safe"
-        except ValueError:
-            action_taken = "Unable to determine action due to invalid magnitude value"
-
-        # Insert emergency action into the database
-        emergency_action_response = insert_emergency_action(
-            supabase_client,
-            user_id=user_id,
-            action_taken=action_taken
+            replayed = await write_analysis(supabase_client, image_row, assessment_row, action_taken)
+        except Exception as e:
+            logger.error("Recording the batch analysis of %s failed: %s", item['filename'], e)
+            return item['filename'], None, str(e)
+        if not replayed:
+            await apply_analysis(image_row, assessment_row, action_taken)
+        return item['filename'], image_row['id'], None
+
+    written = await asyncio.gather(*(write(item, analysis) for item, analysis in assessed))
+    image_ids_by_file = {filename: image_id for filename, image_id, _ in written if image_id}
+    write_errors = {filename: error for filename, _, error in written if error}
+    logger.info("Batch recorded %s of %s images", len(image_ids_by_file), len(items))
+    if not image_ids_by_file:
+        raise RuntimeError("Recording every image in the batch failed")
+    await delete_uploads([item['filename'] for item in items if item['filename'] not in image_ids_by_file])
+
+    return {
+        'results': [
+            {
+                'filename': item['original_filename'],
+                'image_id': image_ids_by_file.get(item['filename']),
+                'renditions': item['renditions'],
+                'analysis': analysis,
+                'error': write_errors.get(item['filename']),
+            }
+            for item, analysis in zip(items, analyses)
+        ]
+    }
+
+async def discard_batch_uploads(payload: dict) -> None:
+    await delete_uploads([item['filename'] for item in payload['items']])
+
+job_pool.register(ANALYZE_BATCH_JOB, run_batch_analysis_job, on_failure=discard_batch_uploads)
+
+@app.post('/analyze/batch', status_code=202)
+async def analyze_batch(
+    files: List[UploadFile] = File(...),
+    user_id: str = Form(...),
+    longitude: Optional[float] = Form(None),
+    latitude: Optional[float] = Form(None),
+    location_name: Optional[str] = Form(None),
+    longitudes: Optional[List[float]] = Form(None),
+    latitudes: Optional[List[float]] = Form(None),
+    location_names: Optional[List[str]] = Form(None)
+):
+    '''
+    Endpoint to receive many photos of one site in a single request. Images are normalized in parallel straight from
+    their spooled temp files and uploaded to S3 concurrently; the Claude assessments run as one queued job.
+    Location can be given once for the whole batch or per file via the plural fields.
+    '''
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_FILES} files per batch")
+    for values in (longitudes, latitudes, location_names):
+        if values is not None and len(values) != len(files):
+            raise HTTPException(status_code=400, detail="Per-file location fields must have one value per file")
+
+    try:
+        logger.info("Batch request received - user_id: %s, files: %s", user_id, len(files))
+        for file in files:
+            check_upload_size(file)
+
+        loop = asyncio.get_running_loop()
+        executor = get_image_executor()
+        normalized = await asyncio.gather(
+            *(loop.run_in_executor(executor, normalize_image, file.file) for file in files),
+            return_exceptions=True
         )
 
-        print("[LOG] Emergency action insertion response: ", emergency_action_response)
+        items, rejected, uploads = [], [], {}
+        for index, (file, result) in enumerate(zip(files, normalized)):
+            if isinstance(result, Exception):
+                rejected.append({'filename': file.filename, 'error': f"Could not read image: {str(result)}"})
+                continue
+            filename = f"{uuid.uuid4()}.jpg"
+            uploads.update(rendition_uploads(filename, result))
+            items.append({
+                # Fixed here, like /analyze, so a retried job replays its writes instead of duplicating them
+                'image_id': str(uuid.uuid4()),
+                'filename': filename,
+                'original_filename': file.filename,
+                'image_hash': result['image_hash'],
+                'latitude': latitudes[index] if latitudes is not None else latitude,
+                'longitude': longitudes[index] if longitudes is not None else longitude,
+                'location_name': location_names[index] if location_names is not None else location_name,
+                'image_url': s3_storage.public_url(filename),
+                'renditions': rendition_urls(filename, result),
+            })
 
-        if isinstance(response, dict) and "error" in response:
-            print(f"[ERROR] Safety assessment insertion failed: {response['error']}")
-            return {'error': response['error']}
-            
-        # Return successful analysis
-        print("[LOG] Request completed successfully")
-        return {'analysis': image_analysis}
-        
+        if not items:
+            raise HTTPException(status_code=400, detail={'rejected': rejected})
+
+        logger.info("Uploading %s images to S3...", len(uploads))
+        await s3_storage.upload_many(uploads, content_type='image/jpeg')
+
+        job_id = await job_pool.submit(ANALYZE_BATCH_JOB, {'user_id': user_id, 'items': items})
+        logger.info("Batch analysis job queued: %s", job_id)
+        return {'job_id': job_id, 'status': QUEUED, 'accepted': len(items), 'rejected': rejected}
+
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"[ERROR] Error processing upload: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Error processing upload: {str(e)}")
+        logger.exception("Error processing batch upload: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error processing batch upload: {str(e)}")
+
+def serialize_job(job: dict) -> dict:
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'result': job['result'],
+        'error': job['error'] if job['status'] == FAILED else None,
+    }
+
+@app.get('/jobs/{job_id}')
+async def get_job(job_id: str):
+    """Endpoint to poll the status and result of a queued analysis"""
+    job = await job_pool.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return serialize_job(job)
+
+@app.get('/jobs/{job_id}/events')
+async def stream_job(job_id: str):
+    """Endpoint to stream job status changes as Server-Sent Events until the job finishes"""
+    job = await job_pool.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        last_status = None
+        last_sent = time.monotonic()
+        while True:
+            job = await job_pool.get(job_id)
+            if job['status'] != last_status:
+                last_status = job['status']
+                last_sent = time.monotonic()
+                yield f"event: {job['status']}\ndata: {json.dumps(serialize_job(job))}\n\n"
+            if job['status'] in TERMINAL_STATUSES:
+                return
+            await job_pool.wait_for_update(job_id, JOB_EVENTS_POLL_SECONDS)
+            if time.monotonic() - last_sent >= JOB_EVENTS_KEEPALIVE_SECONDS:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
     
+@app.get('/assessment_cache/stats')
+async def get_assessment_cache_stats():
+    """Endpoint to report the size and hit rate of the duplicate-image assessment cache"""
+    return assessment_cache.stats()
+
+@app.get('/chat_cache/stats')
+async def get_chat_cache_stats():
+    """Endpoint to report the size and hit rate of the semantic chat answer cache"""
+    return chat_cache.stats()
+
+@app.get('/metrics', response_class=PlainTextResponse)
+async def get_metrics():
+    """Endpoint exposing request and per-stage latency histograms in the Prometheus text format"""
+    return PlainTextResponse(metrics_registry.render(), media_type='text/plain; version=0.0.4')
+
+@app.get('/response_cache/stats')
+async def get_response_cache_stats():
+    """Endpoint to report the size, backend and hit rate of the read-through response cache"""
+    return response_cache.stats()
+
+@app.get('/admission/stats')
+async def get_admission_stats():
+    """Endpoint to report in-flight and queued requests per traffic class and how many were rejected"""
+    return admission.stats()
+
+@app.get('/providers/stats')
+async def get_provider_stats():
+    """Endpoint to report the circuit breaker state of each model provider"""
+    return {'claude': claude_provider.stats(), 'groq': groq_provider.stats()}
+
 @app.get('/images')
-async def get_all_images():
+async def get_all_images(request: Request):
     """Endpoint to retrieve all images with location data"""
-    print("[LOG] Request received - getting all images")
-    
-    try:
-        print("[LOG] Creating Supabase client...")
-        supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        print("[LOG] Supabase client created successfully")
+    logger.info("Request received - getting all images")
+
+    async def load():
+        supabase_client = get_supabase()
         
-        print("[LOG] About to call fetch_all_images...")
-        images = fetch_all_images(supabase_client)
-        print("[LOG] fetch_all_images returned data type:", type(images))
+        logger.debug("About to call fetch_all_images...")
+        images = await fetch_all_images(supabase_client)
+        logger.debug("fetch_all_images returned data type: %s", type(images))
         
-        print(f"[LOG] Found {len(images)} images")
+        logger.info("Found %s images", len(images))
         if images and len(images) > 0:
-            print("[LOG] First image sample:", images[0])
-        
-        print("[LOG] Returning response")
+            logger.debug("First image sample: %s", images[0])
         return {'images': images}
+
+    try:
+        # fetch_all_images returns [] when the query fails, so empty results are not cached
+        return await cached_json(request, 'images', ['images'], load, cache_if=lambda payload: bool(payload['images']))
         
     except Exception as e:
-        print(f"[ERROR] Error retrieving images: {str(e)}")
-        print(f"[ERROR] Error type: {type(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error retrieving images: %s", e)
         raise HTTPException(status_code=500, detail=f"Error retrieving images: {str(e)}")
 
+async def query_viewport(min_lat: float, min_lng: float, max_lat: float, max_lng: float, limit: int, cursor: Optional[str]) -> dict:
+    '''
+    Runs a bounding-box query against the spatial index on a worker thread and shapes the paginated response.
+    Viewports too wide to page through marker by marker return no images and use_clusters=True.
+    `changes_cursor` is the change-log position read before the query, for the client's next /images/changes call.
+    '''
+    if min_lat > max_lat or min_lng > max_lng:
+        raise HTTPException(status_code=400, detail="Bounding box minimums must not exceed maximums")
+    changes_cursor = change_log.cursor
+    if spatial_index.cell_span(min_lat, min_lng, max_lat, max_lng) > MAX_VIEWPORT_CELLS:
+        return {'images': [], 'next_cursor': None, 'use_clusters': True, 'changes_cursor': changes_cursor}
+    limit = max(1, min(limit, MAX_VIEWPORT_LIMIT))
+    images, next_cursor = await asyncio.to_thread(spatial_index.query, min_lat, min_lng, max_lat, max_lng, limit=limit, after_id=cursor)
+    return {'images': images, 'next_cursor': next_cursor, 'use_clusters': False, 'changes_cursor': changes_cursor}
+
+@app.get('/images/changes')
+async def get_image_changes(since: Optional[str] = None, limit: int = 1000, format: str = 'json'):
+    """
+    Endpoint to retrieve only the map points added or re-assessed since a client's last `cursor`; omit `since` for everything.
+    `reset` is true when the cursor came from another server process, and the client should drop its points and start over.
+    `format=binary` returns packed CHANGE_RECORD structs with the cursor in headers; names and URLs come from /images/batch.
+    """
+    if format not in ('json', 'binary'):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'binary'")
+    after, reset = change_log.parse_cursor(since)
+    points, cursor, has_more = change_log.since(after, max(1, min(limit, MAX_CHANGES_LIMIT)))
+    if format == 'binary':
+        return Response(
+            content=ChangeLog.pack(points).tobytes(),
+            media_type='application/octet-stream',
+            headers={
+                'X-Changes-Cursor': cursor,
+                'X-Changes-Reset': str(reset).lower(),
+                'X-Changes-Has-More': str(has_more).lower(),
+                'X-Changes-Record-Size': str(CHANGE_RECORD.itemsize),
+            },
+        )
+    return {'cursor': cursor, 'reset': reset, 'has_more': has_more, 'points': points}
+
+@app.get('/images/viewport')
+async def get_viewport_images(
+    min_lat: float,
+    min_lng: float,
+    max_lat: float,
+    max_lng: float,
+    limit: int = 500,
+    cursor: Optional[str] = None
+):
+    """Endpoint to retrieve the images inside a map viewport, one keyset page at a time"""
+    return await query_viewport(min_lat, min_lng, max_lat, max_lng, limit, cursor)
+
+@app.get('/images/tiles/{zoom}/{x}/{y}')
+async def get_tile_images(zoom: int, x: int, y: int, limit: int = 500, cursor: Optional[str] = None):
+    """Endpoint to retrieve the images inside a slippy-map tile, one keyset page at a time"""
+    if zoom < 0 or zoom > 22 or not (0 <= x < 2 ** zoom) or not (0 <= y < 2 ** zoom):
+        raise HTTPException(status_code=400, detail="Invalid tile address")
+    min_lat, min_lng, max_lat, max_lng = tile_to_bbox(zoom, x, y)
+    return await query_viewport(min_lat, min_lng, max_lat, max_lng, limit, cursor)
+
+@app.get('/clusters')
+async def get_clusters(zoom: int, min_lat: float, min_lng: float, max_lat: float, max_lng: float):
+    """Endpoint to retrieve precomputed marker clusters (centroid, count, mean safety score) for a viewport"""
+    if min_lat > max_lat or min_lng > max_lng:
+        raise HTTPException(status_code=400, detail="Bounding box minimums must not exceed maximums")
+    if zoom > MAX_CLUSTER_ZOOM:
+        return {'clusters': [], 'zoom': zoom, 'use_markers': True}
+    return {'clusters': cluster_index.clusters(zoom, min_lat, min_lng, max_lat, max_lng), 'zoom': zoom, 'use_markers': False}
+
+@app.get('/clusters/tiles/{zoom}/{x}/{y}')
+async def get_tile_clusters(zoom: int, x: int, y: int):
+    """Endpoint to retrieve precomputed marker clusters for a slippy-map tile"""
+    if zoom < 0 or zoom > 22 or not (0 <= x < 2 ** zoom) or not (0 <= y < 2 ** zoom):
+        raise HTTPException(status_code=400, detail="Invalid tile address")
+    min_lat, min_lng, max_lat, max_lng = tile_to_bbox(zoom, x, y)
+    return await get_clusters(zoom, min_lat, min_lng, max_lat, max_lng)
+
+def heatmap_response(precision: int, min_lat: float, min_lng: float, max_lat: float, max_lng: float, format: str):
+    '''Serialises the heatmap cells in a bounding box as JSON, or as packed little-endian HEATMAP_RECORD structs.'''
+    records = heatmap_index.cells(precision, min_lat, min_lng, max_lat, max_lng)
+    if format == 'binary':
+        return Response(
+            content=records.tobytes(),
+            media_type='application/octet-stream',
+            headers={
+                'X-Heatmap-Precision': str(precision),
+                'X-Heatmap-Record-Size': str(HEATMAP_RECORD.itemsize),
+                'X-Heatmap-Survivability-Bins': ','.join(SURVIVABILITY_LABELS),
+            },
+        )
+    geohashes = heatmap_index.geohashes(precision, records)
+    return {
+        'precision': precision,
+        'survivability_bins': list(SURVIVABILITY_LABELS),
+        'cells': [
+            {
+                'geohash': geohash,
+                'latitude': round(float(record['latitude']), 6),
+                'longitude': round(float(record['longitude']), 6),
+                'count': int(record['count']),
+                'mean_safety_score': None if record['mean_safety_score'] != record['mean_safety_score'] else round(float(record['mean_safety_score']), 2),
+                'survivability': record['survivability'].tolist(),
+            }
+            for geohash, record in zip(geohashes, records)
+        ],
+    }
+
+@app.get('/heatmap')
+async def get_heatmap(min_lat: float, min_lng: float, max_lat: float, max_lng: float,
+                      precision: Optional[int] = None, zoom: Optional[int] = None, format: str = 'json'):
+    """
+    Endpoint to retrieve precomputed per-geohash safety rollups (mean safety score and survivable-magnitude histogram) for a viewport.
+    Pass a geohash `precision` directly or a map `zoom` to derive one; `format=binary` returns packed records instead of JSON.
+    """
+    if min_lat > max_lat or min_lng > max_lng:
+        raise HTTPException(status_code=400, detail="Bounding box minimums must not exceed maximums")
+    if format not in ('json', 'binary'):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'binary'")
+    if precision is None:
+        precision = precision_for_zoom(zoom if zoom is not None else 10)
+    precision = max(MIN_GEOHASH_PRECISION, min(MAX_GEOHASH_PRECISION, precision))
+    return heatmap_response(precision, min_lat, min_lng, max_lat, max_lng, format)
+
+@app.get('/heatmap/tiles/{zoom}/{x}/{y}')
+async def get_tile_heatmap(zoom: int, x: int, y: int, format: str = 'json'):
+    """Endpoint to retrieve precomputed per-geohash safety rollups for a slippy-map tile"""
+    if zoom < 0 or zoom > 22 or not (0 <= x < 2 ** zoom) or not (0 <= y < 2 ** zoom):
+        raise HTTPException(status_code=400, detail="Invalid tile address")
+    min_lat, min_lng, max_lat, max_lng = tile_to_bbox(zoom, x, y)
+    return await get_heatmap(min_lat, min_lng, max_lat, max_lng, zoom=zoom, format=format)
+
+def parse_region(values) -> tuple[float, float, float, float]:
+    '''Reads a min_lat/min_lng/max_lat/max_lng region from a mapping, raising ValueError when it is missing or inverted.'''
+    try:
+        region = tuple(float(values[name]) for name in ('min_lat', 'min_lng', 'max_lat', 'max_lng'))
+    except (KeyError, TypeError):
+        raise ValueError("min_lat, min_lng, max_lat and max_lng are required")
+    if region[0] > region[2] or region[1] > region[3]:
+        raise ValueError("Bounding box minimums must not exceed maximums")
+    return region
+
+@app.get('/live/assessments')
+async def stream_live_assessments(min_lat: float, min_lng: float, max_lat: float, max_lng: float):
+    """
+    Endpoint to stream every new safety assessment inside a map region as Server-Sent Events.
+    A `lagged` event means some were dropped because the client read too slowly; refetch /images/changes to catch up.
+    """
+    try:
+        region = parse_region({'min_lat': min_lat, 'min_lng': min_lng, 'max_lat': max_lat, 'max_lng': max_lng})
+        subscription = broadcaster.subscribe(region)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OverflowError:
+        raise HTTPException(status_code=503, detail="Too many live subscribers, retry later", headers={'Retry-After': '30'})
+
+    async def events():
+        try:
+            while not subscription.closed.is_set():
+                item = await subscription.get(LIVE_KEEPALIVE_SECONDS)
+                if item is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                event, data = item
+                yield f"event: {event}\ndata: {data}\n\n"
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.websocket('/live/assessments/ws')
+async def live_assessments_socket(websocket: WebSocket):
+    """
+    WebSocket variant of /live/assessments for clients that move around the map.
+    Send {"min_lat", "min_lng", "max_lat", "max_lng"} whenever the visible region changes; the region may also be given
+    as query parameters. Messages arrive as {"event": "assessment" | "lagged" | "error", "data": {...}}.
+    """
+    await websocket.accept()
+    try:
+        subscription = broadcaster.subscribe()
+    except OverflowError:
+        await websocket.close(code=1013, reason="Too many live subscribers")
+        return
+
+    async def receive_regions():
+        values = websocket.query_params
+        while True:
+            if values:
+                try:
+                    broadcaster.set_region(subscription, parse_region(values))
+                except ValueError as e:
+                    await websocket.send_json({'event': 'error', 'data': {'detail': str(e)}})
+            message = await websocket.receive_text()
+            try:
+                values = json.loads(message)
+            except ValueError:
+                await websocket.send_json({'event': 'error', 'data': {'detail': "Messages must be JSON"}})
+                values = None
+
+    async def send_events():
+        while not subscription.closed.is_set():
+            item = await subscription.get(LIVE_KEEPALIVE_SECONDS)
+            if item is not None:
+                event, data = item
+                await websocket.send_text(f'{{"event": "{event}", "data": {data}}}')
+
+    tasks = [asyncio.create_task(receive_regions()), asyncio.create_task(send_events())]
+    try:
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in pending:
+            task.cancel()
+        for task in done:
+            if task.exception() is not None and not isinstance(task.exception(), WebSocketDisconnect):
+                logger.warning("Live assessment socket failed: %s", task.exception())
+        if subscription.closed.is_set():
+            # Evicted for falling behind, or the server is shutting down
+            await websocket.close(code=1013)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+@app.get('/live/stats')
+async def get_live_stats():
+    """Endpoint to report live subscribers, messages delivered and slow subscribers disconnected by the broadcaster"""
+    return broadcaster.stats()
+
 @app.get('/image/{image_id}')
-async def get_image(image_id: str):
+async def get_image(image_id: str, request: Request):
     """Endpoint to retrieve a specific image by its ID"""
-    try:
-        print(f"[LOG] Request received - getting image with ID: {image_id}")
-        
-        # Create Supabase client
-        supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    logger.info("Request received - getting image with ID: %s", image_id)
+
+    async def load():
+        supabase_client = get_supabase()
         
         # Get the image data
-        image_data = get_image_by_id(supabase_client, image_id)
+        image_data = await get_image_by_id(supabase_client, image_id)
         if not image_data:
-            print(f"[ERROR] Image with ID {image_id} not found")
+            logger.error("Image with ID %s not found", image_id)
             raise HTTPException(status_code=404, detail="Image not found")
         
-        print(f"[LOG] Found image: {image_data['id']}")
-        
-        # Return the image data
+        logger.info("Found image: %s", image_data['id'])
         return {'image': image_data}
+
+    try:
+        return await cached_json(request, f"image:{image_id}", [f"image:{image_id}"], load)
         
     except Exception as e:
-        print(f"[ERROR] Error retrieving image: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error retrieving image: %s", e)
         raise HTTPException(status_code=500, detail=f"Error retrieving image: {str(e)}")
 
 @app.get('/safety_assessments/{image_id}')
-async def get_safety_assessments(image_id: str):
+async def get_safety_assessments(image_id: str, request: Request):
     """Endpoint to retrieve all safety assessments for a specific image"""
-    try:
-        print(f"[LOG] Request received - getting safety assessments for image with ID: {image_id}")
-        
-        # Create Supabase client
-        supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    logger.info("Request received - getting safety assessments for image with ID: %s", image_id)
+
+    async def load():
+        supabase_client = get_supabase()
         
         # Get the image data
-        safety_assessments = get_safety_assessment_by_image(supabase_client, image_id)
+        safety_assessments = await get_safety_assessment_by_image(supabase_client, image_id)
         if not safety_assessments:
-            print(f"[ERROR] Safety assessments not found for image with ID {image_id}")
+            logger.error("Safety assessments not found for image with ID %s", image_id)
             raise HTTPException(status_code=404, detail="Safety assessments not found")
         
-        print(f"[LOG] Found safety assessments: {safety_assessments}")
-        
-        # Return the safety assessments data
+        logger.debug("Found safety assessments: %s", safety_assessments)
         return {'safety_assessments': safety_assessments}
+
+    try:
+        return await cached_json(request, f"assessments:{image_id}", [f"assessments:{image_id}"], load)
         
     except Exception as e:
-        print(f"[ERROR] Error retrieving safety assessments: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error retrieving safety assessments: %s", e)
         raise HTTPException(status_code=500, detail=f"Error retrieving safety assessments: {str(e)}")
 
+class ImageBatchRequest(BaseModel):
+    image_ids: List[str]
+
+MAX_IMAGE_BATCH_IDS = 200
+
+@app.post('/images/batch')
+async def get_images_batch(request: ImageBatchRequest):
+    """
+    Endpoint to retrieve many images, each joined with its latest safety assessment, in one round-trip.
+    Images are returned in request order; ids with no matching image are listed under `missing`.
+    """
+    image_ids = list(dict.fromkeys(request.image_ids))
+    if len(image_ids) > MAX_IMAGE_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_IMAGE_BATCH_IDS} image ids per request")
+
+    rows = await get_images_with_latest_assessment(get_supabase(), image_ids)
+    if rows is None:
+        raise HTTPException(status_code=500, detail="Error retrieving images")
+
+    by_id = {}
+    for row in rows:
+        assessments = row.pop('safety_assessments', None) or []
+        row['safety_assessment'] = assessments[0] if assessments else None
+        by_id[str(row['id'])] = row
+    return {
+        'images': [by_id[image_id] for image_id in image_ids if image_id in by_id],
+        'missing': [image_id for image_id in image_ids if image_id not in by_id],
+    }
+
+# Sources merged into /users/{user_id}/activity: timestamp column and the columns a dashboard needs
+ACTIVITY_SOURCES = {
+    'upload': ('created_at', 'id, image_url, latitude, longitude, location_name, created_at'),
+    'assessment': ('created_at', 'id, image_id, safety_score, estimated_magnitude_survivability, created_at'),
+    'chat': ('timestamp', 'id, user_message, ai_response, timestamp'),
+    'action': ('timestamp', 'id, action_taken, timestamp'),
+}
+DEFAULT_ACTIVITY_LIMIT = 50
+MAX_ACTIVITY_LIMIT = 200
+
+def activity_time(value: str) -> datetime:
+    '''Parses a row timestamp for merging; naive values (chat messages from before they were stored in UTC) are taken as UTC.'''
+    parsed = datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=timezone.utc)
+
+def encode_activity_cursor(positions: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(positions, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_activity_cursor(cursor: str) -> dict:
+    '''
+    Returns {source: (timestamp, id) or None}. Each source resumes after its own last row, with the timestamp exactly
+    as that table stored it; None marks a source with nothing left. Sources missing from the cursor start from the top.
+    '''
+    try:
+        positions = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        decoded = {}
+        for kind, position in positions.items():
+            if kind not in ACTIVITY_SOURCES:
+                raise ValueError(kind)
+            if position is None:
+                decoded[kind] = None
+            else:
+                timestamp, row_id = position
+                activity_time(timestamp)
+                decoded[kind] = (timestamp, str(row_id))
+        return decoded
+    except (ValueError, TypeError, AttributeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get('/users/{user_id}/activity')
+async def get_user_activity(user_id: str, request: Request, limit: int = DEFAULT_ACTIVITY_LIMIT, cursor: Optional[str] = None,
+                            types: Optional[str] = None):
+    """
+    Endpoint to page through a user's uploads, assessments, chat turns and emergency actions, newest first.
+    Each source is read with its own (timestamp, id) keyset query for at most `limit` rows, then merged; pass
+    `next_cursor` back as `cursor` for the next page. `types` narrows the feed, e.g. types=upload,assessment.
+    """
+    limit = max(1, min(limit, MAX_ACTIVITY_LIMIT))
+    kinds = [kind for kind in ACTIVITY_SOURCES if types is None or kind in types.split(',')]
+    positions = decode_activity_cursor(cursor) if cursor else {}
+    # Sources a previous page ran to the end of are not queried again
+    open_kinds = [kind for kind in kinds if positions.get(kind, ()) is not None]
+
+    async def load():
+        supabase_client = get_supabase()
+        loaders = {
+            'upload': get_images_by_user,
+            'assessment': get_safety_assessments_by_user,
+            'chat': get_chat_messages_by_user,
+            'action': get_emergency_actions_by_user,
+        }
+        pages = await asyncio.gather(*(
+            loaders[kind](supabase_client, user_id, columns=ACTIVITY_SOURCES[kind][1], before=positions.get(kind), limit=limit)
+            for kind in open_kinds
+        ))
+        items = []
+        for kind, rows in zip(open_kinds, pages):
+            if rows is None:
+                raise HTTPException(status_code=500, detail=f"Error retrieving {kind} activity")
+            time_column = ACTIVITY_SOURCES[kind][0]
+            for row in rows:
+                raw_time = row.pop(time_column)
+                items.append((activity_time(raw_time), str(row['id']), kind, row, raw_time))
+
+        # Every source returned its newest `limit` rows after its position, so the merged top `limit` is exact
+        items.sort(key=lambda item: (item[0], item[1]), reverse=True)
+        page = items[:limit]
+
+        next_positions = {kind: position for kind, position in positions.items() if kind in kinds}
+        for _, row_id, kind, _, raw_time in page:
+            next_positions[kind] = (raw_time, row_id)
+        more = False
+        for kind, rows in zip(open_kinds, pages):
+            emitted = sum(1 for item in page if item[2] == kind)
+            if emitted < len(rows) or len(rows) == limit:
+                more = True
+            else:
+                next_positions[kind] = None
+        next_cursor = encode_activity_cursor(next_positions) if more else None
+        return {
+            'items': [{'type': kind, 'timestamp': timestamp.isoformat(), **row} for timestamp, _, kind, row, _ in page],
+            'next_cursor': next_cursor,
+        }
+
+    # Only first pages are cached: that is what dashboards reload, and deeper pages are cheap keyset reads
+    if cursor:
+        return await load()
+    return await cached_json(request, f"activity:{user_id}:{','.join(kinds)}:{limit}", [f"activity:{user_id}"], load)
+
 class ChatRequest(BaseModel):
     user_id: str
     prompt: str
 
+CHAT_MODEL = "llama-3.3-70b-versatile"
+CHAT_MAX_TOKENS = 300
+CHAT_SYSTEM_PROMPT = (
+    "You are a helpful and knowledgeable assistant specializing in earthquake safety. "
+    "When answering the user's question, also determine if their question relates to "
+    "'before', 'during', or 'after' an earthquake. "
+    "At the end of your reply, output your answer clearly in the format:\n\n"
+    "Timing: <before/during/after>"
+    "Do not include any kind of bold, italic, or different sized text in your response."
+)
+
 @app.post("/chat")
 async def process_chatbot(request: ChatRequest):
     """
     Endpoint to handle chat prompts and return structured responses from Groq AI.
     """
-    print('reached endpoint')
+    logger.debug('reached endpoint')
     try:
-        groq_client = Groq(api_key=GROQ_API_KEY)
-        chat_completions = groq_client.chat.completions.create(
+        cached = chat_cache.lookup(request.prompt)
+        if cached is not None:
+            logger.info("Chat cache hit (similarity %.3f)", cached['similarity'])
+            await insert_chat_message(get_supabase(), request.user_id, request.prompt, cached['response'], cached['context'])
+            return {'response': cached['response']}
+
+        chat_completions = await groq_provider.call(
+            groq_provider.client.chat.completions.create,
             messages=[
                 {
                     'role': 'system',
-                    'content': (
-                        "You are a helpful and knowledgeable assistant specializing in earthquake safety. "
-                        "When answering the user's question, also determine if their question relates to "
-                        "'before', 'during', or 'after' an earthquake. "
-                        "At the end of your reply, output your answer clearly in the format:\n\n"
-                        "Timing: <before/during/after>"
-                        "Do not include any kind of bold, italic, or different sized text in your response."
-                    ),
+                    'content': CHAT_SYSTEM_PROMPT,
                 },
                 {
                     'role': 'user',
                     'content': request.prompt,
                 }
             ],
-            model="llama-3.3-70b-versatile",
-            max_tokens=300,
+            model=CHAT_MODEL,
+            max_tokens=CHAT_MAX_TOKENS,
         )
         
-        print('response received')
+        logger.debug('response received')
         # parse the JSON output correctly
         response = chat_completions.choices[0].message.content
-        print('response grabbed')
+        logger.debug('response grabbed')
         ai_response, context = response.split('\n\nTiming:')
         ai_response = ai_response.strip()
         context = context.strip()
-        print('response split')
+        logger.debug('response split')
+        chat_cache.put(request.prompt, ai_response, context)
         
         # insert the log of this chat interaction to the database
-        supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        db_response = insert_chat_message(supabase_client, request.user_id, request.prompt, ai_response, context) # figure out how to establish context
+        supabase_client = get_supabase()
+        db_response = await insert_chat_message(supabase_client, request.user_id, request.prompt, ai_response, context) # figure out how to establish context
         
-        print('inserted into db')
-        print(f'ai_response: {ai_response}')
+        logger.debug('inserted into db')
+        logger.debug('ai_response: %s', ai_response)
         return {'response': ai_response}
 
+    except ProviderUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={'Retry-After': str(int(groq_provider.breaker.reset_seconds))})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def stream_chatbot(request: ChatRequest):
+    """
+    Endpoint to stream the Groq answer to a chat prompt as Server-Sent Events while it is generated.
+    Sends `token` events with answer text, then one `done` event with the full answer and timing label.
+    The chat_messages record is written in the background after the stream closes.
+    A cached answer to a similar question is sent as a single `token` event.
+    """
+    completed = {}
+
+    async def save_chat_message():
+        # Only complete answers are logged, matching /chat
+        if not completed:
+            return
+        await insert_chat_message(get_supabase(), request.user_id, request.prompt, completed['response'], completed['context'])
+
+    cached = chat_cache.lookup(request.prompt)
+    if cached is not None:
+        completed.update(response=cached['response'], context=cached['context'])
+
+        async def cached_events():
+            yield sse_event('token', {'text': cached['response']})
+            yield sse_event('done', {'response': cached['response'], 'timing': cached['context'], 'cached': True})
+
+        return StreamingResponse(
+            cached_events(),
+            media_type='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+            background=BackgroundTask(save_chat_message),
+        )
+
+    try:
+        completion_stream = await groq_provider.call(
+            groq_provider.client.chat.completions.create,
+            messages=[
+                {'role': 'system', 'content': CHAT_SYSTEM_PROMPT},
+                {'role': 'user', 'content': request.prompt},
+            ],
+            model=CHAT_MODEL,
+            max_tokens=CHAT_MAX_TOKENS,
+            stream=True,
+        )
+    except ProviderUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={'Retry-After': str(int(groq_provider.breaker.reset_seconds))})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    parser = TimingStreamParser()
+
+    async def events():
+        try:
+            async for chunk in completion_stream:
+                if not chunk.choices:
+                    continue
+                text = parser.feed(chunk.choices[0].delta.content or '')
+                if text:
+                    yield sse_event('token', {'text': text})
+            text = parser.flush()
+            if text:
+                yield sse_event('token', {'text': text})
+            ai_response, context = parser.result()
+            completed.update(response=ai_response, context=context)
+            if ai_response and context:
+                chat_cache.put(request.prompt, ai_response, context)
+            yield sse_event('done', {'response': ai_response, 'timing': context})
+        except Exception as e:
+            logger.error("Chat stream failed: %s", e)
+            yield sse_event('error', {'detail': str(e)})
+        finally:
+            await completion_stream.close()
+
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        background=BackgroundTask(save_chat_message),
+    )
+
+@app.get('/healthz')
+async def healthz():
+    """Endpoint for liveness probes and startup benchmarks; answers as soon as startup hooks have run"""
+    return {'status': 'ok'}
+
 if __name__ == '__main__':
-    uvicorn.run('main:app', host='0.0.0.0', port=8000, reload=True)
\ No newline at end of file
+    # Same as `python serve.py`; see serve.py for workers, preload, graceful drain and --reload for development
+    import serve
+    serve.main()
\ No newline at end of file
@@ -0,0 +1,254 @@
+import os
+import json
+import math
+import time
+import asyncio
+from collections import OrderedDict, deque
+
+# Per-class defaults; each can be overridden with ADMISSION_<CLASS>_<SETTING>, e.g. ADMISSION_UPLOAD_CONCURRENCY=4
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', '128'))
+ADMISSION_MAX_CLIENTS = int(os.getenv('ADMISSION_MAX_CLIENTS', '10000'))
+# How quickly the per-class service time estimate follows new samples
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+class TrafficClass:
+    '''
+    One admission class: its scheduling priority (lower runs first), a cap on concurrent requests,
+    a per-client token bucket (`rate` requests per second with bursts of `burst`) and the longest a
+    request may queue before it is shed. Env vars ADMISSION_<NAME>_{CONCURRENCY,RATE,BURST,QUEUE_SECONDS}
+    override the defaults.
+    '''
+
+    def __init__(self, name: str, priority: int, max_concurrency: int, rate: float, burst: int, max_queue_seconds: float):
+        prefix = f"ADMISSION_{name.upper()}_"
+        self.name = name
+        self.priority = priority
+        self.max_concurrency = int(os.getenv(prefix + 'CONCURRENCY', str(max_concurrency)))
+        self.rate = float(os.getenv(prefix + 'RATE', str(rate)))
+        self.burst = int(os.getenv(prefix + 'BURST', str(burst)))
+        self.max_queue_seconds = float(os.getenv(prefix + 'QUEUE_SECONDS', str(max_queue_seconds)))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        '''Spends one token and returns 0, or returns the seconds until a token will be available.'''
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    '''
+    Decides whether, and when, a request may run.
+    A request first spends a token from its client's bucket for its class (429 when empty). It then takes a slot
+    if both its class and the process are under their concurrency caps. Otherwise it queues, and freed slots go to
+    the highest-priority class with waiters. A request whose expected queue time exceeds its class target is shed
+    with a 429 straight away; one that has waited past the target is shed too. Retry-After tells the client when
+    a retry is likely to succeed.
+    '''
+
+    def __init__(self, classes: list[TrafficClass], max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+                 max_clients: int = ADMISSION_MAX_CLIENTS):
+        self.classes = sorted(classes, key=lambda traffic_class: traffic_class.priority)
+        self.by_name = {traffic_class.name: traffic_class for traffic_class in classes}
+        self.max_in_flight = max_in_flight
+        self.max_clients = max_clients
+        self.in_flight = 0
+        self.class_in_flight = {traffic_class.name: 0 for traffic_class in classes}
+        self.waiters = {traffic_class.name: deque() for traffic_class in classes}
+        self.service_seconds = {traffic_class.name: 0.0 for traffic_class in classes}
+        self.buckets = OrderedDict()
+        self.admitted = {traffic_class.name: 0 for traffic_class in classes}
+        self.rejected = {traffic_class.name: {'rate_limited': 0, 'shed': 0} for traffic_class in classes}
+
+    def _bucket(self, traffic_class: TrafficClass, client: str) -> TokenBucket:
+        key = (traffic_class.name, client)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(traffic_class.rate, traffic_class.burst)
+            if len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        return bucket
+
+    def _has_room(self, traffic_class: TrafficClass) -> bool:
+        return self.in_flight < self.max_in_flight and self.class_in_flight[traffic_class.name] < traffic_class.max_concurrency
+
+    def _take(self, traffic_class: TrafficClass) -> None:
+        self.in_flight += 1
+        self.class_in_flight[traffic_class.name] += 1
+        self.admitted[traffic_class.name] += 1
+
+    def _queued_ahead(self, traffic_class: TrafficClass) -> int:
+        return sum(len(self.waiters[other.name]) for other in self.classes if other.priority <= traffic_class.priority)
+
+    def estimated_wait(self, traffic_class: TrafficClass) -> float:
+        '''Rough queueing delay for a new request: the work queued ahead of it spread over the slots it can use.'''
+        ahead = self._queued_ahead(traffic_class)
+        if ahead == 0 and self._has_room(traffic_class):
+            return 0.0
+        slots = max(1, min(traffic_class.max_concurrency, self.max_in_flight))
+        return (ahead + 1) * self.service_seconds[traffic_class.name] / slots
+
+    def _dispatch(self) -> None:
+        for traffic_class in self.classes:
+            queue = self.waiters[traffic_class.name]
+            while queue and self._has_room(traffic_class):
+                future = queue.popleft()
+                if future.done():
+                    continue
+                self._take(traffic_class)
+                future.set_result(None)
+
+    def _reject(self, traffic_class: TrafficClass, reason: str, retry_after: float):
+        self.rejected[traffic_class.name][reason] += 1
+        raise Overloaded(reason, retry_after)
+
+    async def acquire(self, traffic_class: TrafficClass, client: str) -> float:
+        '''Waits for a slot and returns the seconds spent queued, or raises Overloaded.'''
+        wait = self._bucket(traffic_class, client).take()
+        if wait > 0:
+            self._reject(traffic_class, 'rate_limited', wait)
+
+        if self._queued_ahead(traffic_class) == 0 and self._has_room(traffic_class):
+            self._take(traffic_class)
+            return 0.0
+
+        estimated = self.estimated_wait(traffic_class)
+        if estimated > traffic_class.max_queue_seconds:
+            self._reject(traffic_class, 'shed', estimated)
+
+        start = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        queue = self.waiters[traffic_class.name]
+        queue.append(future)
+        try:
+            await asyncio.wait_for(future, traffic_class.max_queue_seconds)
+        except asyncio.TimeoutError:
+            if future in queue:
+                queue.remove(future)
+            self._reject(traffic_class, 'shed', max(self.estimated_wait(traffic_class), traffic_class.max_queue_seconds))
+        except BaseException:
+            # Client went away: hand back a slot that was granted at the same moment, or leave the queue
+            if future.done() and not future.cancelled():
+                self.release(traffic_class, 0.0)
+            elif future in queue:
+                queue.remove(future)
+            raise
+        return time.monotonic() - start
+
+    def release(self, traffic_class: TrafficClass, service_seconds: float) -> None:
+        if service_seconds > 0:
+            previous = self.service_seconds[traffic_class.name]
+            self.service_seconds[traffic_class.name] = (
+                service_seconds if previous == 0 else previous + SERVICE_TIME_SMOOTHING * (service_seconds - previous)
+            )
+        self.in_flight -= 1
+        self.class_in_flight[traffic_class.name] -= 1
+        self._dispatch()
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'tracked_clients': len(self.buckets),
+            'classes': {
+                traffic_class.name: {
+                    'priority': traffic_class.priority,
+                    'in_flight': self.class_in_flight[traffic_class.name],
+                    'max_concurrency': traffic_class.max_concurrency,
+                    'queued': len(self.waiters[traffic_class.name]),
+                    'service_seconds': round(self.service_seconds[traffic_class.name], 4),
+                    'admitted': self.admitted[traffic_class.name],
+                    'rejected': dict(self.rejected[traffic_class.name]),
+                }
+                for traffic_class in self.classes
+            },
+        }
+
+
+class AdmissionControlMiddleware:
+    '''
+    ASGI middleware that runs every HTTP request through an AdmissionController.
+    `routes` maps path prefixes to class names (longest prefix wins, unmatched paths use `default`); a prefix mapped to
+    None bypasses admission, for cheap endpoints such as /metrics that must keep answering during a surge.
+    Clients are identified by their peer address, which uvicorn's proxy_headers sets from X-Forwarded-For only when
+    the connection comes from a trusted proxy. Request headers such as X-User-Id are chosen by the client, so keying
+    on them would let one caller spread over unlimited buckets and push real clients out of the bucket LRU.
+    '''
+
+    def __init__(self, app, controller: AdmissionController, routes: dict[str, str | None], default: str,
+                 queue_histogram=None, rejected_counter=None):
+        self.app = app
+        self.controller = controller
+        self.routes = sorted(routes.items(), key=lambda item: len(item[0]), reverse=True)
+        self.default = default
+        self.queue_histogram = queue_histogram
+        self.rejected_counter = rejected_counter
+
+    def _class_for(self, path: str) -> TrafficClass | None:
+        for prefix, name in self.routes:
+            if path.startswith(prefix):
+                return self.controller.by_name[name] if name is not None else None
+        return self.controller.by_name[self.default]
+
+    @staticmethod
+    def _client(scope) -> str:
+        client = scope.get('client')
+        return client[0] if client else 'unknown'
+
+    async def _reject(self, send, error: Overloaded) -> None:
+        retry_after = max(1, math.ceil(min(error.retry_after, 3600)))
+        message = 'Rate limit exceeded' if error.reason == 'rate_limited' else 'Server is busy'
+        body = json.dumps({'detail': f"{message}, retry in {retry_after}s"}).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': 429,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'retry-after', str(retry_after).encode()),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] == 'OPTIONS':
+            return await self.app(scope, receive, send)
+        traffic_class = self._class_for(scope['path'])
+        if traffic_class is None:
+            return await self.app(scope, receive, send)
+
+        try:
+            queued = await self.controller.acquire(traffic_class, self._client(scope))
+        except Overloaded as error:
+            if self.rejected_counter is not None:
+                self.rejected_counter.inc(traffic_class.name, error.reason)
+            return await self._reject(send, error)
+        if self.queue_histogram is not None:
+            self.queue_histogram.observe(queued, traffic_class.name)
+
+        start = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(traffic_class, time.monotonic() - start)
@@ -0,0 +1,45 @@
+import time
+
+
+class RequestMetricsMiddleware:
+    '''
+    ASGI middleware that observes each HTTP request's latency into a histogram labelled by method,
+    route template (e.g. /image/{image_id}, so ids do not explode the label set) and status code.
+    Latency is measured to the start of the response, so long-lived SSE streams are not counted as slow.
+    '''
+
+    def __init__(self, app, histogram):
+        self.app = app
+        self.histogram = histogram
+        self._route_paths = {}
+
+    def _route(self, scope) -> str:
+        endpoint = scope.get('endpoint')
+        if endpoint is None:
+            return 'unmatched'
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            routes = getattr(scope.get('app'), 'routes', ())
+            path = next((route.path for route in routes if getattr(route, 'endpoint', None) is endpoint), 'unknown')
+            self._route_paths[endpoint] = path
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        observed = False
+
+        async def timed_send(message):
+            nonlocal observed
+            if message['type'] == 'http.response.start' and not observed:
+                observed = True
+                self.histogram.observe(time.perf_counter() - start, scope['method'], self._route(scope), str(message['status']))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            if not observed:
+                self.histogram.observe(time.perf_counter() - start, scope['method'], self._route(scope), '500')
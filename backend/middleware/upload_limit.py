@@ -0,0 +1,76 @@
+import json
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadSizeLimitMiddleware:
+    '''
+    ASGI middleware that caps request body size per path prefix before the body is parsed.
+    A declared Content-Length over the limit is rejected without reading anything; chunked bodies
+    are counted as they stream in and cut off as soon as they cross the limit.
+    '''
+
+    def __init__(self, app, limits: dict[str, int]):
+        self.app = app
+        # Longest prefix first so /analyze/batch wins over /analyze
+        self.limits = sorted(limits.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def _limit_for(self, path: str) -> int | None:
+        for prefix, limit in self.limits:
+            if path.startswith(prefix):
+                return limit
+        return None
+
+    async def _reject(self, send, limit: int) -> None:
+        body = json.dumps({'detail': f"Upload exceeds the {limit // (1024 * 1024)} MB limit"}).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': 413,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        limit = self._limit_for(scope['path'])
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        for name, value in scope['headers']:
+            if name == b'content-length' and value.isdigit() and int(value) > limit:
+                return await self._reject(send, limit)
+
+        received = 0
+        exceeded = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > limit:
+                    exceeded = True
+                    raise UploadTooLarge()
+            return message
+
+        async def limited_send(message):
+            nonlocal response_started
+            # The framework turns the error raised mid-parse into its own 4xx; answer with a 413 instead
+            if exceeded:
+                if message['type'] == 'http.response.start' and not response_started:
+                    response_started = True
+                    await self._reject(send, limit)
+                return
+            if message['type'] == 'http.response.start':
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, limited_send)
+        except UploadTooLarge:
+            if not response_started:
+                await self._reject(send, limit)
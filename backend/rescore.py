@@ -0,0 +1,265 @@
+'''
+Offline re-assessment of every stored image, for when the Claude prompt or model changes.
+
+From the backend directory:
+    python rescore.py                              # score every image, resuming from rescore_checkpoint.json
+    python rescore.py --concurrency 16 --rate 5    # at most 16 model calls in flight and 5 started per second
+    python rescore.py --restart                    # ignore the checkpoint and start over
+
+Images are read in id order, one chunk at a time, with the next chunk fetched while the current one is scored.
+A read that fails is retried with backoff; if it keeps failing the run stops without being marked complete.
+Model calls go through the same ResilientProvider and prompt as /analyze (llm/assessment.py), so retries and
+circuit breaking apply. Each chunk's new assessments are written with one bulk insert. They are new rows, and every
+reader takes the most recent assessment per image, so the old scores stay as history. The checkpoint moves past a
+chunk only after its insert succeeds, so a run that is killed resumes at the first chunk it had not written. If it
+dies between the insert and the checkpoint write, that one chunk is scored twice and its images get two new rows.
+
+Images the model cannot score (an answer that does not parse, a rejected request, a URL outside the bucket) are
+skipped and listed in the checkpoint's failed_ids. An outage is different: when calls fail because the provider's
+breaker is open or its retries ran out, the chunk waits for the breaker and tries those images again, up to
+RESCORE_OUTAGE_RETRIES times. If they still fail, only the images before the first unscored one are written, the
+checkpoint stops there and the run exits, so the next run starts with that image.
+
+The script runs in its own process, so running API servers do not see its writes directly. Their map indexes pick
+up the new scores on their next start. With RESPONSE_CACHE_REDIS_URL set, cached reads are invalidated in the shared
+tier as each chunk is written; without it, each server's in-process cache serves the old scores for up to
+RESPONSE_CACHE_MEMORY_TTL_SECONDS.
+'''
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from cache.response_cache import ResponseCache
+from db.async_supabase_client import fetch_images_page, insert_safety_assessments
+from db.connection import init_supabase, close_supabase
+from db.invalidation import on_write
+from llm.assessment import request_assessment
+from llm.providers import build_claude_provider, is_retryable, ProviderUnavailable
+from middleware.admission import TokenBucket
+from storage.s3 import AsyncS3Storage
+from telemetry.logger import get_logger
+
+logger = get_logger('rescore')
+
+load_dotenv()
+
+RESCORE_CHUNK_SIZE = int(os.getenv('RESCORE_CHUNK_SIZE', '200'))
+RESCORE_CONCURRENCY = int(os.getenv('RESCORE_CONCURRENCY', '8'))
+# Model calls started per second across the run; 0 leaves only the concurrency cap
+RESCORE_RATE = float(os.getenv('RESCORE_RATE', '0'))
+RESCORE_CHECKPOINT_PATH = os.getenv('RESCORE_CHECKPOINT_PATH', 'rescore_checkpoint.json')
+# Times a chunk waits out an open breaker and retries the images it could not score before the run stops
+RESCORE_OUTAGE_RETRIES = int(os.getenv('RESCORE_OUTAGE_RETRIES', '3'))
+# Attempts at reading one chunk of images before the run stops
+RESCORE_PAGE_ATTEMPTS = int(os.getenv('RESCORE_PAGE_ATTEMPTS', '5'))
+
+S3_BUCKET = os.getenv('S3_BUCKET')
+AWS_REGION = os.getenv('AWS_REGION')
+S3_ENDPOINT_URL = os.getenv('S3_ENDPOINT_URL')
+CLAUDE_API_KEY = os.getenv('CLAUDE_API_KEY')
+SUPABASE_URL = os.getenv('SUPABASE_URL')
+SUPABASE_KEY = os.getenv('SUPABASE_KEY')
+
+s3_storage = AsyncS3Storage(S3_BUCKET, region=AWS_REGION, endpoint_url=S3_ENDPOINT_URL)
+claude_provider = build_claude_provider(CLAUDE_API_KEY)
+# Only reaches the API servers' caches through the shared Redis tier; see the module docstring
+response_cache = ResponseCache()
+on_write(response_cache.invalidate_write)
+
+
+class ProviderOutage(RuntimeError):
+    '''Raised when the model provider stays unavailable, after the checkpoint is saved at the first unscored image.'''
+
+
+def load_checkpoint(path: str) -> dict:
+    '''Reads the checkpoint of an earlier run, or returns a fresh one.'''
+    try:
+        with open(path) as checkpoint_file:
+            return json.load(checkpoint_file)
+    except FileNotFoundError:
+        return {
+            'after_id': None,
+            'scored': 0,
+            'failed': 0,
+            'failed_ids': [],
+            'chunks': 0,
+            'elapsed_seconds': 0.0,
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'completed_at': None,
+        }
+
+
+def save_checkpoint(path: str, checkpoint: dict) -> None:
+    '''Writes the checkpoint to a temporary file and renames it over the old one, so a crash never leaves half a file.'''
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w') as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file, indent=2)
+    os.replace(temporary, path)
+
+
+async def fetch_chunk(supabase_client, after_id: str | None, chunk_size: int) -> list[dict]:
+    '''Reads the next chunk of images, retrying failed reads with backoff. Raises rather than ending the run early.'''
+    for attempt in range(1, RESCORE_PAGE_ATTEMPTS + 1):
+        rows = await fetch_images_page(supabase_client, 'id,image_url', after_id, chunk_size)
+        if rows is not None:
+            return rows
+        if attempt < RESCORE_PAGE_ATTEMPTS:
+            delay = 2 ** attempt
+            logger.warning("Reading images after %s failed (attempt %s); retrying in %ss", after_id, attempt, delay)
+            await asyncio.sleep(delay)
+    raise RuntimeError(f"Reading images after {after_id} failed {RESCORE_PAGE_ATTEMPTS} times; rerun to resume")
+
+
+def is_outage(result) -> bool:
+    '''Whether a scoring result is a provider failure worth waiting out, rather than a problem with the image.'''
+    if not isinstance(result, Exception):
+        return False
+    # A rejected API key fails every image alike, so it stops the run instead of marking them all failed
+    return isinstance(result, ProviderUnavailable) or is_retryable(result) or getattr(result, 'status_code', None) in (401, 403)
+
+
+async def score_image(row: dict, semaphore: asyncio.Semaphore, bucket: TokenBucket | None) -> dict:
+    '''Runs one stored image through the current prompt and model and returns the parsed analysis. Raises on failure.'''
+    key = s3_storage.key_for_url(row.get('image_url'))
+    if key is None:
+        raise ValueError(f"{row.get('image_url')} is not an object in {s3_storage.bucket}")
+    async with semaphore:
+        while bucket is not None and (wait := bucket.take()) > 0:
+            await asyncio.sleep(wait)
+        image_url = await s3_storage.presign(key)
+        return await request_assessment(claude_provider, image_url)
+
+
+async def score_chunk(rows: list[dict], semaphore: asyncio.Semaphore, bucket: TokenBucket | None) -> list:
+    '''
+    Scores a chunk, returning an analysis or the exception for each row. Rows that failed because of an outage are
+    retried after the breaker's reset time, up to RESCORE_OUTAGE_RETRIES times.
+    '''
+    results = await asyncio.gather(*(score_image(row, semaphore, bucket) for row in rows), return_exceptions=True)
+    for _ in range(RESCORE_OUTAGE_RETRIES):
+        pending = [index for index, result in enumerate(results) if is_outage(result)]
+        if not pending:
+            break
+        wait = claude_provider.breaker.reset_seconds
+        logger.warning("Model provider unavailable for %s images (%s); retrying in %.0fs", len(pending), results[pending[0]], wait)
+        await asyncio.sleep(wait)
+        retried = await asyncio.gather(*(score_image(rows[index], semaphore, bucket) for index in pending), return_exceptions=True)
+        for index, result in zip(pending, retried):
+            results[index] = result
+    return results
+
+
+async def rescore(supabase_client, checkpoint_path: str, chunk_size: int, concurrency: int, rate: float,
+                  max_chunks: int = None) -> dict:
+    '''
+    Scores images chunk by chunk from the checkpoint onwards and returns the updated checkpoint.
+    `max_chunks` stops the run early, leaving a checkpoint the next run resumes from.
+    '''
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint['completed_at']:
+        logger.info("Checkpoint %s is already complete; pass --restart to score again", checkpoint_path)
+        return checkpoint
+
+    semaphore = asyncio.Semaphore(concurrency)
+    bucket = TokenBucket(rate, max(1, concurrency)) if rate > 0 else None
+    run_start = time.perf_counter()
+    run_scored = 0
+    next_page = asyncio.create_task(fetch_chunk(supabase_client, checkpoint['after_id'], chunk_size))
+    chunks = 0
+    while True:
+        rows = await next_page
+        if not rows:
+            checkpoint['completed_at'] = datetime.now(timezone.utc).isoformat()
+            break
+        if len(rows) == chunk_size:
+            next_page = asyncio.create_task(fetch_chunk(supabase_client, rows[-1]['id'], chunk_size))
+        else:
+            next_page = asyncio.create_task(asyncio.sleep(0, result=[]))
+
+        chunk_start = time.perf_counter()
+        analyses = await score_chunk(rows, semaphore, bucket)
+        # Nothing from the first image the outage left unscored onwards is written, so the checkpoint never passes it
+        scored_until = next((index for index, analysis in enumerate(analyses) if is_outage(analysis)), len(rows))
+        assessment_rows, failed_ids = [], []
+        for row, analysis in zip(rows[:scored_until], analyses):
+            if isinstance(analysis, BaseException):
+                logger.warning("Re-scoring image %s failed: %s", row['id'], analysis)
+                failed_ids.append(row['id'])
+                continue
+            assessment_rows.append({
+                'image_id': row['id'],
+                'safety_score': analysis.get('Score', 0),
+                'estimated_magnitude_survivability': analysis.get('Magnitude Survivability', ''),
+                'description': analysis.get('Description', ''),
+            })
+        if await insert_safety_assessments(supabase_client, assessment_rows) is None:
+            next_page.cancel()
+            raise RuntimeError(f"Bulk insert of {len(assessment_rows)} assessments failed; rerun to resume after {checkpoint['after_id']}")
+
+        if scored_until:
+            checkpoint['after_id'] = rows[scored_until - 1]['id']
+        checkpoint['scored'] += len(assessment_rows)
+        checkpoint['failed'] += len(failed_ids)
+        checkpoint['failed_ids'] += failed_ids
+        checkpoint['elapsed_seconds'] += time.perf_counter() - chunk_start
+        if scored_until < len(rows):
+            next_page.cancel()
+            save_checkpoint(checkpoint_path, checkpoint)
+            raise ProviderOutage(f"Model provider still unavailable ({analyses[scored_until]}); rerun to resume after {checkpoint['after_id']}")
+        checkpoint['chunks'] += 1
+        save_checkpoint(checkpoint_path, checkpoint)
+
+        run_scored += len(assessment_rows)
+        chunk_seconds = time.perf_counter() - chunk_start
+        logger.info("Chunk %s: %s scored, %s failed in %.1fs (%.1f images/s); %s scored so far",
+                    checkpoint['chunks'], len(assessment_rows), len(failed_ids), chunk_seconds,
+                    len(rows) / chunk_seconds if chunk_seconds else 0.0, checkpoint['scored'])
+
+        chunks += 1
+        if max_chunks is not None and chunks >= max_chunks:
+            next_page.cancel()
+            break
+
+    save_checkpoint(checkpoint_path, checkpoint)
+    run_seconds = time.perf_counter() - run_start
+    logger.info("Run finished: %s scored in %.1fs (%.1f images/s); totals %s scored, %s failed",
+                run_scored, run_seconds, run_scored / run_seconds if run_seconds else 0.0,
+                checkpoint['scored'], checkpoint['failed'])
+    return checkpoint
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chunk-size', type=int, default=RESCORE_CHUNK_SIZE, help='images read and bulk-inserted at a time')
+    parser.add_argument('--concurrency', type=int, default=RESCORE_CONCURRENCY, help='model calls in flight at once')
+    parser.add_argument('--rate', type=float, default=RESCORE_RATE, help='model calls started per second (0 = no limit)')
+    parser.add_argument('--checkpoint', default=RESCORE_CHECKPOINT_PATH)
+    parser.add_argument('--max-chunks', type=int, help='stop after this many chunks (resume later)')
+    parser.add_argument('--restart', action='store_true', help='discard the checkpoint and score every image again')
+    return parser.parse_args(argv)
+
+
+async def main_async(args) -> int:
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    supabase_client = await init_supabase(SUPABASE_URL, SUPABASE_KEY)
+    try:
+        checkpoint = await rescore(supabase_client, args.checkpoint, args.chunk_size, args.concurrency, args.rate, args.max_chunks)
+    except ProviderOutage as e:
+        logger.error("%s", e)
+        return 1
+    finally:
+        await claude_provider.close()
+        s3_storage.close()
+        await response_cache.close()
+        await close_supabase()
+    print(json.dumps({key: value for key, value in checkpoint.items() if key != 'failed_ids'}, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main_async(parse_args())))
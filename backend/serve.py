@@ -0,0 +1,132 @@
+'''
+Production entry point for the API (replaces running main.py under uvicorn's reloader).
+
+From the backend directory:
+    python serve.py                             # one process on 0.0.0.0:8000
+    python serve.py --workers 4                 # uvicorn supervisor with 4 worker processes
+    python serve.py --workers 4 --preload       # gunicorn: import the app once, then fork the workers (needs gunicorn)
+    python serve.py --reload                    # development auto-reload
+
+Each worker keeps its own map indexes, change log and in-process response cache, and updates them from the
+assessments published on the broadcaster feed. With BROADCAST_REDIS_URL that feed is a Redis channel shared by every
+worker and every instance, so all of them apply each write; without it only the writing process would. More than one
+worker, or more than one instance behind a load balancer, therefore needs BROADCAST_REDIS_URL, and serve.py refuses
+--workers above 1 without it. /images/changes cursors remain per worker: a client whose next request lands on
+another worker is sent the full set again.
+
+Every option also reads an environment variable (HOST, PORT, WEB_CONCURRENCY, GRACEFUL_TIMEOUT_SECONDS, PRELOAD_APP).
+On SIGTERM the server stops accepting connections and gives in-flight requests up to the graceful timeout. It then runs
+the shutdown hooks, which give running analysis jobs JOB_DRAIN_SECONDS to finish. Size the platform's kill timeout
+to cover both.
+'''
+import os
+import argparse
+
+from telemetry.logger import get_logger
+
+logger = get_logger('serve')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=os.getenv('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', '8000')))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('WEB_CONCURRENCY', '1')),
+                        help='worker processes; above 1 needs BROADCAST_REDIS_URL so every worker receives the map updates')
+    parser.add_argument('--graceful-timeout', type=float, default=float(os.getenv('GRACEFUL_TIMEOUT_SECONDS', '20')),
+                        help='seconds in-flight requests get to finish after SIGTERM')
+    parser.add_argument('--keep-alive', type=int, default=int(os.getenv('KEEP_ALIVE_SECONDS', '5')))
+    parser.add_argument('--preload', action='store_true', default=os.getenv('PRELOAD_APP') == '1',
+                        help='import the app once in the master and fork workers from it (gunicorn)')
+    parser.add_argument('--reload', action='store_true', help='restart on code changes (development only)')
+    parser.add_argument('--no-access-log', dest='access_log', action='store_false')
+    return parser.parse_args(argv)
+
+
+def check_workers(args) -> None:
+    '''Exits when several workers would run without the shared feed that keeps their map indexes in step.'''
+    if args.workers <= 1 or args.reload:
+        return
+    from live.broadcast import BROADCAST_REDIS_URL, redis_asyncio
+
+    if not BROADCAST_REDIS_URL or redis_asyncio is None:
+        logger.error("--workers %s (or WEB_CONCURRENCY) needs BROADCAST_REDIS_URL and the redis package: without the "
+                     "shared feed each worker's map indexes and change log only see the writes it handles itself", args.workers)
+        raise SystemExit(1)
+
+
+def requeue_orphaned_jobs() -> None:
+    '''
+    With several workers on one queue file, jobs left `running` by the previous deployment are requeued once here,
+    before any worker starts, and the workers are told not to do it themselves.
+    '''
+    os.environ['JOB_REQUEUE_ON_START'] = '0'
+    from jobs.queue import SQLiteJobStore
+
+    store = SQLiteJobStore()
+    requeued = store.requeue_running()
+    store.close()
+    if requeued:
+        logger.info("Requeued %s interrupted jobs", requeued)
+
+
+def run_gunicorn(args) -> None:
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        logger.error("--preload needs gunicorn: pip install gunicorn")
+        raise SystemExit(1)
+
+    def post_fork(server, worker):
+        # Threads and SQLite connections do not survive fork; give each worker its own
+        import main
+        from telemetry.logger import reset_after_fork
+
+        reset_after_fork()
+        main.job_pool.store.reopen()
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in {
+                'bind': f"{args.host}:{args.port}",
+                'workers': args.workers,
+                'worker_class': 'uvicorn.workers.UvicornWorker',
+                'preload_app': True,
+                'graceful_timeout': int(args.graceful_timeout),
+                'keepalive': args.keep_alive,
+                'accesslog': '-' if args.access_log else None,
+                'post_fork': post_fork,
+            }.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            import main
+            return main.app
+
+    Server().run()
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    check_workers(args)
+    if args.workers > 1 or args.preload:
+        requeue_orphaned_jobs()
+    if args.preload and not args.reload:
+        return run_gunicorn(args)
+
+    import uvicorn
+    uvicorn.run(
+        'main:app',
+        host=args.host,
+        port=args.port,
+        workers=None if args.reload else args.workers,
+        reload=args.reload,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        timeout_keep_alive=args.keep_alive,
+        access_log=args.access_log,
+        proxy_headers=True,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import os
+import uuid
+import bisect
+import threading
+import numpy as np
+from spatial.clustering import parse_score
+from spatial.heatmap import parse_magnitude
+
+# Columns a change carries: the map marker plus the latest assessment summary
+CHANGE_COLUMNS = ('id', 'latitude', 'longitude', 'location_name', 'image_url', 'safety_score', 'estimated_magnitude_survivability')
+
+# Little-endian record layout of the binary /images/changes output
+CHANGE_RECORD = np.dtype([
+    ('id', 'V16'),                       # image uuid, 16 raw bytes
+    ('latitude', '<f4'),
+    ('longitude', '<f4'),
+    ('safety_score', '<f4'),             # NaN when the image has no numeric score yet
+    ('magnitude_survivability', '<f4'),  # NaN when the survivability text holds no number
+])
+
+
+class ChangeLog:
+    '''
+    Monotonic, in-process log of map points that were added or updated.
+    Every write gets the next sequence number and replaces the image's previous entry, so a client that
+    remembers the last cursor it saw only receives each changed point once, in its latest state.
+    Cursors are "<epoch>.<seq>"; the epoch is random per log, so a cursor from before a restart or from another
+    worker process is recognised as foreign and the client is sent everything again.
+    '''
+
+    def __init__(self):
+        self.epoch = os.urandom(4).hex()
+        self._seq = 0
+        self._points: dict[str, tuple[int, dict]] = {}
+        # (seq, image id) in write order; entries superseded by a later write stay until compaction
+        self._order: list[tuple[int, str]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    @property
+    def cursor(self) -> str:
+        return f"{self.epoch}.{self._seq}"
+
+    def record(self, row: dict) -> bool:
+        '''Appends a new or updated point. Rows without an id or coordinates are ignored.'''
+        image_id = row.get('id')
+        latitude = row.get('latitude')
+        longitude = row.get('longitude')
+        if image_id is None or latitude is None or longitude is None:
+            return False
+
+        image_id = str(image_id)
+        with self._lock:
+            previous = self._points.get(image_id)
+            point = dict(previous[1]) if previous else {}
+            point.update({column: row[column] for column in CHANGE_COLUMNS if column in row})
+            point['id'] = image_id
+            point['latitude'] = float(latitude)
+            point['longitude'] = float(longitude)
+
+            self._seq += 1
+            self._points[image_id] = (self._seq, point)
+            self._order.append((self._seq, image_id))
+            if len(self._order) > 2 * len(self._points) + 1024:
+                self._order = [(seq, point_id) for seq, point_id in self._order if self._points[point_id][0] == seq]
+        return True
+
+    def parse_cursor(self, cursor: str | None) -> tuple[int, bool]:
+        '''Returns (seq to resume after, reset). A missing, malformed or foreign cursor restarts from 0 with reset=True.'''
+        if not cursor:
+            return 0, False
+        epoch, _, seq = cursor.partition('.')
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > self._seq:
+            return 0, True
+        return int(seq), False
+
+    def since(self, seq: int, limit: int) -> tuple[list[dict], str, bool]:
+        '''Returns up to `limit` points changed after `seq`, the cursor to resume from, and whether more remain.'''
+        with self._lock:
+            start = bisect.bisect_right(self._order, seq, key=lambda entry: entry[0])
+            points, last_seq = [], seq
+            for position in range(start, len(self._order)):
+                entry_seq, image_id = self._order[position]
+                current_seq, point = self._points[image_id]
+                if current_seq != entry_seq:
+                    continue
+                if len(points) == limit:
+                    return points, f"{self.epoch}.{last_seq}", True
+                points.append(dict(point))
+                last_seq = entry_seq
+            return points, f"{self.epoch}.{self._seq}", False
+
+    @staticmethod
+    def pack(points: list[dict]) -> np.ndarray:
+        '''Packs points into CHANGE_RECORD structs, dropping the text columns.'''
+        records = np.zeros(len(points), dtype=CHANGE_RECORD)
+        for index, point in enumerate(points):
+            score = parse_score(point.get('safety_score'))
+            magnitude = parse_magnitude(point.get('estimated_magnitude_survivability'))
+            records[index] = (
+                uuid.UUID(point['id']).bytes,
+                point['latitude'],
+                point['longitude'],
+                np.nan if score is None else score,
+                np.nan if magnitude is None else magnitude,
+            )
+        return records
@@ -0,0 +1,106 @@
+import math
+import threading
+
+# Zoom levels that get precomputed clusters; above MAX_CLUSTER_ZOOM the map shows individual markers
+MIN_CLUSTER_ZOOM = 0
+MAX_CLUSTER_ZOOM = 16
+
+# Each 256px tile is split into CELLS_PER_TILE x CELLS_PER_TILE cluster cells (64px each)
+CELLS_PER_TILE = 4
+
+# Web mercator is undefined at the poles, so clamp latitudes to the usual map range
+MAX_MERCATOR_LAT = 85.05112878
+
+
+def lnglat_to_world(latitude: float, longitude: float) -> tuple[float, float]:
+    '''Projects a coordinate onto the unit web-mercator square, returning (x, y) in [0, 1).'''
+    latitude = max(-MAX_MERCATOR_LAT, min(MAX_MERCATOR_LAT, latitude))
+    x = (longitude + 180.0) / 360.0
+    sin_lat = math.sin(math.radians(latitude))
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(x, 0.0), 1.0 - 1e-12), min(max(y, 0.0), 1.0 - 1e-12)
+
+
+def parse_score(score) -> float | None:
+    '''Returns a numeric safety score, or None when the stored value is missing or not a number.'''
+    try:
+        return float(score)
+    except (TypeError, ValueError):
+        return None
+
+
+class ClusterIndex:
+    '''
+    Grid-based marker clustering with one precomputed level per zoom.
+    Every point is added to exactly one cell on each level, so inserts are O(levels) and
+    a tile or viewport query only reads the aggregates that overlap it.
+    '''
+
+    def __init__(self, min_zoom: int = MIN_CLUSTER_ZOOM, max_zoom: int = MAX_CLUSTER_ZOOM,
+                 cells_per_tile: int = CELLS_PER_TILE):
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.cells_per_tile = cells_per_tile
+        self._levels: dict[int, dict[tuple[int, int], list[float]]] = {
+            zoom: {} for zoom in range(min_zoom, max_zoom + 1)
+        }
+        self._lock = threading.Lock()
+
+    def _grid_size(self, zoom: int) -> int:
+        return (2 ** zoom) * self.cells_per_tile
+
+    def add(self, latitude: float, longitude: float, safety_score=None) -> None:
+        '''Adds a single point (and its safety score, if any) to every zoom level.'''
+        if latitude is None or longitude is None:
+            return
+        latitude, longitude = float(latitude), float(longitude)
+        x, y = lnglat_to_world(latitude, longitude)
+        score = parse_score(safety_score)
+
+        with self._lock:
+            for zoom, cells in self._levels.items():
+                grid_size = self._grid_size(zoom)
+                key = (int(x * grid_size), int(y * grid_size))
+                # [count, sum_lat, sum_lng, score_sum, score_count]
+                aggregate = cells.get(key)
+                if aggregate is None:
+                    aggregate = cells[key] = [0, 0.0, 0.0, 0.0, 0]
+                aggregate[0] += 1
+                aggregate[1] += latitude
+                aggregate[2] += longitude
+                if score is not None:
+                    aggregate[3] += score
+                    aggregate[4] += 1
+
+    def clusters(self, zoom: int, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> list[dict]:
+        '''Returns the cluster centroids, counts and mean safety scores inside the bounding box at a zoom level.'''
+        zoom = max(self.min_zoom, min(self.max_zoom, zoom))
+        grid_size = self._grid_size(zoom)
+        low_x, high_y = lnglat_to_world(min_lat, min_lng)
+        high_x, low_y = lnglat_to_world(max_lat, max_lng)
+        low_col, high_col = int(low_x * grid_size), int(high_x * grid_size)
+        low_row, high_row = int(low_y * grid_size), int(high_y * grid_size)
+
+        results = []
+        with self._lock:
+            cells = self._levels[zoom]
+            if (high_col - low_col + 1) * (high_row - low_row + 1) > len(cells):
+                candidates = (
+                    (key, aggregate) for key, aggregate in cells.items()
+                    if low_col <= key[0] <= high_col and low_row <= key[1] <= high_row
+                )
+            else:
+                candidates = (
+                    ((col, row), cells[(col, row)])
+                    for col in range(low_col, high_col + 1)
+                    for row in range(low_row, high_row + 1)
+                    if (col, row) in cells
+                )
+            for _, (count, sum_lat, sum_lng, score_sum, score_count) in candidates:
+                results.append({
+                    'latitude': sum_lat / count,
+                    'longitude': sum_lng / count,
+                    'count': count,
+                    'mean_safety_score': round(score_sum / score_count, 2) if score_count else None,
+                })
+        return results
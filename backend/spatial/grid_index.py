@@ -0,0 +1,148 @@
+import math
+import heapq
+import bisect
+import threading
+from itertools import islice
+
+# Columns the map actually needs to render a marker and its callout
+MAP_COLUMNS = ('id', 'latitude', 'longitude', 'location_name', 'image_url')
+
+# Size of a grid cell in degrees (~1.1km of latitude around San Jose)
+DEFAULT_CELL_SIZE = 0.01
+
+
+def tile_to_bbox(zoom: int, x: int, y: int) -> tuple[float, float, float, float]:
+    '''Converts a web-mercator (slippy map) tile address into a (min_lat, min_lng, max_lat, max_lng) bounding box.'''
+    n = 2 ** zoom
+    min_lng = x / n * 360.0 - 180.0
+    max_lng = (x + 1) / n * 360.0 - 180.0
+    max_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    min_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return min_lat, min_lng, max_lat, max_lng
+
+
+def _cell_run(ids: list[str], points: dict[str, dict], start: int):
+    '''Yields a cell's points in id order from position `start`.'''
+    for position in range(start, len(ids)):
+        yield points[ids[position]]
+
+
+class SpatialIndex:
+    '''
+    In-process uniform grid index over image locations.
+    Points are bucketed by (lat, lng) cell so a viewport query only touches the cells it overlaps.
+    Each cell also keeps its ids sorted, so a page is a k-way merge that starts at the keyset cursor in every cell
+    and stops after `limit` matches, instead of a scan of every point in the box.
+    '''
+
+    def __init__(self, cell_size: float = DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        self._cells: dict[tuple[int, int], dict[str, dict]] = {}
+        self._cell_ids: dict[tuple[int, int], list[str]] = {}
+        self._cell_of: dict[str, tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._cell_of)
+
+    def __contains__(self, image_id) -> bool:
+        return str(image_id) in self._cell_of
+
+    def _cell(self, latitude: float, longitude: float) -> tuple[int, int]:
+        return math.floor(latitude / self.cell_size), math.floor(longitude / self.cell_size)
+
+    def cell_span(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> int:
+        '''Number of grid cells a bounding box covers, a cheap upper bound on how much work a query does.'''
+        low_row, low_col = self._cell(min_lat, min_lng)
+        high_row, high_col = self._cell(max_lat, max_lng)
+        return (high_row - low_row + 1) * (high_col - low_col + 1)
+
+    def _discard(self, cell: tuple[int, int], image_id: str) -> None:
+        self._cells[cell].pop(image_id, None)
+        ids = self._cell_ids[cell]
+        position = bisect.bisect_left(ids, image_id)
+        if position < len(ids) and ids[position] == image_id:
+            del ids[position]
+        if not self._cells[cell]:
+            del self._cells[cell]
+            del self._cell_ids[cell]
+
+    def insert(self, row: dict) -> bool:
+        '''Adds or replaces a single image row in the index. Rows without coordinates are ignored.'''
+        image_id = row.get('id')
+        latitude = row.get('latitude')
+        longitude = row.get('longitude')
+        if image_id is None or latitude is None or longitude is None:
+            return False
+
+        image_id = str(image_id)
+        point = {column: row.get(column) for column in MAP_COLUMNS}
+        point['id'] = image_id
+        point['latitude'] = float(latitude)
+        point['longitude'] = float(longitude)
+        cell = self._cell(float(latitude), float(longitude))
+
+        with self._lock:
+            previous = self._cell_of.get(image_id)
+            if previous is not None and previous != cell:
+                self._discard(previous, image_id)
+            points = self._cells.setdefault(cell, {})
+            if image_id not in points:
+                bisect.insort(self._cell_ids.setdefault(cell, []), image_id)
+            points[image_id] = point
+            self._cell_of[image_id] = cell
+        return True
+
+    def bulk_load(self, rows) -> int:
+        '''Inserts many rows at once, returning how many were indexed.'''
+        return sum(1 for row in rows if self.insert(row))
+
+    def remove(self, image_id: str) -> bool:
+        '''Drops an image from the index.'''
+        with self._lock:
+            cell = self._cell_of.pop(str(image_id), None)
+            if cell is None:
+                return False
+            self._discard(cell, str(image_id))
+            return True
+
+    def _candidate_cells(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float):
+        '''Yields the populated cells overlapping the bounding box.'''
+        low_row, low_col = self._cell(min_lat, min_lng)
+        high_row, high_col = self._cell(max_lat, max_lng)
+        span = (high_row - low_row + 1) * (high_col - low_col + 1)
+
+        # When zoomed far out it is cheaper to walk the populated cells than every cell in range
+        if span > len(self._cells):
+            for cell in self._cells:
+                if low_row <= cell[0] <= high_row and low_col <= cell[1] <= high_col:
+                    yield cell
+        else:
+            for row in range(low_row, high_row + 1):
+                for col in range(low_col, high_col + 1):
+                    if (row, col) in self._cells:
+                        yield row, col
+
+    def query(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float,
+              limit: int = 500, after_id: str | None = None) -> tuple[list[dict], str | None]:
+        '''
+        Returns up to `limit` points inside the bounding box ordered by id, starting after `after_id`,
+        together with the cursor for the next page (None when there are no more points).
+        '''
+        with self._lock:
+            runs = []
+            for cell in self._candidate_cells(min_lat, min_lng, max_lat, max_lng):
+                ids, points = self._cell_ids[cell], self._cells[cell]
+                start = bisect.bisect_right(ids, after_id) if after_id is not None else 0
+                runs.append(_cell_run(ids, points, start))
+            matches = (
+                point for point in heapq.merge(*runs, key=lambda point: point['id'])
+                if min_lat <= point['latitude'] <= max_lat and min_lng <= point['longitude'] <= max_lng
+            )
+            page = [dict(point) for point in islice(matches, limit + 1)]
+
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = page[-1]['id']
+        return page, next_cursor
@@ -0,0 +1,190 @@
+import re
+import threading
+import numpy as np
+from spatial.clustering import parse_score
+
+# Geohash precisions that get rollups: 3 (~156km) up to 7 (~150m) cells
+MIN_GEOHASH_PRECISION = 3
+MAX_GEOHASH_PRECISION = 7
+
+# Survivable-magnitude histogram edges: <5, 5-6, 6-7, 7-8, >=8
+SURVIVABILITY_EDGES = (5.0, 6.0, 7.0, 8.0)
+SURVIVABILITY_LABELS = ('<5', '5-6', '6-7', '7-8', '>=8')
+
+_GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+_NUMBER_PATTERN = re.compile(r'-?\d+(?:\.\d+)?')
+
+# Columns of the per-cell statistics matrix; the survivability histogram follows them
+COUNT, SCORE_SUM, SCORE_COUNT = 0, 1, 2
+STAT_COLUMNS = 3 + len(SURVIVABILITY_LABELS)
+
+# Little-endian record layout of the binary /heatmap output
+HEATMAP_RECORD = np.dtype([
+    ('latitude', '<f4'),
+    ('longitude', '<f4'),
+    ('count', '<u4'),
+    ('mean_safety_score', '<f4'),  # NaN when no cell assessment had a numeric score
+    ('survivability', '<u4', (len(SURVIVABILITY_LABELS),)),
+])
+
+
+def parse_magnitude(value) -> float | None:
+    '''Pulls the first number out of a survivability value such as "7.5" or "7.5 magnitude".'''
+    if value is None:
+        return None
+    match = _NUMBER_PATTERN.search(str(value))
+    return float(match.group()) if match else None
+
+
+def geohash_bits(precision: int) -> tuple[int, int]:
+    '''Returns the (latitude, longitude) bit counts of a geohash with `precision` characters.'''
+    total = 5 * precision
+    return total // 2, total - total // 2
+
+
+def geohash_cells(latitudes: np.ndarray, longitudes: np.ndarray, precision: int) -> tuple[np.ndarray, np.ndarray]:
+    '''Vectorised geohash cell addresses as (row, column) integer arrays on the precision's lat/lng grid.'''
+    lat_bits, lng_bits = geohash_bits(precision)
+    rows = np.floor((np.clip(latitudes, -90.0, 90.0) + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64)
+    cols = np.floor((np.clip(longitudes, -180.0, 180.0) + 180.0) / 360.0 * (1 << lng_bits)).astype(np.int64)
+    return np.minimum(rows, (1 << lat_bits) - 1), np.minimum(cols, (1 << lng_bits) - 1)
+
+
+def encode_geohash(row: int, col: int, precision: int) -> str:
+    '''Interleaves a cell's row/column bits (longitude first) into its geohash string.'''
+    lat_bits, lng_bits = geohash_bits(precision)
+    value = 0
+    for bit in range(5 * precision):
+        if bit % 2 == 0:
+            lng_bits -= 1
+            value = (value << 1) | ((col >> lng_bits) & 1)
+        else:
+            lat_bits -= 1
+            value = (value << 1) | ((row >> lat_bits) & 1)
+    return ''.join(_GEOHASH_ALPHABET[(value >> shift) & 31] for shift in range(5 * (precision - 1), -1, -5))
+
+
+def precision_for_zoom(zoom: int) -> int:
+    '''Picks a geohash precision whose cells are a few pixels to a few dozen pixels wide at the map zoom.'''
+    return max(MIN_GEOHASH_PRECISION, min(MAX_GEOHASH_PRECISION, (zoom + 3) // 3 + 1))
+
+
+class _Level:
+    '''Column-oriented rollups for one geohash precision, grown by doubling.'''
+
+    def __init__(self, precision: int, capacity: int = 256):
+        self.precision = precision
+        self.slots: dict[tuple[int, int], int] = {}
+        self.rows = np.zeros(capacity, dtype=np.int64)
+        self.cols = np.zeros(capacity, dtype=np.int64)
+        self.stats = np.zeros((capacity, STAT_COLUMNS), dtype=np.float64)
+
+    def slot(self, row: int, col: int) -> int:
+        slot = self.slots.get((row, col))
+        if slot is not None:
+            return slot
+        slot = len(self.slots)
+        if slot == len(self.rows):
+            capacity = 2 * len(self.rows)
+            self.rows = np.resize(self.rows, capacity)
+            self.cols = np.resize(self.cols, capacity)
+            self.stats = np.vstack([self.stats, np.zeros_like(self.stats)])
+        self.rows[slot], self.cols[slot] = row, col
+        self.stats[slot] = 0
+        self.slots[(row, col)] = slot
+        return slot
+
+
+class HeatmapIndex:
+    '''
+    Per-geohash-cell rollups of safety score and survivable magnitude at several precisions.
+    `rebuild` recomputes every level from full columns with NumPy, and `add` folds in a single new assessment,
+    so /heatmap reads precomputed aggregates instead of scanning images and assessments.
+    '''
+
+    def __init__(self, min_precision: int = MIN_GEOHASH_PRECISION, max_precision: int = MAX_GEOHASH_PRECISION):
+        self.min_precision = min_precision
+        self.max_precision = max_precision
+        self._levels = {precision: _Level(precision) for precision in range(min_precision, max_precision + 1)}
+        self._lock = threading.Lock()
+
+    def rebuild(self, latitudes, longitudes, safety_scores, magnitudes) -> None:
+        '''Replaces every level with aggregates computed from parallel per-assessment sequences.'''
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        scores = np.array([parse_score(score) for score in safety_scores], dtype=np.float64)
+        magnitudes = np.array([parse_magnitude(magnitude) for magnitude in magnitudes], dtype=np.float64)
+
+        has_score = ~np.isnan(scores)
+        has_magnitude = ~np.isnan(magnitudes)
+        bins = np.digitize(np.nan_to_num(magnitudes), SURVIVABILITY_EDGES)
+
+        levels = {}
+        for precision in self._levels:
+            rows, cols = geohash_cells(latitudes, longitudes, precision)
+            keys, inverse = np.unique(np.stack([rows, cols], axis=1), axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            cells = len(keys)
+
+            level = _Level(precision, max(256, cells))
+            level.rows[:cells], level.cols[:cells] = keys[:, 0], keys[:, 1]
+            level.stats[:cells, COUNT] = np.bincount(inverse, minlength=cells)
+            level.stats[:cells, SCORE_SUM] = np.bincount(inverse, weights=np.where(has_score, scores, 0.0), minlength=cells)
+            level.stats[:cells, SCORE_COUNT] = np.bincount(inverse, weights=has_score, minlength=cells)
+            for index in range(len(SURVIVABILITY_LABELS)):
+                level.stats[:cells, 3 + index] = np.bincount(inverse, weights=has_magnitude & (bins == index), minlength=cells)
+            level.slots = {key: slot for slot, key in enumerate(zip(keys[:, 0].tolist(), keys[:, 1].tolist()))}
+            levels[precision] = level
+
+        with self._lock:
+            self._levels = levels
+
+    def add(self, latitude: float, longitude: float, safety_score=None, magnitude=None) -> None:
+        '''Folds one new assessment into every precision level.'''
+        if latitude is None or longitude is None:
+            return
+        score = parse_score(safety_score)
+        magnitude = parse_magnitude(magnitude)
+        latitudes, longitudes = np.array([float(latitude)]), np.array([float(longitude)])
+
+        with self._lock:
+            for precision, level in self._levels.items():
+                rows, cols = geohash_cells(latitudes, longitudes, precision)
+                slot = level.slot(int(rows[0]), int(cols[0]))
+                stats = level.stats[slot]
+                stats[COUNT] += 1
+                if score is not None:
+                    stats[SCORE_SUM] += score
+                    stats[SCORE_COUNT] += 1
+                if magnitude is not None:
+                    stats[3 + int(np.digitize(magnitude, SURVIVABILITY_EDGES))] += 1
+
+    def cells(self, precision: int, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> np.ndarray:
+        '''Returns the cells overlapping a bounding box as a HEATMAP_RECORD array (cell centres, counts, means, histograms).'''
+        precision = max(self.min_precision, min(self.max_precision, precision))
+        lat_bits, lng_bits = geohash_bits(precision)
+        (low_row, high_row), (low_col, high_col) = (
+            geohash_cells(np.array([min_lat, max_lat]), np.array([min_lng, max_lng]), precision)
+        )
+
+        with self._lock:
+            level = self._levels[precision]
+            used = len(level.slots)
+            rows, cols = level.rows[:used], level.cols[:used]
+            mask = (rows >= low_row) & (rows <= high_row) & (cols >= low_col) & (cols <= high_col)
+            rows, cols, stats = rows[mask], cols[mask], level.stats[:used][mask]
+
+        records = np.zeros(len(rows), dtype=HEATMAP_RECORD)
+        records['latitude'] = (rows + 0.5) * 180.0 / (1 << lat_bits) - 90.0
+        records['longitude'] = (cols + 0.5) * 360.0 / (1 << lng_bits) - 180.0
+        records['count'] = stats[:, COUNT]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            records['mean_safety_score'] = np.where(stats[:, SCORE_COUNT] > 0, stats[:, SCORE_SUM] / stats[:, SCORE_COUNT], np.nan)
+        records['survivability'] = stats[:, 3:]
+        return records
+
+    def geohashes(self, precision: int, records: np.ndarray) -> list[str]:
+        '''Geohash strings for the records returned by `cells` at the same precision.'''
+        precision = max(self.min_precision, min(self.max_precision, precision))
+        rows, cols = geohash_cells(records['latitude'].astype(np.float64), records['longitude'].astype(np.float64), precision)
+        return [encode_geohash(int(row), int(col), precision) for row, col in zip(rows, cols)]
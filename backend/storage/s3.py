@@ -0,0 +1,129 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from telemetry.metrics import stage_timer
+
+MB = 1024 * 1024
+
+# Uploads larger than the threshold are split into parts and sent in parallel
+MULTIPART_THRESHOLD = int(os.getenv('S3_MULTIPART_THRESHOLD_MB', '8')) * MB
+MULTIPART_CHUNKSIZE = int(os.getenv('S3_MULTIPART_CHUNKSIZE_MB', '8')) * MB
+
+# Bounds how many blocking boto3 calls can run at once on behalf of the event loop
+S3_MAX_WORKERS = int(os.getenv('S3_MAX_WORKERS', '16'))
+
+
+class AsyncS3Storage:
+    '''
+    Async facade over a single boto3 S3 client.
+    boto3 is blocking, so every call runs on a bounded thread pool and is awaited from the event loop.
+    The client (and its connection pool) is created on first use, or by warm_up, and reused for every upload and presign.
+    '''
+
+    def __init__(self, bucket: str, region: str = None, endpoint_url: str = None,
+                 max_workers: int = S3_MAX_WORKERS, client=None):
+        self.bucket = bucket
+        self.region = region
+        self.endpoint_url = endpoint_url
+        self.max_workers = max_workers
+        self._client = client
+        self._client_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='s3')
+        self._transfer_config = None
+
+    def _build_client(self) -> None:
+        # Importing boto3 and loading the S3 service model costs a few hundred ms, so it is kept off the import path
+        import boto3
+        from botocore.config import Config
+        from boto3.s3.transfer import TransferConfig
+
+        if self._client is None:
+            self._client = boto3.client(
+                's3',
+                region_name=self.region,
+                endpoint_url=self.endpoint_url,
+                config=Config(max_pool_connections=self.max_workers * 2, retries={'max_attempts': 3, 'mode': 'standard'}),
+            )
+        self._transfer_config = TransferConfig(
+            multipart_threshold=MULTIPART_THRESHOLD,
+            multipart_chunksize=MULTIPART_CHUNKSIZE,
+            max_concurrency=4,
+        )
+
+    @property
+    def client(self):
+        if self._transfer_config is None:
+            with self._client_lock:
+                if self._transfer_config is None:
+                    self._build_client()
+        return self._client
+
+    def warm_up(self) -> None:
+        '''Builds the client ahead of the first upload. Blocking; run it off the event loop.'''
+        self.client
+
+    async def _run(self, func, *args, **kwargs):
+        '''Runs a blocking call on the S3 pool. Calls go through self.client there, so a cold client is built off the loop.'''
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: func(*args, **kwargs))
+
+    async def upload(self, fileobj, key: str, content_type: str = 'image/jpeg', acl: str = None) -> str:
+        '''Uploads a file-like object under `key` (multipart when it is large), returning the key.'''
+        extra_args = {'ContentType': content_type}
+        if acl:
+            extra_args['ACL'] = acl
+        with stage_timer('s3.put'):
+            await self._run(
+                lambda: self.client.upload_fileobj(
+                    fileobj,
+                    self.bucket,
+                    key,
+                    ExtraArgs=extra_args,
+                    Config=self._transfer_config,
+                )
+            )
+        return key
+
+    async def upload_many(self, uploads: dict, content_type: str = 'image/jpeg') -> list[str]:
+        '''Uploads several objects (e.g. the renditions of one image) concurrently. `uploads` maps key -> file-like object.'''
+        return list(await asyncio.gather(*(self.upload(fileobj, key, content_type) for key, fileobj in uploads.items())))
+
+    async def presign(self, key: str, expiration: int = 3600) -> str:
+        '''Generates a presigned GET URL for the object.'''
+        with stage_timer('s3.presign'):
+            return await self._run(
+                lambda: self.client.generate_presigned_url(
+                    'get_object',
+                    Params={'Bucket': self.bucket, 'Key': key},
+                    ExpiresIn=expiration,
+                )
+            )
+
+    async def delete_many(self, keys: list[str]) -> None:
+        '''Deletes objects in one request; keys that do not exist are ignored.'''
+        if not keys:
+            return
+        with stage_timer('s3.delete'):
+            await self._run(
+                lambda: self.client.delete_objects(
+                    Bucket=self.bucket,
+                    Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True},
+                )
+            )
+
+    def public_url(self, key: str) -> str:
+        '''Returns the permanent (non-signed) URL of the object.'''
+        if self.endpoint_url:
+            return f"{self.endpoint_url.rstrip('/')}/{self.bucket}/{key}"
+        return f"https://{self.bucket}.s3.amazonaws.com/{key}"
+
+    def key_for_url(self, url: str) -> str | None:
+        '''Inverse of public_url: the object key behind a stored image URL, or None when the URL is not in this bucket.'''
+        prefix = self.public_url('')
+        if url and url.startswith(prefix) and len(url) > len(prefix):
+            return url[len(prefix):]
+        return None
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
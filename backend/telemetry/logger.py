@@ -0,0 +1,82 @@
+import os
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# 'json' for one structured object per line, 'text' for a human-readable line
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+
+ROOT_LOGGER = 'quakesafe'
+
+# Attributes every LogRecord has; anything else on a record came from `extra=` and is emitted as a field
+_RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+
+_listener = None
+
+
+class JSONFormatter(logging.Formatter):
+    '''Formats a record as one JSON object: timestamp, level, logger, message, any `extra=` fields and the traceback.'''
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT) -> None:
+    '''
+    Routes the `quakesafe` loggers through a QueueHandler, so a request only enqueues its records and a
+    background QueueListener thread does the formatting and stdout writes. Safe to call more than once.
+    '''
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler()
+    if fmt == 'json':
+        stream.setFormatter(JSONFormatter())
+    else:
+        stream.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger(ROOT_LOGGER)
+    root.setLevel(level)
+    root.handlers[:] = [logging.handlers.QueueHandler(records)]
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(records, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    '''Flushes queued records and stops the listener thread.'''
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def reset_after_fork() -> None:
+    '''Starts a new listener in a forked worker process; the parent's listener thread does not survive fork.'''
+    global _listener
+    _listener = None
+    configure_logging()
+
+
+def get_logger(name: str) -> logging.Logger:
+    '''Returns a child of the `quakesafe` logger, e.g. get_logger("db") -> "quakesafe.db".'''
+    configure_logging()
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
@@ -27,6 +27,28 @@ type AnalysisResult = {
   "Magnitude Survivability": string;
 };
 
+const JOB_POLL_INTERVAL_MS = 1500;
+const JOB_POLL_TIMEOUT_MS = 120000;
+
+// The backend analyzes uploads as a background job; poll it until it finishes
+const waitForAnalysis = async (
+  jobId: string
+): Promise<AnalysisResult | null> => {
+  const deadline = Date.now() + JOB_POLL_TIMEOUT_MS;
+  while (Date.now() < deadline) {
+    const response = await axios.get(`${API_URL}/jobs/${jobId}`);
+    const job = response.data;
+    if (job.status === "done") {
+      return job.result?.analysis ?? null;
+    }
+    if (job.status === "failed") {
+      throw new Error(job.error || "Analysis failed");
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+  }
+  throw new Error("Analysis is taking longer than expected");
+};
+
 const UserDashboard = () => {
   const [image, setImage] = useState<string | null>(null);
   const [userId, setUserId] = useState<string | null>(null);
@@ -253,9 +275,14 @@ const UserDashboard = () => {
         },
       });
 
-      if (response.data && response.data.analysis) {
+      const analysis =
+        response.data && response.data.job_id
+          ? await waitForAnalysis(response.data.job_id)
+          : null;
+
+      if (analysis) {
         // Store the analysis object instead of trying to render it directly
-        setAnalysisResult(response.data.analysis);
+        setAnalysisResult(analysis);
       } else {
         setAnalysisResult({
           Description: "Analysis completed, but no detailed results available.",
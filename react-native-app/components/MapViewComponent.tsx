@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from "react";
+import React, { useState, useEffect, useCallback, useMemo, useRef } from "react";
 import {
   View,
   StyleSheet,
@@ -14,13 +14,25 @@ import { Ionicons } from "@expo/vector-icons"; // Make sure you have expo/vector
 
 type ImageLocation = {
   id: string;
-  user_id: string;
   image_url: string;
   longitude: number;
   latitude: number;
   location_name: string | null;
 };
 
+type Cluster = {
+  latitude: number;
+  longitude: number;
+  count: number;
+  mean_safety_score: number | null;
+};
+
+// A point from /images/changes or a live assessment message
+type ChangedPoint = ImageLocation & {
+  safety_score?: number | string | null;
+  estimated_magnitude_survivability?: string | null;
+};
+
 type SafetyAssessment = {
   id: string;
   image_id: string;
@@ -32,10 +44,38 @@ type SafetyAssessment = {
 
 type MapViewComponentProps = {
   region: Region;
-  locationPins: ImageLocation[];
 };
 
 const API_URL = process.env.EXPO_PUBLIC_API_URL;
+// Matches MAX_IMAGE_BATCH_IDS on the backend
+const ASSESSMENT_BATCH_SIZE = 200;
+// Wait for the map to settle before prefetching, so a pan sends one request rather than one per frame
+const PREFETCH_DELAY_MS = 400;
+// Markers are loaded per viewport page; a view holding more than MAX_VIEWPORT_PAGES pages is shown as clusters
+const VIEWPORT_PAGE_SIZE = 500;
+const MAX_VIEWPORT_PAGES = 4;
+const CHANGES_PAGE_SIZE = 1000;
+const LIVE_RECONNECT_MS = 5000;
+
+const regionBounds = (region: Region) => ({
+  min_lat: region.latitude - region.latitudeDelta / 2,
+  min_lng: region.longitude - region.longitudeDelta / 2,
+  max_lat: region.latitude + region.latitudeDelta / 2,
+  max_lng: region.longitude + region.longitudeDelta / 2,
+});
+
+const withoutIds = <T,>(record: Record<string, T>, ids: Set<string>) =>
+  Object.fromEntries(
+    Object.entries(record).filter(([id]) => !ids.has(id))
+  ) as Record<string, T>;
+
+// Slippy-map zoom level showing roughly this much longitude across the screen
+const regionZoom = (region: Region) =>
+  Math.max(0, Math.min(22, Math.round(Math.log2(360 / region.longitudeDelta))));
+
+const isInRegion = (location: ImageLocation, region: Region) =>
+  Math.abs(location.latitude - region.latitude) <= region.latitudeDelta / 2 &&
+  Math.abs(location.longitude - region.longitude) <= region.longitudeDelta / 2;
 
 // Add this helper function above your component (or inside, before return)
 const renderMagnitudeAdvice = (magnitudeStr?: string | null) => {
@@ -70,15 +110,13 @@ const renderMagnitudeAdvice = (magnitudeStr?: string | null) => {
   }
 };
 
-const MapViewComponent = ({
-  region,
-  locationPins: initialPins,
-}: MapViewComponentProps) => {
+const MapViewComponent = ({ region }: MapViewComponentProps) => {
   const [selectedLocationId, setSelectedLocationId] = useState<string | null>(
     null
   );
-  const [locationPins, setLocationPins] =
-    useState<ImageLocation[]>(initialPins);
+  const [pinsById, setPinsById] = useState<Record<string, ImageLocation>>({});
+  const [clusters, setClusters] = useState<Cluster[]>([]);
+  const [loadError, setLoadError] = useState<string | null>(null);
   const [safetyAssessments, setSafetyAssessments] = useState<
     Record<string, SafetyAssessment | null>
   >({});
@@ -89,52 +127,272 @@ const MapViewComponent = ({
     {}
   );
   const [isRefreshing, setIsRefreshing] = useState(false);
+  const [visibleRegion, setVisibleRegion] = useState<Region>(region);
+  const locationPins = useMemo(() => Object.values(pinsById), [pinsById]);
+  // Read by the prefetch effect without re-running it on every assessment that arrives
+  const assessmentsRef = useRef(safetyAssessments);
+  const loadingRef = useRef(loadingStates);
+  assessmentsRef.current = safetyAssessments;
+  loadingRef.current = loadingStates;
+  // Read by the change and live handlers, which outlive any one render
+  const regionRef = useRef(visibleRegion);
+  regionRef.current = visibleRegion;
+  const showingClustersRef = useRef(false);
+  // /images/changes position the markers on screen are current to
+  const changesCursorRef = useRef<string | null>(null);
+  const viewportRequestRef = useRef(0);
 
-  // Update local state when props change
   useEffect(() => {
-    setLocationPins(initialPins);
-  }, [initialPins]);
+    setVisibleRegion(region);
+  }, [region]);
 
-  const fetchSafetyAssessment = async (imageId: string) => {
-    // Skip if we already have data or are currently loading
-    if (safetyAssessments[imageId] !== undefined || loadingStates[imageId]) {
+  // Loads the markers inside a region from /images/viewport, or its clusters when it holds too many to draw
+  const loadViewport = useCallback(async (view: Region) => {
+    const requestId = ++viewportRequestRef.current;
+    const bounds = regionBounds(view);
+    try {
+      const loaded: Record<string, ImageLocation> = {};
+      let changesCursor: string | null = null;
+      let pageCursor: string | null = null;
+      let useClusters = false;
+      for (let page = 0; page < MAX_VIEWPORT_PAGES; page++) {
+        const response = await axios.get(`${API_URL}/images/viewport`, {
+          params: {
+            ...bounds,
+            limit: VIEWPORT_PAGE_SIZE,
+            cursor: pageCursor ?? undefined,
+          },
+        });
+        // The first page's cursor is the oldest, so catching up from it misses nothing written while paging
+        changesCursor = changesCursor ?? response.data.changes_cursor;
+        if (response.data.use_clusters) {
+          useClusters = true;
+          break;
+        }
+        for (const image of response.data.images as ImageLocation[]) {
+          loaded[image.id] = image;
+        }
+        pageCursor = response.data.next_cursor;
+        if (!pageCursor) {
+          break;
+        }
+      }
+
+      let viewClusters: Cluster[] = [];
+      if (useClusters || pageCursor) {
+        const response = await axios.get(`${API_URL}/clusters`, {
+          params: { ...bounds, zoom: regionZoom(view) },
+        });
+        if (!response.data.use_markers) {
+          viewClusters = response.data.clusters;
+        }
+      }
+      if (requestId !== viewportRequestRef.current) {
+        return;
+      }
+      showingClustersRef.current = viewClusters.length > 0;
+      setClusters(viewClusters);
+      setPinsById(viewClusters.length > 0 ? {} : loaded);
+      changesCursorRef.current = changesCursor;
+      setLoadError(null);
+    } catch (error) {
+      console.error("Error fetching map data:", error);
+      if (requestId === viewportRequestRef.current) {
+        setLoadError("Failed to load map data. Please try again later.");
+      }
+    }
+  }, []);
+
+  // Adds new or re-assessed points inside the visible region, dropping their cached assessments so the next tap refetches
+  const applyChanges = useCallback((points: ChangedPoint[]) => {
+    if (showingClustersRef.current) {
       return;
     }
+    const visible = points.filter(
+      (point) =>
+        point.latitude != null &&
+        point.longitude != null &&
+        isInRegion(point, regionRef.current)
+    );
+    if (visible.length === 0) {
+      return;
+    }
+    const ids = new Set(visible.map((point) => point.id));
+    setPinsById((prev) => {
+      const next = { ...prev };
+      for (const point of visible) {
+        next[point.id] = {
+          id: point.id,
+          image_url: point.image_url,
+          latitude: point.latitude,
+          longitude: point.longitude,
+          location_name: point.location_name,
+        };
+      }
+      return next;
+    });
+    setSafetyAssessments((prev) => withoutIds(prev, ids));
+    setErrorStates((prev) => withoutIds(prev, ids));
+  }, []);
 
+  // Fetches what changed since the markers were loaded; a reset cursor (e.g. another server process) reloads the view
+  const catchUp = useCallback(async () => {
+    const requestId = viewportRequestRef.current;
+    let since = changesCursorRef.current;
+    if (!since) {
+      return;
+    }
     try {
-      // Set loading state for this specific location
-      setLoadingStates((prev) => ({ ...prev, [imageId]: true }));
+      while (true) {
+        const response = await axios.get(`${API_URL}/images/changes`, {
+          params: { since, limit: CHANGES_PAGE_SIZE },
+        });
+        if (requestId !== viewportRequestRef.current) {
+          return;
+        }
+        if (response.data.reset) {
+          await loadViewport(regionRef.current);
+          return;
+        }
+        applyChanges(response.data.points);
+        since = response.data.cursor;
+        changesCursorRef.current = since;
+        if (!response.data.has_more) {
+          return;
+        }
+      }
+    } catch (error) {
+      console.error("Error fetching map changes:", error);
+    }
+  }, [loadViewport, applyChanges]);
+
+  // Reload the markers once the map stops moving
+  useEffect(() => {
+    const timer = setTimeout(() => loadViewport(visibleRegion), PREFETCH_DELAY_MS);
+    return () => clearTimeout(timer);
+  }, [visibleRegion, loadViewport]);
+
+  // New assessments in view arrive over the live socket; after a gap in the stream, catch up through /images/changes
+  const socketRef = useRef<WebSocket | null>(null);
+  useEffect(() => {
+    let closed = false;
+    let reconnectTimer: ReturnType<typeof setTimeout> | undefined;
 
-      const response = await axios.get(
-        `${API_URL}/safety_assessments/${imageId}`
+    const connect = (isReconnect: boolean) => {
+      const socket = new WebSocket(
+        `${API_URL?.replace(/^http/, "ws")}/live/assessments/ws`
       );
+      socketRef.current = socket;
+      socket.onopen = () => {
+        socket.send(JSON.stringify(regionBounds(regionRef.current)));
+        if (isReconnect) {
+          catchUp();
+        }
+      };
+      socket.onmessage = (message) => {
+        try {
+          const { event, data } = JSON.parse(message.data);
+          if (event === "assessment") {
+            applyChanges([{ ...data, id: data.image_id }]);
+          } else if (event === "lagged") {
+            catchUp();
+          }
+        } catch (error) {
+          console.error("Malformed live map message:", error);
+        }
+      };
+      socket.onclose = () => {
+        if (!closed) {
+          reconnectTimer = setTimeout(() => connect(true), LIVE_RECONNECT_MS);
+        }
+      };
+    };
 
-      if (
-        response.data &&
-        response.data.safety_assessments &&
-        response.data.safety_assessments.length > 0
-      ) {
-        setSafetyAssessments((prev) => ({
-          ...prev,
-          [imageId]: response.data.safety_assessments[0],
-        }));
-      } else {
-        setSafetyAssessments((prev) => ({ ...prev, [imageId]: null }));
-        setErrorStates((prev) => ({
-          ...prev,
-          [imageId]: "No safety assessment available",
-        }));
+    connect(false);
+    return () => {
+      closed = true;
+      clearTimeout(reconnectTimer);
+      socketRef.current?.close();
+      socketRef.current = null;
+    };
+  }, [applyChanges, catchUp]);
+
+  // Tell the server which region to push assessments for
+  useEffect(() => {
+    const socket = socketRef.current;
+    if (socket && socket.readyState === WebSocket.OPEN) {
+      socket.send(JSON.stringify(regionBounds(visibleRegion)));
+    }
+  }, [visibleRegion]);
+
+  // Loads the latest assessment for many images per request instead of one request per marker
+  const fetchSafetyAssessments = useCallback(async (imageIds: string[]) => {
+    if (imageIds.length === 0) {
+      return;
+    }
+    const loading = Object.fromEntries(imageIds.map((id) => [id, true]));
+    setLoadingStates((prev) => ({ ...prev, ...loading }));
+    setErrorStates((prev) => ({
+      ...prev,
+      ...Object.fromEntries(imageIds.map((id) => [id, null])),
+    }));
+
+    for (let start = 0; start < imageIds.length; start += ASSESSMENT_BATCH_SIZE) {
+      const chunk = imageIds.slice(start, start + ASSESSMENT_BATCH_SIZE);
+      const assessments: Record<string, SafetyAssessment | null> = {};
+      const errors: Record<string, string | null> = {};
+      try {
+        const response = await axios.post(`${API_URL}/images/batch`, {
+          image_ids: chunk,
+        });
+        const images: (ImageLocation & {
+          safety_assessment: SafetyAssessment | null;
+        })[] = response.data?.images ?? [];
+        const found = new Map(images.map((image) => [image.id, image]));
+        for (const id of chunk) {
+          const assessment = found.get(id)?.safety_assessment ?? null;
+          assessments[id] = assessment;
+          errors[id] = assessment ? null : "No safety assessment available";
+        }
+      } catch (error) {
+        // Leave the assessments undefined so tapping the marker tries again
+        console.error("Error fetching safety assessments:", error);
+        for (const id of chunk) {
+          errors[id] = "Failed to load safety data";
+        }
       }
-    } catch (error) {
-      console.error("Error fetching safety assessment:", error);
-      setErrorStates((prev) => ({
+      setSafetyAssessments((prev) => ({ ...prev, ...assessments }));
+      setErrorStates((prev) => ({ ...prev, ...errors }));
+      setLoadingStates((prev) => ({
         ...prev,
-        [imageId]: "Failed to load safety data",
+        ...Object.fromEntries(chunk.map((id) => [id, false])),
       }));
-      setSafetyAssessments((prev) => ({ ...prev, [imageId]: null }));
-    } finally {
-      setLoadingStates((prev) => ({ ...prev, [imageId]: false }));
     }
+  }, []);
+
+  // Prefetch assessments for the markers in view, in one request, once the map stops moving
+  useEffect(() => {
+    const timer = setTimeout(() => {
+      const visibleIds = locationPins
+        .filter(
+          (location) =>
+            isInRegion(location, visibleRegion) &&
+            assessmentsRef.current[location.id] === undefined &&
+            !loadingRef.current[location.id]
+        )
+        .slice(0, ASSESSMENT_BATCH_SIZE)
+        .map((location) => location.id);
+      fetchSafetyAssessments(visibleIds);
+    }, PREFETCH_DELAY_MS);
+    return () => clearTimeout(timer);
+  }, [locationPins, visibleRegion, fetchSafetyAssessments]);
+
+  const fetchSafetyAssessment = async (imageId: string) => {
+    // Skip if we already have data or are currently loading
+    if (safetyAssessments[imageId] !== undefined || loadingStates[imageId]) {
+      return;
+    }
+    await fetchSafetyAssessments([imageId]);
   };
 
   const handleMarkerPress = (location: ImageLocation) => {
@@ -145,31 +403,51 @@ const MapViewComponent = ({
   const refreshData = useCallback(async () => {
     setIsRefreshing(true);
     try {
-      // Fetch fresh location pins data
-      const response = await axios.get(`${API_URL}/images`);
-      if (response.data && response.data.images) {
-        // Filter out any locations without valid coordinates
-        const validLocations = response.data.images.filter(
-          (image: ImageLocation) =>
-            image.latitude != null && image.longitude != null
-        );
-        setLocationPins(validLocations);
-
-        // Clear cached safety assessment data to force fresh fetches
-        setSafetyAssessments({});
-        setErrorStates({});
-        setLoadingStates({});
-      }
-    } catch (error) {
-      console.error("Error refreshing data:", error);
+      // Clear cached safety assessment data to force fresh fetches
+      setSafetyAssessments({});
+      setErrorStates({});
+      setLoadingStates({});
+      await loadViewport(regionRef.current);
     } finally {
       setIsRefreshing(false);
     }
-  }, []);
+  }, [loadViewport]);
 
   return (
     <View style={styles.container}>
-      <MapView style={styles.map} region={region}>
+      <MapView
+        style={styles.map}
+        region={region}
+        onRegionChangeComplete={setVisibleRegion}
+      >
+        {clusters.map((cluster) => (
+          <Marker
+            key={`cluster-${cluster.latitude}-${cluster.longitude}`}
+            coordinate={{
+              latitude: cluster.latitude,
+              longitude: cluster.longitude,
+            }}
+            title={`${cluster.count} photos`}
+            description={
+              cluster.mean_safety_score != null
+                ? `Average safety score ${cluster.mean_safety_score}/100`
+                : "Zoom in to see the photos"
+            }
+          >
+            <View
+              style={[
+                styles.clusterMarker,
+                {
+                  backgroundColor: getSafetyScoreColor(
+                    cluster.mean_safety_score ?? 0
+                  ),
+                },
+              ]}
+            >
+              <Text style={styles.clusterCount}>{cluster.count}</Text>
+            </View>
+          </Marker>
+        ))}
         {locationPins.map((location) => (
           <Marker
             key={location.id}
@@ -249,6 +527,12 @@ const MapViewComponent = ({
         ))}
       </MapView>
 
+      {loadError && (
+        <View style={styles.loadErrorBanner}>
+          <Text style={styles.errorText}>{loadError}</Text>
+        </View>
+      )}
+
       {/* Refresh Button */}
       <View style={styles.refreshButtonContainer}>
         <TouchableOpacity
@@ -349,6 +633,30 @@ const styles = StyleSheet.create({
     fontSize: 12,
     marginVertical: 8,
   },
+  clusterMarker: {
+    minWidth: 36,
+    height: 36,
+    borderRadius: 18,
+    paddingHorizontal: 6,
+    justifyContent: "center",
+    alignItems: "center",
+    borderWidth: 2,
+    borderColor: "#fff",
+  },
+  clusterCount: {
+    color: "#fff",
+    fontWeight: "bold",
+    fontSize: 13,
+  },
+  loadErrorBanner: {
+    position: "absolute",
+    top: 20,
+    left: 20,
+    right: 20,
+    backgroundColor: "white",
+    borderRadius: 8,
+    padding: 8,
+  },
   refreshButtonContainer: {
     position: "absolute",
     bottom: 20,